@@ -199,8 +199,10 @@ class SimpleApplet:
 
     def subscribe(self):
         if self.embed is None:
-            self.subscriber = Subscriber("datasets",
-                                         self.sub_init, self.sub_mod)
+            # Only receive the datasets that the applet uses.
+            self.subscriber = Subscriber(
+                "datasets", self.sub_init, self.sub_mod,
+                prefixes=[[dataset] for dataset in self.datasets])
             self.loop.run_until_complete(self.subscriber.connect(
                 self.args.server, self.args.port))
         else:
@@ -0,0 +1,519 @@
+"""
+The :class:`Symbolizer` class resolves code addresses of a kernel library
+to source locations using its DWARF debugging information, without running
+``addr2line``.
+
+DWARF versions 2 to 4 are supported. The line number programs and the tree
+of (inlined) subroutines are only decoded when the first address is
+resolved, and the results are cached per address.
+"""
+
+import os
+import bisect
+import struct
+
+from artiq.compiler.elf import ELFFile
+
+
+__all__ = ["Symbolizer"]
+
+
+DW_TAG_compile_unit = 0x11
+DW_TAG_inlined_subroutine = 0x1d
+DW_TAG_subprogram = 0x2e
+
+DW_AT_stmt_list = 0x10
+DW_AT_low_pc = 0x11
+DW_AT_high_pc = 0x12
+DW_AT_name = 0x03
+DW_AT_comp_dir = 0x1b
+DW_AT_abstract_origin = 0x31
+DW_AT_specification = 0x47
+DW_AT_ranges = 0x55
+DW_AT_call_file = 0x58
+DW_AT_call_line = 0x59
+DW_AT_linkage_name = 0x6e
+DW_AT_MIPS_linkage_name = 0x2007
+
+DW_FORM_addr = 0x01
+DW_FORM_string = 0x08
+DW_FORM_strp = 0x0e
+DW_FORM_ref_addr = 0x10
+DW_FORM_ref1 = 0x11
+DW_FORM_ref2 = 0x12
+DW_FORM_ref4 = 0x13
+DW_FORM_ref8 = 0x14
+DW_FORM_ref_udata = 0x15
+DW_FORM_indirect = 0x16
+DW_FORM_implicit_const = 0x21
+
+
+class _Reader:
+    def __init__(self, data, endianness, offset=0):
+        self.data = data
+        self.offset = offset
+        self.structs = {size: struct.Struct(endianness + code)
+                        for size, code in [(1, "B"), (2, "H"), (4, "I"),
+                                           (8, "Q")]}
+
+    def unsigned(self, size):
+        value, = self.structs[size].unpack_from(self.data, self.offset)
+        self.offset += size
+        return value
+
+    def signed8(self):
+        value = self.unsigned(1)
+        return value - 0x100 if value & 0x80 else value
+
+    def uleb128(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    def sleb128(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                if byte & 0x40:
+                    value -= 1 << shift
+                return value
+
+    def cstring(self):
+        end = self.data.index(b"\0", self.offset)
+        value = self.data[self.offset:end].decode(errors="replace")
+        self.offset = end + 1
+        return value
+
+    def unit_length(self):
+        """Reads an initial length field, and returns the length and
+        the size of the offsets in the unit."""
+        length = self.unsigned(4)
+        if length == 0xffffffff:
+            return self.unsigned(8), 8
+        elif length >= 0xfffffff0:
+            raise ValueError("reserved DWARF unit length")
+        return length, 4
+
+
+def _join_path(directory, filename):
+    if not directory or os.path.isabs(filename):
+        return filename
+    return directory.rstrip("/") + "/" + filename
+
+
+class _LineProgram:
+    def __init__(self, reader, comp_dir):
+        unit_length, offset_size = reader.unit_length()
+        end = reader.offset + unit_length
+        version = reader.unsigned(2)
+        if not 2 <= version <= 4:
+            raise ValueError("unsupported DWARF line table version {}"
+                             .format(version))
+        header_length = reader.unsigned(offset_size)
+        program_start = reader.offset + header_length
+        self.min_inst_length = reader.unsigned(1)
+        if version >= 4:
+            reader.unsigned(1)  # maximum_operations_per_instruction
+        self.default_is_stmt = reader.unsigned(1)
+        self.line_base = reader.signed8()
+        self.line_range = reader.unsigned(1)
+        self.opcode_base = reader.unsigned(1)
+        self.standard_opcode_lengths = [reader.unsigned(1)
+                                        for _ in range(self.opcode_base - 1)]
+
+        self.directories = [comp_dir]
+        while True:
+            directory = reader.cstring()
+            if not directory:
+                break
+            self.directories.append(_join_path(comp_dir, directory))
+        self.files = [None]
+        while True:
+            filename = reader.cstring()
+            if not filename:
+                break
+            self._add_file(reader, filename)
+
+        reader.offset = program_start
+        self.reader = reader
+        self.end = end
+
+    def _add_file(self, reader, filename):
+        directory = reader.uleb128()
+        reader.uleb128()  # modification time
+        reader.uleb128()  # length
+        if directory < len(self.directories):
+            filename = _join_path(self.directories[directory], filename)
+        self.files.append(filename)
+
+    def filename(self, index):
+        if 0 < index < len(self.files):
+            return self.files[index]
+        return "??"
+
+    def rows(self):
+        """Iterates over the rows of the line number matrix, as
+        ``(address, file, line, end_sequence)`` tuples."""
+        reader = self.reader
+        address, file, line = 0, 1, 1
+        while reader.offset < self.end:
+            opcode = reader.unsigned(1)
+            if opcode >= self.opcode_base:
+                adjusted = opcode - self.opcode_base
+                address += (adjusted // self.line_range)*self.min_inst_length
+                line += self.line_base + adjusted % self.line_range
+                yield address, file, line, False
+            elif opcode == 0:
+                length = reader.uleb128()
+                next_offset = reader.offset + length
+                extended_opcode = reader.unsigned(1)
+                if extended_opcode == 1:  # DW_LNE_end_sequence
+                    yield address, file, line, True
+                    address, file, line = 0, 1, 1
+                elif extended_opcode == 2:  # DW_LNE_set_address
+                    address = reader.unsigned(length - 1)
+                elif extended_opcode == 3:  # DW_LNE_define_file
+                    self._add_file(reader, reader.cstring())
+                reader.offset = next_offset
+            elif opcode == 1:  # DW_LNS_copy
+                yield address, file, line, False
+            elif opcode == 2:  # DW_LNS_advance_pc
+                address += reader.uleb128()*self.min_inst_length
+            elif opcode == 3:  # DW_LNS_advance_line
+                line += reader.sleb128()
+            elif opcode == 4:  # DW_LNS_set_file
+                file = reader.uleb128()
+            elif opcode == 8:  # DW_LNS_const_add_pc
+                adjusted = 255 - self.opcode_base
+                address += (adjusted // self.line_range)*self.min_inst_length
+            elif opcode == 9:  # DW_LNS_fixed_advance_pc
+                address += reader.unsigned(2)
+            else:
+                for _ in range(self.standard_opcode_lengths[opcode - 1]):
+                    reader.uleb128()
+
+
+class _Scope:
+    def __init__(self, tag, offset, parent):
+        self.tag = tag
+        self.offset = offset
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.ranges = []
+        self.name = None
+        self.origin = None
+        self.call_file = None
+        self.call_line = 0
+
+
+class Symbolizer:
+    """Resolves return addresses within a kernel library to backtrace
+    entries, like ``addr2line --functions --inlines``.
+
+    :param library: unstripped library, as ``bytes``.
+    """
+    def __init__(self, library):
+        self.library = library
+        self._error = None
+        self._line_starts = None
+        self._cache = dict()
+
+    def _load(self):
+        elf = ELFFile(self.library)
+        self.endianness = elf.fmt.endianness
+        self.sections = dict()
+        for name in [b".debug_info", b".debug_abbrev", b".debug_line",
+                     b".debug_str", b".debug_ranges"]:
+            section = elf.section_by_name(name)
+            if section is not None:
+                self.sections[name] = elf.section_data(section)
+
+        # address -> (end address, filename, line)
+        self._line_starts = []
+        self._lines = []
+        # function symbols, as a fallback for code without debug info
+        self._functions = elf.functions()
+        self._function_starts = [f[0] for f in self._functions]
+        # DIE offset -> scope, and scopes covering code
+        self._scopes_by_offset = dict()
+        self._scopes = []
+
+        if b".debug_info" in self.sections:
+            self._load_units()
+
+        lines = sorted(zip(self._line_starts, self._lines))
+        self._line_starts = [start for start, _ in lines]
+        self._lines = [line for _, line in lines]
+
+    def _load_units(self):
+        info = self.sections[b".debug_info"]
+        reader = _Reader(info, self.endianness)
+        while reader.offset < len(info):
+            unit_offset = reader.offset
+            unit_length, offset_size = reader.unit_length()
+            end = reader.offset + unit_length
+            version = reader.unsigned(2)
+            if not 2 <= version <= 4:
+                raise ValueError("unsupported DWARF version {}"
+                                 .format(version))
+            abbrev_offset = reader.unsigned(offset_size)
+            address_size = reader.unsigned(1)
+            self._load_unit(reader, end, unit_offset, version, offset_size,
+                            address_size, self._load_abbrevs(abbrev_offset))
+            reader.offset = end
+
+    def _load_abbrevs(self, offset):
+        reader = _Reader(self.sections[b".debug_abbrev"], self.endianness,
+                         offset)
+        abbrevs = dict()
+        while True:
+            code = reader.uleb128()
+            if code == 0:
+                return abbrevs
+            tag = reader.uleb128()
+            has_children = reader.unsigned(1)
+            attributes = []
+            while True:
+                attribute, form = reader.uleb128(), reader.uleb128()
+                if attribute == 0 and form == 0:
+                    break
+                implicit_const = None
+                if form == DW_FORM_implicit_const:
+                    implicit_const = reader.sleb128()
+                attributes.append((attribute, form, implicit_const))
+            abbrevs[code] = (tag, has_children, attributes)
+
+    def _read_form(self, reader, form, unit_offset, version, offset_size,
+                   address_size):
+        if form == DW_FORM_addr:
+            return reader.unsigned(address_size)
+        elif form in (0x0b, 0x11, 0x0c):  # data1, ref1, flag
+            value = reader.unsigned(1)
+        elif form in (0x05, 0x12):  # data2, ref2
+            value = reader.unsigned(2)
+        elif form in (0x06, 0x13):  # data4, ref4
+            value = reader.unsigned(4)
+        elif form in (0x07, 0x14, 0x20):  # data8, ref8, ref_sig8
+            value = reader.unsigned(8)
+        elif form in (0x0f, 0x15):  # udata, ref_udata
+            value = reader.uleb128()
+        elif form == 0x0d:  # sdata
+            value = reader.sleb128()
+        elif form == DW_FORM_string:
+            return reader.cstring()
+        elif form == DW_FORM_strp:
+            offset = reader.unsigned(offset_size)
+            return _Reader(self.sections[b".debug_str"],
+                           self.endianness, offset).cstring()
+        elif form in (0x17, 0x1f20, 0x1f21):
+            # sec_offset, GNU_ref_alt, GNU_strp_alt
+            return reader.unsigned(offset_size)
+        elif form == DW_FORM_ref_addr:
+            return reader.unsigned(address_size if version == 2
+                                   else offset_size)
+        elif form in (0x09, 0x18):  # block, exprloc
+            length = reader.uleb128()
+            reader.offset += length
+            return None
+        elif form == 0x0a:  # block1
+            length = reader.unsigned(1)
+            reader.offset += length
+            return None
+        elif form == 0x03:  # block2
+            length = reader.unsigned(2)
+            reader.offset += length
+            return None
+        elif form == 0x04:  # block4
+            length = reader.unsigned(4)
+            reader.offset += length
+            return None
+        elif form == 0x19:  # flag_present
+            return True
+        elif form == DW_FORM_indirect:
+            return self._read_form(reader, reader.uleb128(), unit_offset,
+                                   version, offset_size, address_size)
+        else:
+            raise ValueError("unsupported DWARF form 0x{:x}".format(form))
+        if form in (DW_FORM_ref1, DW_FORM_ref2, DW_FORM_ref4, DW_FORM_ref8,
+                    DW_FORM_ref_udata):
+            value += unit_offset
+        return value
+
+    def _read_ranges(self, offset, base, address_size):
+        reader = _Reader(self.sections[b".debug_ranges"], self.endianness,
+                         offset)
+        max_address = (1 << (8*address_size)) - 1
+        ranges = []
+        while True:
+            begin = reader.unsigned(address_size)
+            end = reader.unsigned(address_size)
+            if begin == 0 and end == 0:
+                return ranges
+            if begin == max_address:
+                base = end
+            elif begin != end:
+                ranges.append((base + begin, base + end))
+
+    def _load_unit(self, reader, end, unit_offset, version, offset_size,
+                   address_size, abbrevs):
+        line_program = None
+        unit_base = 0
+        parents = []
+        while reader.offset < end:
+            die_offset = reader.offset
+            code = reader.uleb128()
+            if code == 0:
+                if parents:
+                    parents.pop()
+                continue
+            tag, has_children, attribute_specs = abbrevs[code]
+
+            attributes = dict()
+            for attribute, form, implicit_const in attribute_specs:
+                if form == DW_FORM_implicit_const:
+                    value = implicit_const
+                else:
+                    value = self._read_form(reader, form, unit_offset,
+                                            version, offset_size,
+                                            address_size)
+                attributes[attribute] = (form, value)
+
+            parent = parents[-1] if parents else None
+            scope = None
+            if tag == DW_TAG_compile_unit:
+                unit_base = attributes.get(DW_AT_low_pc, (None, 0))[1]
+                if DW_AT_stmt_list in attributes:
+                    comp_dir = attributes.get(DW_AT_comp_dir, (None, ""))[1]
+                    line_program = _LineProgram(
+                        _Reader(self.sections[b".debug_line"],
+                                self.endianness,
+                                attributes[DW_AT_stmt_list][1]),
+                        comp_dir)
+                    self._load_lines(line_program)
+            elif tag in (DW_TAG_subprogram, DW_TAG_inlined_subroutine):
+                scope = _Scope(tag, die_offset, parent)
+                self._scopes_by_offset[die_offset] = scope
+                for name_attribute in (DW_AT_linkage_name,
+                                       DW_AT_MIPS_linkage_name, DW_AT_name):
+                    if name_attribute in attributes:
+                        scope.name = attributes[name_attribute][1]
+                        break
+                for origin_attribute in (DW_AT_abstract_origin,
+                                         DW_AT_specification):
+                    if origin_attribute in attributes:
+                        scope.origin = attributes[origin_attribute][1]
+                        break
+                if DW_AT_call_file in attributes and line_program is not None:
+                    scope.call_file = line_program.filename(
+                        attributes[DW_AT_call_file][1])
+                    scope.call_line = attributes.get(DW_AT_call_line,
+                                                     (None, 0))[1]
+
+                if DW_AT_low_pc in attributes and DW_AT_high_pc in attributes:
+                    low_pc = attributes[DW_AT_low_pc][1]
+                    high_form, high_pc = attributes[DW_AT_high_pc]
+                    if high_form != DW_FORM_addr:
+                        high_pc += low_pc
+                    scope.ranges.append((low_pc, high_pc))
+                elif DW_AT_ranges in attributes:
+                    scope.ranges = self._read_ranges(
+                        attributes[DW_AT_ranges][1], unit_base, address_size)
+                if scope.ranges:
+                    self._scopes.append(scope)
+
+            if has_children:
+                # Scopes are only nested within subroutines; keep the
+                # innermost enclosing subroutine as the parent.
+                parents.append(scope if scope is not None else parent)
+
+    def _load_lines(self, line_program):
+        previous = None
+        for address, file, line, end_sequence in line_program.rows():
+            if previous is not None and address > previous[0]:
+                self._line_starts.append(previous[0])
+                self._lines.append((address,
+                                    line_program.filename(previous[1]),
+                                    previous[2]))
+            previous = None if end_sequence else (address, file, line)
+
+    def _scope_name(self, scope):
+        seen = set()
+        while scope is not None and scope.offset not in seen:
+            if scope.name is not None:
+                return scope.name
+            seen.add(scope.offset)
+            scope = self._scopes_by_offset.get(scope.origin)
+        return "??"
+
+    def _lookup_line(self, address):
+        i = bisect.bisect_right(self._line_starts, address) - 1
+        if i >= 0:
+            end, filename, line = self._lines[i]
+            if address < end:
+                return filename, line
+        return "??", 0
+
+    def _lookup_function(self, address):
+        # Like addr2line, use the closest preceding symbol, as the
+        # addresses may be in padding after the end of the function.
+        i = bisect.bisect_right(self._function_starts, address) - 1
+        if i >= 0:
+            return self._functions[i][2]
+        return "??"
+
+    def _resolve(self, address):
+        scopes = [scope for scope in self._scopes
+                  if any(low <= address < high for low, high in scope.ranges)]
+        scopes.sort(key=lambda scope: scope.depth)
+
+        filename, line = self._lookup_line(address)
+        if not scopes:
+            return [(filename, line, self._lookup_function(address))]
+        frames = []
+        for scope in reversed(scopes):
+            frames.append((filename, line, self._scope_name(scope)))
+            if scope.tag != DW_TAG_inlined_subroutine:
+                break
+            filename, line = scope.call_file or "??", scope.call_line
+        return frames
+
+    def symbolize(self, addresses):
+        """Returns the backtrace entries for a list of return addresses, in
+        the format of :meth:`artiq.compiler.targets.Target.symbolize`.
+
+        :raises ValueError: if the debugging information of the library
+            cannot be decoded.
+        """
+        if self._error is not None:
+            raise self._error
+        if self._line_starts is None:
+            try:
+                self._load()
+            except (ValueError, IndexError, KeyError, struct.error) as e:
+                self._error = ValueError("cannot decode debugging "
+                                         "information: {}".format(e))
+                raise self._error
+
+        backtrace = []
+        for address in addresses:
+            if address not in self._cache:
+                # We got a return address, i.e. the address of the
+                # instruction just after the call. Offset it back to get an
+                # address inside the call instruction (or its delay slot).
+                self._cache[address] = self._resolve(address - 1)
+            for filename, line, function in self._cache[address]:
+                if filename == "??" or filename == "<synthesized>":
+                    continue
+                backtrace.append((filename, line, -1, function, address))
+        return backtrace
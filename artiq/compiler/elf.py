@@ -0,0 +1,254 @@
+"""
+In-process access to ELF files produced by the linker.
+
+:class:`ELFFile` gives access to the sections and symbols of a file, and
+:func:`strip_debug` removes the debugging information from a shared library
+without running an external ``strip`` process.
+"""
+
+import struct
+from collections import namedtuple
+
+
+__all__ = ["ELFFile", "strip_debug"]
+
+
+SHT_NULL = 0
+SHT_SYMTAB = 2
+SHT_RELA = 4
+SHT_NOBITS = 8
+SHT_REL = 9
+SHT_SYMTAB_SHNDX = 18
+
+SHF_ALLOC = 0x2
+
+STT_FUNC = 2
+
+SHN_LORESERVE = 0xff00
+
+STB_LOCAL = 0
+
+
+_SectionHeader = namedtuple("_SectionHeader",
+    "name type flags addr offset size link info addralign entsize")
+
+
+class _Format:
+    def __init__(self, elfclass, endianness):
+        if endianness not in (1, 2):
+            raise ValueError("unsupported ELF data encoding")
+        e = {1: "<", 2: ">"}[endianness]
+        self.endianness = e
+        self.elfclass = elfclass
+        if elfclass == 1:
+            self.ehdr_tail = struct.Struct(e + "HHIIIIIHHHHHH")
+            self.phdr_extent = struct.Struct(e + "4xI8xI")
+            self.shdr = struct.Struct(e + "IIIIIIIIII")
+            self.sym = struct.Struct(e + "IIIBBH")
+            self.sym_fields = ("name", "value", "size", "info", "other",
+                               "shndx")
+        elif elfclass == 2:
+            self.ehdr_tail = struct.Struct(e + "HHIQQQIHHHHHH")
+            self.phdr_extent = struct.Struct(e + "8xQ16xQ")
+            self.shdr = struct.Struct(e + "IIQQQQIIQQ")
+            self.sym = struct.Struct(e + "IBBHQQ")
+            self.sym_fields = ("name", "info", "other", "shndx", "value",
+                               "size")
+        else:
+            raise ValueError("unsupported ELF class")
+
+
+def _is_debug_section(name):
+    return name.startswith((b".debug", b".zdebug", b".gnu.debuglto_"))
+
+
+def _align(offset, alignment):
+    if alignment > 1:
+        offset += -offset % alignment
+    return offset
+
+
+class ELFFile:
+    """Parses the headers of an ELF file.
+
+    :param data: contents of the file, as ``bytes``.
+    :raises ValueError: if the file is not an ELF file, or uses features
+        that this class does not handle.
+    """
+    def __init__(self, data):
+        if data[:4] != b"\x7fELF":
+            raise ValueError("not an ELF file")
+        self.data = data
+        self.fmt = _Format(data[4], data[5])
+        (self.e_type, self.e_machine, self.e_version, self.e_entry,
+         self.e_phoff, self.e_shoff, self.e_flags, self.e_ehsize,
+         self.e_phentsize, self.e_phnum, self.e_shentsize, self.e_shnum,
+         self.e_shstrndx) = self.fmt.ehdr_tail.unpack_from(data, 16)
+        if (self.e_shoff == 0 or self.e_shnum == 0
+                or self.e_shstrndx >= SHN_LORESERVE):
+            raise ValueError("unsupported section header table")
+        if self.e_shentsize != self.fmt.shdr.size:
+            raise ValueError("unsupported section header size")
+
+        self.sections = [_SectionHeader(*self.fmt.shdr.unpack_from(
+                             data, self.e_shoff + i*self.e_shentsize))
+                         for i in range(self.e_shnum)]
+        shstrtab = self.sections[self.e_shstrndx]
+        self.section_names = [self.string(shstrtab, section.name)
+                              for section in self.sections]
+
+    def string(self, section, offset):
+        """Returns the null-terminated string at ``offset`` in the string
+        table ``section``, as ``bytes``."""
+        start = section.offset + offset
+        return self.data[start:self.data.index(b"\0", start)]
+
+    def section_by_name(self, name):
+        """Returns the header of the section called ``name`` (as ``bytes``),
+        or ``None``."""
+        for section_name, section in zip(self.section_names, self.sections):
+            if section_name == name:
+                return section
+        return None
+
+    def section_data(self, section):
+        """Returns the contents of the section as ``bytes``."""
+        if section.type == SHT_NOBITS:
+            return b""
+        return self.data[section.offset:section.offset + section.size]
+
+    def symbols(self, section):
+        """Iterates over the symbols of the symbol table ``section``, as
+        dictionaries with the ``name``, ``value``, ``size``, ``info``,
+        ``other`` and ``shndx`` keys. The name is the offset in the
+        associated string table."""
+        if section.entsize != self.fmt.sym.size:
+            raise ValueError("unsupported symbol size")
+        for offset in range(section.offset, section.offset + section.size,
+                            self.fmt.sym.size):
+            yield dict(zip(self.fmt.sym_fields,
+                           self.fmt.sym.unpack_from(self.data, offset)))
+
+    def functions(self):
+        """Returns the function symbols of the static symbol table as
+        a list of ``(address, size, name)`` tuples, sorted by address."""
+        section = self.section_by_name(b".symtab")
+        if section is None:
+            return []
+        strtab = self.sections[section.link]
+        return sorted((sym["value"], sym["size"],
+                       self.string(strtab, sym["name"]).decode(
+                           errors="replace"))
+                      for sym in self.symbols(section)
+                      if sym["info"] & 0xf == STT_FUNC and sym["shndx"])
+
+
+def strip_debug(library):
+    """Returns a copy of the ELF file ``library`` (as ``bytes``) without
+    its debugging sections, like ``strip --strip-debug``.
+
+    The loadable contents are kept at their original offsets; only the
+    non-allocated sections that follow them are rewritten.
+
+    :raises ValueError: if the file is not an ELF file, or uses features
+        that this function does not handle. The caller should then fall
+        back to the external ``strip`` tool.
+    """
+    elf = ELFFile(library)
+    fmt = elf.fmt
+    sections = elf.sections
+
+    removed = set()
+    for i, section in enumerate(sections):
+        if section.type == SHT_SYMTAB_SHNDX:
+            raise ValueError("extended section indices are not supported")
+        if (not section.flags & SHF_ALLOC
+                and _is_debug_section(elf.section_names[i])):
+            removed.add(i)
+    for i, section in enumerate(sections):
+        if (section.type in (SHT_REL, SHT_RELA)
+                and not section.flags & SHF_ALLOC
+                and section.info in removed):
+            removed.add(i)
+    if not removed:
+        return library
+
+    index_map = dict()
+    for i in range(len(sections)):
+        if i not in removed:
+            index_map[i] = len(index_map)
+
+    # Filter the static symbol table: drop the symbols that refer to
+    # removed sections and renumber the others.
+    new_contents = dict()
+    for i, section in enumerate(sections):
+        if i in removed or section.type != SHT_SYMTAB:
+            continue
+        for j, other in enumerate(sections):
+            if (j not in removed and other.type in (SHT_REL, SHT_RELA)
+                    and other.link == i):
+                raise ValueError("relocations against the static symbol "
+                                 "table are not supported")
+        local_symbols = []
+        global_symbols = []
+        for sym in elf.symbols(section):
+            if sym["shndx"] in removed:
+                continue
+            if 0 < sym["shndx"] < SHN_LORESERVE:
+                sym["shndx"] = index_map[sym["shndx"]]
+            packed = fmt.sym.pack(*(sym[f] for f in fmt.sym_fields))
+            if sym["info"] >> 4 == STB_LOCAL:
+                local_symbols.append(packed)
+            else:
+                global_symbols.append(packed)
+        new_contents[i] = (b"".join(local_symbols + global_symbols),
+                           len(local_symbols))
+
+    # Everything up to the end of the loadable contents and of the headers
+    # is kept in place.
+    base = elf.e_ehsize
+    if elf.e_phnum:
+        base = max(base, elf.e_phoff + elf.e_phnum*elf.e_phentsize)
+        for i in range(elf.e_phnum):
+            p_offset, p_filesz = fmt.phdr_extent.unpack_from(
+                library, elf.e_phoff + i*elf.e_phentsize)
+            base = max(base, p_offset + p_filesz)
+    for i, section in enumerate(sections):
+        if (i not in removed and section.flags & SHF_ALLOC
+                and section.type != SHT_NOBITS):
+            base = max(base, section.offset + section.size)
+
+    out = bytearray(library[:base])
+    new_sections = []
+    for i, section in enumerate(sections):
+        if i in removed:
+            continue
+        section = section._replace(link=index_map.get(section.link, 0))
+        if section.type in (SHT_REL, SHT_RELA) and section.info:
+            section = section._replace(info=index_map[section.info])
+        if i in new_contents:
+            contents, local_count = new_contents[i]
+            section = section._replace(size=len(contents), info=local_count)
+        elif (section.type not in (SHT_NULL, SHT_NOBITS)
+                and section.offset + section.size > base):
+            contents = library[section.offset:
+                               section.offset + section.size]
+        else:
+            contents = None
+        if contents is not None:
+            offset = _align(len(out), section.addralign)
+            out += bytes(offset - len(out))
+            out += contents
+            section = section._replace(offset=offset)
+        new_sections.append(section)
+
+    shoff = _align(len(out), 8)
+    out += bytes(shoff - len(out))
+    for section in new_sections:
+        out += fmt.shdr.pack(*section)
+
+    fmt.ehdr_tail.pack_into(out, 16,
+        elf.e_type, elf.e_machine, elf.e_version, elf.e_entry, elf.e_phoff,
+        shoff, elf.e_flags, elf.e_ehsize, elf.e_phentsize, elf.e_phnum,
+        elf.e_shentsize, len(new_sections), index_map[elf.e_shstrndx])
+    return bytes(out)
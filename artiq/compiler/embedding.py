@@ -135,6 +135,43 @@ class EmbeddingMap:
                           self.object_forward_map.values()))
 
 
+def _bulk_quote(value):
+    """Return the type of the list or array `value` and its elements as
+    a one-dimensional array, if it can be quoted as a single constant instead
+    of one AST node per element, or `None` otherwise."""
+    if isinstance(value, numpy.ndarray):
+        if value.ndim != 1:
+            return None
+        array, wrapper = value, builtins.TArray
+        elt_types = {value.dtype.type}
+    else:
+        array, wrapper = None, builtins.TList
+        elt_types = set(map(type, value))
+    if len(elt_types) != 1:
+        return None
+    elt_type, = elt_types
+
+    if elt_type is int:
+        # The width is determined by IntMonomorphizer.
+        typ, dtype = builtins.TInt(), numpy.int64
+    elif elt_type is numpy.int32:
+        typ, dtype = builtins.TInt32(), numpy.int32
+    elif elt_type is numpy.int64:
+        typ, dtype = builtins.TInt64(), numpy.int64
+    elif elt_type is float or elt_type is numpy.float64:
+        typ, dtype = builtins.TFloat(), numpy.float64
+    elif elt_type is bool or elt_type is numpy.bool_:
+        typ, dtype = builtins.TBool(), numpy.bool_
+    else:
+        return None
+    if array is None:
+        try:
+            array = numpy.array(value, dtype=dtype)
+        except OverflowError:
+            return None
+    return wrapper(typ), array
+
+
 class ASTSynthesizer:
     def __init__(self, embedding_map, value_map, quote_function=None, expanded_from=None):
         self.source = ""
@@ -156,6 +193,31 @@ class ASTSynthesizer:
         return source.Range(self.source_buffer, range_from, range_to,
                             expanded_from=self.expanded_from)
 
+    def _quote_elements(self, value):
+        if isinstance(value, list):
+            begin_loc = self._add("[")
+            elts = []
+            for index, elt in enumerate(value):
+                elts.append(self.quote(elt))
+                if index < len(value) - 1:
+                    self._add(", ")
+            end_loc   = self._add("]")
+            return asttyped.ListT(elts=elts, ctx=None, type=builtins.TList(),
+                                  begin_loc=begin_loc, end_loc=end_loc,
+                                  loc=begin_loc.join(end_loc))
+        else:
+            begin_loc = self._add("numpy.array([")
+            elts = []
+            for index, elt in enumerate(value):
+                elts.append(self.quote(elt))
+                if index < len(value) - 1:
+                    self._add(", ")
+            end_loc   = self._add("])")
+
+            return asttyped.ListT(elts=elts, ctx=None, type=builtins.TArray(),
+                                  begin_loc=begin_loc, end_loc=end_loc,
+                                  loc=begin_loc.join(end_loc))
+
     def quote(self, value):
         """Construct an AST fragment equal to `value`."""
         if value is None:
@@ -210,29 +272,23 @@ class ASTSynthesizer:
             loc         = quote_loc.join(unquote_loc)
 
             return asttyped.QuoteT(value=value, type=builtins.TByteArray(), loc=loc)
-        elif isinstance(value, list):
-            begin_loc = self._add("[")
-            elts = []
-            for index, elt in enumerate(value):
-                elts.append(self.quote(elt))
-                if index < len(value) - 1:
-                    self._add(", ")
-            end_loc   = self._add("]")
-            return asttyped.ListT(elts=elts, ctx=None, type=builtins.TList(),
-                                  begin_loc=begin_loc, end_loc=end_loc,
-                                  loc=begin_loc.join(end_loc))
-        elif isinstance(value, numpy.ndarray):
-            begin_loc = self._add("numpy.array([")
-            elts = []
-            for index, elt in enumerate(value):
-                elts.append(self.quote(elt))
-                if index < len(value) - 1:
-                    self._add(", ")
-            end_loc   = self._add("])")
+        elif isinstance(value, (list, numpy.ndarray)):
+            bulk = _bulk_quote(value)
+            if bulk is None:
+                return self._quote_elements(value)
 
-            return asttyped.ListT(elts=elts, ctx=None, type=builtins.TArray(),
-                                  begin_loc=begin_loc, end_loc=end_loc,
-                                  loc=begin_loc.join(end_loc))
+            # Lists and arrays of scalars are embedded as a single constant,
+            # so that their length does not affect the compilation time.
+            # The kernel receives a fresh copy on every evaluation, as with
+            # a list literal.
+            typ, array = bulk
+
+            quote_loc   = self._add('`')
+            repr_loc    = self._add(repr(value))
+            unquote_loc = self._add('`')
+            loc         = quote_loc.join(unquote_loc)
+
+            return asttyped.QuoteT(value=array, type=typ, loc=loc)
         elif inspect.isfunction(value) or inspect.ismethod(value) or \
                 isinstance(value, pytypes.BuiltinFunctionType) or \
                 isinstance(value, SpecializedFunction):
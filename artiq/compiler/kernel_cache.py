@@ -0,0 +1,130 @@
+"""
+The :class:`KernelCache` class stores linked kernel libraries on disk,
+keyed by the LLVM IR they were generated from, so that kernels that are
+compiled repeatedly (for example, in a scan) are only optimized, assembled,
+linked and stripped once.
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+import logging
+
+from artiq import __version__ as artiq_version
+
+
+logger = logging.getLogger(__name__)
+
+
+_header = struct.Struct(">Q")
+
+
+class KernelCache:
+    """A content-addressed cache of kernel libraries.
+
+    The key of an entry is a digest of the unoptimized LLVM IR of the
+    kernel, of the target description and of the ARTIQ version. The LLVM IR
+    includes the values of all host object attributes referenced by the
+    kernel, and the embedding map is rebuilt by generating the IR, so that
+    a cached library is only used when the compiler would produce exactly
+    the same one.
+
+    When the total size of the entries exceeds ``max_size`` bytes, the least
+    recently used entries are removed.
+
+    :param directory: directory holding the cache entries. It is created if
+        it does not exist.
+    :param max_size: maximum size of the cache, in bytes.
+    """
+    def __init__(self, directory, max_size=64*1024*1024):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, target, llmodules):
+        """Computes the key of the library linked from the given LLVM modules
+        for the given target."""
+        h = hashlib.sha256()
+        for part in [artiq_version, target.triple, target.data_layout,
+                     ",".join(target.features)]:
+            h.update(part.encode())
+            h.update(b"\0")
+        for llmodule in llmodules:
+            h.update(str(llmodule).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + ".elf")
+
+    def get(self, key):
+        """Returns the ``(library, stripped_library)`` tuple stored under
+        ``key``, or ``None`` if there is no such entry."""
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logger.warning("failed to read kernel cache entry %s", filename,
+                           exc_info=True)
+            return None
+        if len(data) < _header.size:
+            return None
+        length, = _header.unpack_from(data)
+        if _header.size + length > len(data):
+            return None
+        library = data[_header.size:_header.size + length]
+        stripped_library = data[_header.size + length:]
+        logger.debug("kernel cache hit: %s", key)
+        return library, stripped_library
+
+    def put(self, key, library, stripped_library):
+        """Stores a library and its stripped version under ``key``."""
+        try:
+            with tempfile.NamedTemporaryFile("wb", dir=self.directory,
+                                             delete=False) as f:
+                f.write(_header.pack(len(library)))
+                f.write(library)
+                f.write(stripped_library)
+                tmpname = f.name
+            os.replace(tmpname, self._filename(key))
+        except OSError:
+            logger.warning("failed to store kernel cache entry %s", key,
+                           exc_info=True)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for de in os.scandir(self.directory):
+            if de.is_file() and de.name.endswith(".elf"):
+                try:
+                    st = de.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, de.path))
+                total_size += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            logger.debug("evicting kernel cache entry %s", path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for de in os.scandir(self.directory):
+            if de.is_file() and de.name.endswith(".elf"):
+                try:
+                    os.unlink(de.path)
+                except FileNotFoundError:
+                    pass
@@ -1,7 +1,9 @@
-import os, sys, tempfile, subprocess
-from artiq.compiler import types
+import os, sys, tempfile, subprocess, logging
+from artiq.compiler import types, elf, dwarf
 from llvmlite_artiq import ir as ll, binding as llvm
 
+logger = logging.getLogger(__name__)
+
 llvm.initialize()
 llvm.initialize_all_targets()
 llvm.initialize_all_asmprinters()
@@ -120,8 +122,8 @@ class Target:
 
         llpassmgr.run(llmodule)
 
-    def compile(self, module):
-        """Compile the module to a relocatable object for this target."""
+    def build_llvm_module(self, module):
+        """Generate the unoptimized LLVM module for the module."""
 
         if os.getenv("ARTIQ_DUMP_SIG"):
             print("====== MODULE_SIGNATURE DUMP ======", file=sys.stderr)
@@ -143,6 +145,9 @@ class Target:
         _dump(os.getenv("ARTIQ_DUMP_UNOPT_LLVM"), "LLVM IR (generated)", "_unopt.ll",
               lambda: str(llparsedmod))
 
+        return llparsedmod
+
+    def optimize_and_dump(self, llparsedmod):
         self.optimize(llparsedmod)
 
         _dump(os.getenv("ARTIQ_DUMP_LLVM"), "LLVM IR (optimized)", ".ll",
@@ -150,6 +155,10 @@ class Target:
 
         return llparsedmod
 
+    def compile(self, module):
+        """Compile the module to a relocatable object for this target."""
+        return self.optimize_and_dump(self.build_llvm_module(module))
+
     def assemble(self, llmodule):
         llmachine = self.target_machine()
 
@@ -179,12 +188,69 @@ class Target:
     def compile_and_link(self, modules):
         return self.link([self.assemble(self.compile(module)) for module in modules])
 
+    def compile_link_and_strip(self, modules, cache=None):
+        """
+        Compile and link the modules, and strip the resulting library.
+
+        :param cache: (:class:`artiq.compiler.kernel_cache.KernelCache`)
+            if given, the libraries are looked up in and stored to this cache,
+            and only the LLVM IR is generated when there is a matching entry.
+            The cache is not used when the output of the later stages is
+            dumped with the ``ARTIQ_DUMP_*`` environment variables.
+        :return: (tuple) library and stripped library.
+        """
+        llmodules = [self.build_llvm_module(module) for module in modules]
+        if any(os.getenv(name) for name in ["ARTIQ_DUMP_LLVM", "ARTIQ_DUMP_ASM",
+                                             "ARTIQ_DUMP_OBJ", "ARTIQ_DUMP_ELF"]):
+            # The dumps are produced by the stages that a cache hit skips.
+            cache = None
+        if cache is not None:
+            key = cache.key(self, llmodules)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+
+        library = self.link([self.assemble(self.optimize_and_dump(llmodule))
+                             for llmodule in llmodules])
+        stripped_library = self.strip(library)
+        if cache is not None:
+            cache.put(key, library, stripped_library)
+        return library, stripped_library
+
     def strip(self, library):
+        try:
+            return elf.strip_debug(library)
+        except ValueError as e:
+            logger.debug("cannot strip library in-process (%s), "
+                         "running %s-strip", e, self.triple)
+
         with RunTool([self.triple + "-strip", "--strip-debug", "{library}", "-o", "{output}"],
                      library=library, output=b"") \
                 as results:
             return results["output"].read()
 
+    def symbolizer(self, library):
+        """
+        Return a function that converts a list of return addresses within
+        ``library`` to backtrace entries, like :meth:`symbolize`.
+
+        The debugging information of the library is decoded in-process the
+        first time the function is called, and the results are cached.
+        If it cannot be decoded, ``addr2line`` is used instead.
+        """
+        symbolizer = dwarf.Symbolizer(library)
+        def symbolize(addresses):
+            try:
+                backtrace = symbolizer.symbolize(addresses)
+            except ValueError as e:
+                logger.debug("%s, running %s-addr2line", e, self.triple)
+                return self.symbolize(library, addresses)
+            names = list({entry[3] for entry in backtrace})
+            demangled = dict(zip(names, self.demangle(names)))
+            return [(filename, line, column, demangled[function], address)
+                    for filename, line, column, function, address in backtrace]
+        return symbolize
+
     def symbolize(self, library, addresses):
         if addresses == []:
             return []
@@ -221,8 +287,15 @@ class Target:
             return backtrace
 
     def demangle(self, names):
-        with RunTool([self.triple + "-c++filt"] + names) as results:
-            return results["__stdout__"].rstrip().split("\n")
+        # Only run c++filt if there is something to demangle; ARTIQ Python
+        # function names are not mangled.
+        mangled = [name for name in names if name.startswith(("_Z", "_R"))]
+        if not mangled:
+            return list(names)
+        with RunTool([self.triple + "-c++filt"] + mangled) as results:
+            demangled = dict(zip(mangled,
+                                 results["__stdout__"].rstrip().split("\n")))
+        return [demangled.get(name, name) for name in names]
 
 class NativeTarget(Target):
     def __init__(self):
@@ -1632,19 +1632,7 @@ class ARTIQIRGenerator(algorithm.Visitor):
                 return self.append(ir.Alloc([length], node.type))
             elif len(node.args) == 1 and len(node.keywords) == 0:
                 arg = self.visit(node.args[0])
-                length = self.iterable_len(arg)
-                result = self.append(ir.Alloc([length], node.type))
-
-                def body_gen(index):
-                    elt = self.iterable_get(arg, index)
-                    self.append(ir.SetElem(result, index, elt))
-                    return self.append(ir.Arith(ast.Add(loc=None), index,
-                                                ir.Constant(1, length.type)))
-                self._make_loop(ir.Constant(0, length.type),
-                    lambda index: self.append(ir.Compare(ast.Lt(loc=None), index, length)),
-                    body_gen)
-
-                return result
+                return self._copy_iterable(arg, node.type)
             else:
                 assert False
         elif types.is_builtin(typ, "range"):
@@ -1850,8 +1838,28 @@ class ARTIQIRGenerator(algorithm.Visitor):
 
         return insn
 
+    def _copy_iterable(self, arg, typ):
+        length = self.iterable_len(arg)
+        result = self.append(ir.Alloc([length], typ))
+
+        def body_gen(index):
+            elt = self.iterable_get(arg, index)
+            self.append(ir.SetElem(result, index, elt))
+            return self.append(ir.Arith(ast.Add(loc=None), index,
+                                        ir.Constant(1, length.type)))
+        self._make_loop(ir.Constant(0, length.type),
+            lambda index: self.append(ir.Compare(ast.Lt(loc=None), index, length)),
+            body_gen)
+
+        return result
+
     def visit_QuoteT(self, node):
-        return self.append(ir.Quote(node.value, node.type))
+        value = self.append(ir.Quote(node.value, node.type))
+        if builtins.is_list(node.type) or builtins.is_array(node.type):
+            # Quoted lists and arrays are read-only constants; allocate a
+            # fresh copy, as a list literal would.
+            value = self._copy_iterable(value, node.type)
+        return value
 
     def instrument_assert(self, node, value):
         if self.current_assert_env is not None:
@@ -27,6 +27,18 @@ class IntMonomorphizer(algorithm.Visitor):
 
                 node.type["width"].unify(types.TValue(width))
 
+    def visit_QuoteT(self, node):
+        # Lists of integers quoted by the embedding are 64-bit Numpy arrays.
+        if builtins.is_list(node.type) or builtins.is_array(node.type):
+            elt_type = builtins.get_iterable_elt(node.type)
+            if builtins.is_int(elt_type) and types.is_var(elt_type["width"]):
+                if len(node.value) == 0 or \
+                        (-2**31 < node.value.min() and node.value.max() < 2**31-1):
+                    width = 32
+                else:
+                    width = 64
+                elt_type["width"].unify(types.TValue(width))
+
     def visit_CallT(self, node):
         self.generic_visit(node)
 
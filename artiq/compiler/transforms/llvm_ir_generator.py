@@ -1532,20 +1532,7 @@ class LLVMIRGenerator:
             return llconst
         elif builtins.is_listish(typ):
             assert isinstance(value, (list, numpy.ndarray)), fail_msg
-            elt_type  = builtins.get_iterable_elt(typ)
-            llelts    = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
-                         for i in range(len(value))]
-            lleltsary = ll.Constant(ll.ArrayType(self.llty_of_type(elt_type), len(llelts)),
-                                    list(llelts))
-
-            name      = self.llmodule.scope.deduplicate("quoted.{}".format(typ.name))
-            llglobal  = ll.GlobalVariable(self.llmodule, lleltsary.type, name)
-            llglobal.initializer = lleltsary
-            llglobal.linkage = "private"
-
-            lleltsptr = llglobal.bitcast(lleltsary.type.element.as_pointer())
-            llconst   = ll.Constant(llty, [lleltsptr, ll.Constant(lli32, len(llelts))])
-            return llconst
+            return self._quote_listish(value, typ, path)
         elif types.is_rpc(typ) or types.is_c_function(typ):
             # RPC and C functions have no runtime representation.
             return ll.Constant(llty, ll.Undefined)
@@ -1562,8 +1549,60 @@ class LLVMIRGenerator:
             print(typ)
             assert False, fail_msg
 
+    def _quote_listish(self, value, typ, path, constant=False):
+        llty      = self.llty_of_type(typ)
+        elt_type  = builtins.get_iterable_elt(typ)
+        llelt_type = self.llty_of_type(elt_type)
+        name      = self.llmodule.scope.deduplicate("quoted.{}".format(typ.name))
+
+        if builtins.is_bool(elt_type) or builtins.is_int(elt_type) or \
+                builtins.is_float(elt_type):
+            # Lists and arrays of scalars are emitted as a single blob of bytes
+            # in the memory layout of the target, so that the size of the IR
+            # does not depend on their length.
+            if builtins.is_bool(elt_type):
+                if not (isinstance(value, numpy.ndarray) and value.dtype == numpy.bool_):
+                    assert all(elt in (True, False) for elt in value), \
+                           "at " + ".".join(path())
+                dtype = numpy.dtype(numpy.bool_)
+            elif builtins.is_int(elt_type):
+                dtype = numpy.dtype("i{}".format(builtins.get_int_width(elt_type) // 8))
+            else:
+                dtype = numpy.dtype(numpy.float64)
+            if "E" in self.llmodule.data_layout.split("-"):
+                dtype = dtype.newbyteorder(">")
+            else:
+                dtype = dtype.newbyteorder("<")
+            array = numpy.asarray(value, dtype=dtype)
+
+            # The empty leading array aligns the bytes for the element type.
+            lldata    = ll.Constant.literal_struct([
+                ll.Constant(ll.ArrayType(llelt_type, 0), None),
+                ll.Constant(ll.ArrayType(lli8, array.nbytes), bytearray(array.tobytes()))
+            ])
+            llglobal  = ll.GlobalVariable(self.llmodule, lldata.type, name)
+            llglobal.initializer = lldata
+            length    = len(array)
+        else:
+            llelts    = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
+                         for i in range(len(value))]
+            lldata    = ll.Constant(ll.ArrayType(llelt_type, len(llelts)), llelts)
+            llglobal  = ll.GlobalVariable(self.llmodule, lldata.type, name)
+            llglobal.initializer = lldata
+            length    = len(llelts)
+        llglobal.linkage = "private"
+        llglobal.global_constant = constant
+
+        lleltsptr = llglobal.bitcast(llelt_type.as_pointer())
+        return ll.Constant(llty, [lleltsptr, ll.Constant(lli32, length)])
+
     def process_Quote(self, insn):
         assert self.embedding_map is not None
+        if builtins.is_list(insn.type) or builtins.is_array(insn.type):
+            # Quoted lists and arrays are copied before use (see
+            # ARTIQIRGenerator.visit_QuoteT), so they are never written to.
+            return self._quote_listish(insn.value, insn.type,
+                                       lambda: [repr(insn.value)], constant=True)
         return self._quote(insn.value, insn.type, lambda: [repr(insn.value)])
 
     def process_Select(self, insn):
@@ -6,6 +6,10 @@ from enum import Enum
 import struct
 import logging
 import socket
+import mmap
+
+import numpy
+import h5py
 
 
 logger = logging.getLogger(__name__)
@@ -34,18 +38,60 @@ class ExceptionType(Enum):
     i_overflow = 0b100001
 
 
-def get_analyzer_dump(host, port=1382):
+dump_header = struct.Struct(">IQbbb")
+
+
+def _recv_into(sock, view):
+    while view:
+        n = sock.recv_into(view)
+        if not n:
+            raise IOError("analyzer dump truncated")
+        view = view[n:]
+
+
+def _receive_dump(host, port, allocate):
+    # allocate(length, header) returns a writable buffer of the given length
+    # starting with the header.
     sock = socket.create_connection((host, port))
     try:
-        r = bytes()
-        while True:
-            buf = sock.recv(8192)
-            if not buf:
-                break
-            r += buf
+        header = bytearray(dump_header.size)
+        _recv_into(sock, memoryview(header))
+        sent_bytes = dump_header.unpack(header)[0]
+        buf = allocate(dump_header.size + sent_bytes, header)
+        with memoryview(buf) as view:
+            _recv_into(sock, view[dump_header.size:])
     finally:
         sock.close()
-    return r
+    return buf
+
+
+def get_analyzer_dump(host, port=1382):
+    def allocate(length, header):
+        buf = bytearray(length)
+        buf[:len(header)] = header
+        return buf
+    return _receive_dump(host, port, allocate)
+
+
+def receive_analyzer_dump(host, fileobj, port=1382):
+    """Writes the analyzer dump into the given file object (opened in
+    ``w+b`` mode) as it is received, and returns a memory map of it, to be
+    passed to ``decode_dump``.
+
+    Unlike ``get_analyzer_dump``, the dump is never held in memory as a
+    whole."""
+    def allocate(length, header):
+        fileobj.write(header)
+        fileobj.truncate(length)
+        fileobj.flush()
+        return mmap.mmap(fileobj.fileno(), length)
+    return _receive_dump(host, port, allocate)
+
+
+def load_dump(fileobj):
+    """Returns a read-only memory map of a raw dump file, to be passed to
+    ``decode_dump``."""
+    return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 OutputMessage = namedtuple(
@@ -85,12 +131,120 @@ def decode_message(data):
         raise ValueError
 
 
-DecodedDump = namedtuple(
-    "DecodedDump", "log_channel dds_onehot_sel messages")
+# Analyzer messages as stored in the dump, see decode_message.
+message_dtype = numpy.dtype([
+    ("data", ">u8"),
+    ("address", ">u4"),
+    ("rtio_counter", ">u8"),
+    ("timestamp", ">u8"),
+    ("type_channel", ">u4")
+])
+
+
+def decode_records(records):
+    """Converts an array of ``message_dtype`` records into a list of
+    message namedtuples."""
+    type_channel = records["type_channel"]
+    message_types = (type_channel & 0b11).tolist()
+    channels = (type_channel >> 2).tolist()
+    data = records["data"].tolist()
+    address = records["address"].tolist()
+    rtio_counter = records["rtio_counter"].tolist()
+    timestamp = records["timestamp"].tolist()
+
+    output = MessageType.output.value
+    input = MessageType.input.value
+    exception = MessageType.exception.value
+    messages = []
+    for i, message_type in enumerate(message_types):
+        if message_type == output:
+            messages.append(OutputMessage(channels[i], timestamp[i],
+                                          rtio_counter[i], address[i],
+                                          data[i]))
+        elif message_type == input:
+            messages.append(InputMessage(channels[i], timestamp[i],
+                                         rtio_counter[i], data[i]))
+        elif message_type == exception:
+            messages.append(ExceptionMessage(
+                channels[i], rtio_counter[i],
+                ExceptionType(address[i] & 0xff)))
+        else:
+            messages.append(StoppedMessage(rtio_counter[i]))
+    return messages
+
+
+class DecodedDump:
+    """Contents of an analyzer dump.
+
+    The messages are kept as a Numpy array of ``message_dtype`` records
+    (``records``), in the order of the dump, with column accessors.
+    ``messages`` converts them into message namedtuples on first access.
+    """
+    def __init__(self, log_channel, dds_onehot_sel, records):
+        self.log_channel = log_channel
+        self.dds_onehot_sel = dds_onehot_sel
+        self.records = records
+        self._messages = None
+
+    @property
+    def message_type(self):
+        return self.records["type_channel"] & 0b11
+
+    @property
+    def channel(self):
+        return self.records["type_channel"] >> 2
+
+    @property
+    def time(self):
+        """Timestamp of output and input messages, RTIO counter of other
+        messages (see ``get_message_time``)."""
+        return numpy.where(self.message_type <= MessageType.input.value,
+                           self.records["timestamp"],
+                           self.records["rtio_counter"])
+
+    def filter(self, channels=None, start=None, end=None):
+        """Returns a dump with only the messages of the given channels, and
+        with a time (see ``time``) within ``[start, end)``. The stopped
+        message is always kept.
+
+        The filters are applied to the records, before any conversion into
+        message namedtuples."""
+        mask = self.message_type == MessageType.stopped.value
+        selected = numpy.ones(len(self.records), bool)
+        if channels is not None:
+            selected &= numpy.in1d(self.channel, list(channels))
+        if start is not None or end is not None:
+            time = self.time
+            if start is not None:
+                selected &= time >= start
+            if end is not None:
+                selected &= time < end
+        mask |= selected
+        return DecodedDump(self.log_channel, self.dds_onehot_sel,
+                           self.records[mask])
+
+    def sort_order(self):
+        """Returns the indices that sort the messages by time, keeping the
+        order of the dump for messages with the same time."""
+        return numpy.argsort(self.time, kind="mergesort")
+
+    @property
+    def messages(self):
+        if self._messages is None:
+            self._messages = decode_records(self.records)
+        return self._messages
+
+    def iter_messages(self, order=None, chunk_size=2**16):
+        """Yields the messages (in the order given by an array of indices,
+        if any), converting them in chunks rather than all at once."""
+        if order is None:
+            order = numpy.arange(len(self.records))
+        for i in range(0, len(order), chunk_size):
+            yield from decode_records(self.records[order[i:i+chunk_size]])
 
 
 def decode_dump(data):
-    parts = struct.unpack(">IQbbb", data[:15])
+    parts = dump_header.unpack(data[:dump_header.size])
     (sent_bytes, total_byte_count,
      overflow_occured, log_channel, dds_onehot_sel) = parts
 
@@ -106,12 +260,8 @@ def decode_dump(data):
         logger.info("analyzer ring buffer has wrapped %d times",
                     total_byte_count//sent_bytes)
 
-    position = 15
-    messages = []
-    for _ in range(sent_bytes//32):
-        messages.append(decode_message(data[position:position+32]))
-        position += 32
-    return DecodedDump(log_channel, bool(dds_onehot_sel), messages)
+    records = numpy.frombuffer(data, message_dtype, sent_bytes//32, 15)
+    return DecodedDump(log_channel, bool(dds_onehot_sel), records)
 
 
 def vcd_codes():
@@ -210,6 +360,22 @@ class TTLClockGenHandler:
             self.channel_frequency.set_value_double(frequency)
 
 
+def _dds_gpio_to_channels(gpio, onehot_sel):
+    gpio >>= 1  # strip reset
+    if onehot_sel:
+        r = set()
+        nr = 0
+        mask = 1
+        while gpio >= mask:
+            if gpio & mask:
+                r.add(nr)
+            nr += 1
+            mask *= 2
+        return r
+    else:
+        return {gpio}
+
+
 class DDSHandler:
     def __init__(self, vcd_manager, dds_type, onehot_sel, sysclk):
         self.vcd_manager = vcd_manager
@@ -232,24 +398,10 @@ class DDSHandler:
             dds_channel["pow"] = None
         self.dds_channels[dds_channel_nr] = dds_channel
 
-    def _gpio_to_channels(self, gpio):
-        gpio >>= 1  # strip reset
-        if self.onehot_sel:
-            r = set()
-            nr = 0
-            mask = 1
-            while gpio >= mask:
-                if gpio & mask:
-                    r.add(nr)
-                nr += 1
-                mask *= 2
-            return r
-        else:
-            return {gpio}
-
     def _decode_ad9914_write(self, message):
         if message.address == 0x81:
-            self.selected_dds_channels = self._gpio_to_channels(message.data)
+            self.selected_dds_channels = _dds_gpio_to_channels(
+                message.data, self.onehot_sel)
         for dds_channel_nr in self.selected_dds_channels:
             dds_channel = self.dds_channels[dds_channel_nr]
             if message.address == 0x2d:
@@ -407,6 +559,21 @@ def get_single_device_argument(devices, module, cls, argument):
     return ref_period
 
 
+def get_device_channels(devices, name):
+    """Returns the RTIO channels used by the given device."""
+    desc = devices[name]
+    while isinstance(desc, str):
+        desc = devices[desc]
+    arguments = desc.get("arguments", dict())
+    if "bus_channel" in arguments:
+        return {arguments["bus_channel"]}
+    elif "channel" in arguments:
+        return {arguments["channel"]}
+    else:
+        raise ValueError("unable to determine the RTIO channel of device "
+                         "'{}'".format(name))
+
+
 def get_ref_period(devices):
     return get_single_device_argument(devices, "artiq.coredevice.core",
                                       ("Core",), "ref_period")
@@ -468,29 +635,29 @@ def decoded_dump_to_vcd(fileobj, devices, dump):
         logger.warning("unable to determine DDS sysclk")
         dds_sysclk = 3e9  # guess
 
-    if isinstance(dump.messages[-1], StoppedMessage):
-        messages = dump.messages[:-1]
+    order = dump.sort_order()
+    if dump.message_type[-1] == MessageType.stopped.value:
+        order = order[order != len(dump.records) - 1]
     else:
         logger.warning("StoppedMessage missing")
-        messages = dump.messages
-    messages = sorted(messages, key=get_message_time)
 
     channel_handlers = create_channel_handlers(
         vcd_manager, devices, ref_period,
         dds_sysclk, dump.dds_onehot_sel)
-    vcd_log_channels = get_vcd_log_channels(dump.log_channel, messages)
+    log_order = order[dump.channel[order] == dump.log_channel]
+    vcd_log_channels = get_vcd_log_channels(
+        dump.log_channel, dump.iter_messages(log_order))
     channel_handlers[dump.log_channel] = LogHandler(
         vcd_manager, vcd_log_channels)
     slack = vcd_manager.get_channel("rtio_slack", 64)
 
     vcd_manager.set_time(0)
-    start_time = 0
-    for m in messages:
-        start_time = get_message_time(m)
-        if start_time:
-            break
+    times = dump.time[order]
+    nonzero = numpy.flatnonzero(times)
+    start_time = int(times[nonzero[0]]) if len(nonzero) else 0
+    del times, nonzero
 
-    for message in messages:
+    for message in dump.iter_messages(order):
         if message.channel in channel_handlers:
             t = get_message_time(message) - start_time
             if t >= 0:
@@ -499,3 +666,187 @@ def decoded_dump_to_vcd(fileobj, devices, dump):
             if isinstance(message, OutputMessage):
                 slack.set_value_double(
                     (message.timestamp - message.rtio_counter)*ref_period)
+
+
+def _table(columns):
+    # columns: list of (name, array) of the same length
+    length = len(columns[0][1])
+    table = numpy.empty(length, [(name, numpy.asarray(column).dtype)
+                                 for name, column in columns])
+    for name, column in columns:
+        table[name] = column
+    return table
+
+
+def _slack(records, ref_period):
+    return ((records["timestamp"].astype(numpy.int64)
+             - records["rtio_counter"].astype(numpy.int64))*ref_period)
+
+
+def _output_table(records, ref_period, value_name, value):
+    return _table([("timestamp", records["timestamp"]),
+                   (value_name, value),
+                   ("slack", _slack(records, ref_period))])
+
+
+def _dds_ad9914_tables(names, records, onehot_sel, sysclk):
+    # Same decoding as DDSHandler._decode_ad9914_write, one row per FUD and
+    # selected channel.
+    state = {nr: {"ftw": [None, None], "pow": None} for nr in names}
+    rows = {nr: [] for nr in names}
+    selected = set()
+    for timestamp, address, data in zip(records["timestamp"].tolist(),
+                                        records["address"].tolist(),
+                                        records["data"].tolist()):
+        if address == 0x81:
+            selected = _dds_gpio_to_channels(data, onehot_sel)
+        for nr in selected:
+            channel = state[nr]
+            if address == 0x2d:
+                channel["ftw"][0] = data
+            elif address == 0x2f:
+                channel["ftw"][1] = data
+            elif address == 0x31:
+                channel["pow"] = data
+            elif address == 0x80:  # FUD
+                if None not in channel["ftw"]:
+                    ftw = channel["ftw"][0] | channel["ftw"][1] << 16
+                    frequency = ftw*sysclk/2**32
+                else:
+                    frequency = float("nan")
+                if channel["pow"] is not None:
+                    phase = channel["pow"]/2**16
+                else:
+                    phase = float("nan")
+                rows[nr].append((timestamp, frequency, phase))
+    dtype = [("timestamp", numpy.uint64), ("frequency", numpy.float64),
+             ("phase", numpy.float64)]
+    return {names[nr]: numpy.array(rows[nr], dtype) for nr in names}
+
+
+def _log_table(records):
+    rows = []
+    log_entry = ""
+    for timestamp, data in zip(records["timestamp"].tolist(),
+                               records["data"].tolist()):
+        log_entry += _extract_log_chars(data)
+        if len(log_entry) > 1 and log_entry[-1] == "\x1D":
+            channel_name, log_message = log_entry[:-1].split("\x1E",
+                                                             maxsplit=1)
+            rows.append((timestamp, channel_name.encode(),
+                         log_message.encode()))
+            log_entry = ""
+    timestamps, channel_names, log_messages = zip(*rows) if rows else [()]*3
+    # Byte strings, which both HDF5 and Numpy files store natively.
+    return _table([
+        ("timestamp", numpy.array(timestamps, numpy.uint64)),
+        ("channel", numpy.array(channel_names, "S")),
+        ("message", numpy.array(log_messages, "S"))])
+
+
+def decoded_dump_to_tables(devices, dump):
+    """Converts the messages of the dump into tables of events, as Numpy
+    structured arrays sorted by time. Returns a dictionary of tables, keyed
+    by names such as ``ttl/<device>/output``, and the RTIO reference period.
+
+    Timestamps and RTIO counter values are in machine units; slacks are in
+    seconds.
+    """
+    ref_period = get_ref_period(devices)
+    if ref_period is None:
+        logger.warning("unable to determine core device ref_period")
+        ref_period = 1e-9  # guess
+    dds_sysclk = get_dds_sysclk(devices)
+    if dds_sysclk is None:
+        logger.warning("unable to determine DDS sysclk")
+        dds_sysclk = 3e9  # guess
+
+    order = dump.sort_order()
+    records = dump.records[order]
+    message_type = records["type_channel"] & 0b11
+    channel = records["type_channel"] >> 2
+    outputs = message_type == MessageType.output.value
+    inputs = message_type == MessageType.input.value
+
+    def select(mask, nr):
+        return records[mask & (channel == nr)]
+
+    tables = dict()
+    exceptions = records[message_type == MessageType.exception.value]
+    tables["exceptions"] = _table([
+        ("rtio_counter", exceptions["rtio_counter"]),
+        ("channel", exceptions["type_channel"] >> 2),
+        ("exception_type", (exceptions["address"] & 0xff).astype(numpy.uint8))
+    ])
+    tables["log"] = _log_table(select(outputs, dump.log_channel))
+
+    dds_buses = dict()
+    for name, desc in sorted(devices.items(), key=itemgetter(0)):
+        if not (isinstance(desc, dict) and desc["type"] == "local"):
+            continue
+        module, cls = desc["module"], desc["class"]
+        if (module == "artiq.coredevice.ttl"
+                and cls in {"TTLOut", "TTLInOut"}):
+            writes = select(outputs, desc["arguments"]["channel"])
+            values = writes[writes["address"] == 0]
+            tables["ttl/{}/output".format(name)] = _output_table(
+                values, ref_period, "value", values["data"].astype(numpy.uint8))
+            if cls == "TTLInOut":
+                oe = writes[writes["address"] == 1]
+                tables["ttl/{}/oe".format(name)] = _output_table(
+                    oe, ref_period, "value", oe["data"].astype(numpy.uint8))
+                reads = select(inputs, desc["arguments"]["channel"])
+                tables["ttl/{}/input".format(name)] = _table([
+                    ("timestamp", reads["timestamp"]),
+                    ("value", reads["data"].astype(numpy.uint8))])
+        elif module == "artiq.coredevice.ttl" and cls == "TTLClockGen":
+            writes = select(outputs, desc["arguments"]["channel"])
+            tables["ttl_clkgen/{}".format(name)] = _output_table(
+                writes, ref_period, "frequency",
+                writes["data"]/ref_period/2**24)
+        elif module == "artiq.coredevice.dds" and cls == "DDSChannelAD9914":
+            bus_channel = desc["arguments"]["bus_channel"]
+            dds_buses.setdefault(bus_channel, dict())[
+                desc["arguments"]["channel"]] = name
+        elif module == "artiq.coredevice.spi" and cls == "SPIMaster":
+            nr = desc["arguments"]["channel"]
+            writes = select(outputs, nr)
+            read_bit = 0b100
+            is_read = (writes["address"] & read_bit) != 0
+            plain = writes[~is_read]
+            tables["spi/{}/write".format(name)] = _table([
+                ("timestamp", plain["timestamp"]),
+                ("address", plain["address"]),
+                ("data", plain["data"].astype(numpy.uint32)),
+                ("slack", _slack(plain, ref_period))])
+            # Read requests are answered in order.
+            requests = writes[is_read]
+            reads = select(inputs, nr)
+            n = min(len(requests), len(reads))
+            requests, reads = requests[:n], reads[:n]
+            tables["spi/{}/read".format(name)] = _table([
+                ("timestamp", requests["timestamp"]),
+                ("address", requests["address"] & ~read_bit),
+                ("data", reads["data"].astype(numpy.uint32)),
+                ("read_slack", reads["rtio_counter"].astype(numpy.int64)
+                               - requests["timestamp"].astype(numpy.int64))])
+    for bus_channel, names in sorted(dds_buses.items()):
+        for name, table in _dds_ad9914_tables(
+                names, select(outputs, bus_channel),
+                dump.dds_onehot_sel, dds_sysclk).items():
+            tables["dds/{}".format(name)] = table
+    return tables, ref_period
+
+
+def decoded_dump_to_file(filename, devices, dump):
+    """Writes the tables of ``decoded_dump_to_tables`` and the reference
+    period (``ref_period``) into a Numpy ``.npz`` file if the file name has
+    this extension, into an HDF5 file otherwise."""
+    tables, ref_period = decoded_dump_to_tables(devices, dump)
+    if filename.endswith(".npz"):
+        numpy.savez(filename, ref_period=ref_period, **tables)
+    else:
+        with h5py.File(filename, "w") as f:
+            f["ref_period"] = ref_period
+            for name, table in tables.items():
+                f[name] = table
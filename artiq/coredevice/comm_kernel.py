@@ -136,8 +136,13 @@ class CommKernelDummy:
 
 
 class CommKernel:
+    # Writes are accumulated up to this size and sent when the message is
+    # complete; larger chunks are sent directly.
+    write_buffer_size = 65536
+
     def __init__(self, host, port=1381):
         self._read_type = None
+        self._write_buffer = bytearray()
         self.host = host
         self.port = port
 
@@ -152,19 +157,34 @@ class CommKernel:
             return
         self.socket.close()
         del self.socket
+        del self._write_buffer[:]
         logger.debug("disconnected")
 
-    def read(self, length):
-        r = bytes()
-        while len(r) < length:
-            rn = self.socket.recv(min(8192, length - len(r)))
-            if not rn:
+    def read_into(self, buffer):
+        view = memoryview(buffer)
+        while len(view):
+            n = self.socket.recv_into(view)
+            if not n:
                 raise ConnectionResetError("Connection closed")
-            r += rn
-        return r
+            view = view[n:]
+
+    def read(self, length):
+        r = bytearray(length)
+        self.read_into(r)
+        return bytes(r)
 
     def write(self, data):
-        self.socket.sendall(data)
+        if len(self._write_buffer) + len(data) > self.write_buffer_size:
+            self.flush()
+            if len(data) >= self.write_buffer_size:
+                self.socket.sendall(data)
+                return
+        self._write_buffer += data
+
+    def flush(self):
+        if self._write_buffer:
+            self.socket.sendall(self._write_buffer)
+            del self._write_buffer[:]
 
     #
     # Reader interface
@@ -172,6 +192,7 @@ class CommKernel:
 
     def _read_header(self):
         self.open()
+        self.flush()
 
         # Wait for a synchronization sequence, 5a 5a 5a 5a.
         sync_count = 0
@@ -272,6 +293,7 @@ class CommKernel:
 
     def reset_session(self):
         self.write(struct.pack(">ll", 0x5a5a5a5a, 0))
+        self.flush()
 
     def check_system_info(self):
         self._write_empty(_H2DMsgType.SYSTEM_INFO_REQUEST)
@@ -341,13 +363,44 @@ class CommKernel:
 
     def run(self):
         self._write_empty(_H2DMsgType.RUN_KERNEL)
+        self.flush()
         logger.debug("running kernel")
 
     _rpc_sentinel = object()
 
-    # See session.c:{send,receive}_rpc_value and llvm_ir_generator.py:_rpc_tag.
-    def _receive_rpc_value(self, embedding_map):
+    # Wire format and host type of the elements of lists and arrays that
+    # are received in bulk, by tag.
+    _rpc_bulk_types = {
+        "b": (numpy.dtype("u1"),  numpy.bool_),
+        "i": (numpy.dtype(">i4"), numpy.int32),
+        "I": (numpy.dtype(">i8"), numpy.int64),
+        "f": (numpy.dtype(">f8"), numpy.float64),
+    }
+
+    def _receive_rpc_elements(self, embedding_map, length):
+        # Returns the elements of a list or array as a Numpy array if they are
+        # scalars, and as a list otherwise.
+        if length == 0:
+            return []
         tag = chr(self._read_int8())
+        if tag not in self._rpc_bulk_types:
+            return [self._receive_rpc_value(embedding_map, tag)] + \
+                   [self._receive_rpc_value(embedding_map) for _ in range(length - 1)]
+
+        # Each element is still preceded by its tag.
+        wire_dtype, dtype = self._rpc_bulk_types[tag]
+        records = numpy.empty(length, numpy.dtype([("tag", "u1"), ("value", wire_dtype)]))
+        raw = records.view(numpy.uint8)
+        raw[0] = ord(tag)
+        self.read_into(raw[1:])
+        if not (records["tag"] == ord(tag)).all():
+            raise IOError("Inconsistent RPC value tags in list")
+        return records["value"].astype(dtype)
+
+    # See session.c:{send,receive}_rpc_value and llvm_ir_generator.py:_rpc_tag.
+    def _receive_rpc_value(self, embedding_map, tag=None):
+        if tag is None:
+            tag = chr(self._read_int8())
         if tag == "\x00":
             return self._rpc_sentinel
         elif tag == "t":
@@ -374,11 +427,19 @@ class CommKernel:
         elif tag == "A":
             return self._read_bytes()
         elif tag == "l":
-            length = self._read_int32()
-            return [self._receive_rpc_value(embedding_map) for _ in range(length)]
+            elts = self._receive_rpc_elements(embedding_map, self._read_int32())
+            if isinstance(elts, numpy.ndarray):
+                if elts.dtype.kind in "bf":
+                    # Python bool and float, as for single values.
+                    elts = elts.tolist()
+                else:
+                    elts = list(elts)
+            return elts
         elif tag == "a":
-            length = self._read_int32()
-            return numpy.array([self._receive_rpc_value(embedding_map) for _ in range(length)])
+            elts = self._receive_rpc_elements(embedding_map, self._read_int32())
+            if isinstance(elts, numpy.ndarray):
+                return elts
+            return numpy.array(elts)
         elif tag == "r":
             start = self._receive_rpc_value(embedding_map)
             stop  = self._receive_rpc_value(embedding_map)
@@ -417,6 +478,32 @@ class CommKernel:
         else:
             pass
 
+    # Accepted types and exclusive bounds of the elements of lists that are
+    # sent in bulk, by tag. These match the checks in _send_rpc_value.
+    _rpc_bulk_checks = {
+        "b": ((bool,), None),
+        "i": ((int, numpy.int32), (-2**31, 2**31-1)),
+        "I": ((int, numpy.int32, numpy.int64), (-2**63, 2**63-1)),
+        "f": ((float,), None),
+    }
+
+    def _encode_rpc_elements(self, tag, value):
+        # Returns the wire encoding of a list of scalars, or None if some
+        # element would be rejected, so that it is sent element by element
+        # and the mismatch is reported as usual.
+        types, bounds = self._rpc_bulk_checks[tag]
+        if not all(isinstance(elt, types) for elt in value):
+            return None
+        values = numpy.array(value)
+        if bounds is not None:
+            if values.dtype.kind not in "biu":
+                return None
+            low, high = bounds
+            if not (low < values.min() and values.max() < high):
+                return None
+        wire_dtype, _ = self._rpc_bulk_types[tag]
+        return values.astype(wire_dtype).tobytes()
+
     def _send_rpc_value(self, tags, value, root, function):
         def check(cond, expected):
             if not cond:
@@ -477,9 +564,15 @@ class CommKernel:
             check(isinstance(value, list),
                   lambda: "list")
             self._write_int32(len(value))
-            for elt in value:
-                tags_copy = bytearray(tags)
-                self._send_rpc_value(tags_copy, elt, root, function)
+            data = None
+            if value and chr(tags[0]) in self._rpc_bulk_checks:
+                data = self._encode_rpc_elements(chr(tags[0]), value)
+            if data is not None:
+                self.write(data)
+            else:
+                for elt in value:
+                    tags_copy = bytearray(tags)
+                    self._send_rpc_value(tags_copy, elt, root, function)
             self._skip_rpc_value(tags)
         elif tag == "r":
             check(isinstance(value, range),
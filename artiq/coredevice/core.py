@@ -1,5 +1,8 @@
 import os, sys
+import threading
 import numpy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from pythonparser import diagnostic
 
@@ -12,10 +15,12 @@ from artiq.language.units import *
 from artiq.compiler.module import Module
 from artiq.compiler.embedding import Stitcher
 from artiq.compiler.targets import OR1KTarget
+from artiq.compiler.kernel_cache import KernelCache
 
 from artiq.coredevice.comm_kernel import CommKernel, CommKernelDummy
 # Import for side effects (creating the exception classes).
 from artiq.coredevice import exceptions
+from artiq.tools import get_user_cache_dir
 
 
 def _render_diagnostic(diagnostic, colored):
@@ -39,6 +44,42 @@ class CompileError(Exception):
         return "\n" + _render_diagnostic(self.diagnostic, colored=colors_supported)
 
 
+class PrecompiledKernel:
+    """Handle to a kernel compiled in the background by
+    :meth:`Core.precompile`.
+
+    Calling the handle loads and runs the kernel on the core device and
+    returns its result, waiting for the compilation to finish first if
+    necessary. Compilation errors are raised at that point. The handle can be
+    called several times; the kernel is then only compiled once.
+    """
+    def __init__(self, core, function, args, kwargs):
+        self.core = core
+        self._result = None
+
+        @rpc(flags={"async"})
+        def set_result(new_result):
+            self._result = new_result
+
+        # The host attributes are embedded at compile time; writing them back
+        # when the kernel ends would undo the changes made since then.
+        self._future = core._get_compile_executor().submit(
+            core.compile, function, args, kwargs, set_result,
+            attribute_writeback=False)
+
+    def done(self):
+        """Returns ``True`` if the compilation has finished."""
+        return self._future.done()
+
+    def __call__(self):
+        embedding_map, kernel_library, symbolizer, demangler = \
+            self._future.result()
+        self._result = None
+        self.core._run_compiled(embedding_map, kernel_library,
+                                symbolizer, demangler)
+        return self._result
+
+
 @syscall
 def rtio_init() -> TNone:
     raise NotImplementedError("syscall not simulated")
@@ -63,6 +104,10 @@ class Core:
     :param ref_multiplier: ratio between the RTIO fine timestamp frequency
         and the RTIO coarse timestamp frequency (e.g. SERDES multiplication
         factor).
+    :param kernel_cache: directory where compiled kernels are cached.
+        The default is a subdirectory of the user cache directory.
+    :param kernel_cache_size: maximum size of the kernel cache in bytes.
+        Setting it to 0 disables the cache.
     """
 
     kernel_invariants = {
@@ -71,7 +116,8 @@ class Core:
     }
 
     def __init__(self, dmgr, host, ref_period, external_clock=False,
-                 ref_multiplier=8):
+                 ref_multiplier=8, kernel_cache=None,
+                 kernel_cache_size=64*1024*1024):
         self.ref_period = ref_period
         self.external_clock = external_clock
         self.ref_multiplier = ref_multiplier
@@ -81,16 +127,38 @@ class Core:
         else:
             self.comm = CommKernel(host)
 
+        if kernel_cache_size:
+            if kernel_cache is None:
+                kernel_cache = os.path.join(get_user_cache_dir(), "kernels")
+            self.kernel_cache = KernelCache(kernel_cache, kernel_cache_size)
+        else:
+            self.kernel_cache = None
+
+        self._symbolizers = OrderedDict()
+        self._compile_lock = threading.Lock()
+        self._compile_executor = None
+
         self.first_run = True
         self.dmgr = dmgr
         self.core = self
         self.comm.core = self
 
     def close(self):
+        if self._compile_executor is not None:
+            self._compile_executor.shutdown()
+            self._compile_executor = None
         self.comm.close()
 
     def compile(self, function, args, kwargs, set_result=None,
                 attribute_writeback=True, print_as_rpc=True):
+        # Kernels may be compiled by the background thread of precompile()
+        # while another kernel is compiled or run in the calling thread.
+        with self._compile_lock:
+            return self._compile(function, args, kwargs, set_result,
+                                 attribute_writeback, print_as_rpc)
+
+    def _compile(self, function, args, kwargs, set_result,
+                 attribute_writeback, print_as_rpc):
         try:
             engine = _DiagnosticEngine(all_errors_are_fatal=True)
 
@@ -104,15 +172,28 @@ class Core:
                 attribute_writeback=attribute_writeback)
             target = OR1KTarget()
 
-            library = target.compile_and_link([module])
-            stripped_library = target.strip(library)
+            library, stripped_library = target.compile_link_and_strip(
+                [module], self.kernel_cache)
 
             return stitcher.embedding_map, stripped_library, \
-                   lambda addresses: target.symbolize(library, addresses), \
+                   self._get_symbolizer(target, library), \
                    lambda symbols: target.demangle(symbols)
         except diagnostic.Error as error:
             raise CompileError(error.diagnostic) from error
 
+    def _get_symbolizer(self, target, library):
+        # Keep the symbolizers of recently compiled kernels, so that their
+        # debugging information is only decoded once when the same kernel
+        # is run and raises exceptions repeatedly.
+        try:
+            symbolizer = self._symbolizers.pop(library)
+        except KeyError:
+            symbolizer = target.symbolizer(library)
+            if len(self._symbolizers) >= 8:
+                self._symbolizers.popitem(last=False)
+        self._symbolizers[library] = symbolizer
+        return symbolizer
+
     def run(self, function, args, kwargs):
         result = None
         @rpc(flags={"async"})
@@ -122,7 +203,12 @@ class Core:
 
         embedding_map, kernel_library, symbolizer, demangler = \
             self.compile(function, args, kwargs, set_result)
+        self._run_compiled(embedding_map, kernel_library,
+                           symbolizer, demangler)
+        return result
 
+    def _run_compiled(self, embedding_map, kernel_library,
+                      symbolizer, demangler):
         if self.first_run:
             self.comm.check_system_info()
             self.comm.switch_clock(self.external_clock)
@@ -132,7 +218,38 @@ class Core:
         self.comm.run()
         self.comm.serve(embedding_map, symbolizer, demangler)
 
-        return result
+    def _get_compile_executor(self):
+        if self._compile_executor is None:
+            self._compile_executor = ThreadPoolExecutor(max_workers=1)
+        return self._compile_executor
+
+    def precompile(self, function, *args, **kwargs):
+        """Compiles a kernel in a background thread, so that it can be
+        compiled while the host computes or another kernel is running.
+
+        ``function`` is a kernel function or method, and ``args`` and
+        ``kwargs`` are the arguments it will be called with. The arguments and
+        the host attributes that the kernel uses are embedded when it is
+        compiled; modifications made afterwards are not seen by the kernel.
+        Conversely, modifications of host attributes made by the kernel are
+        not written back to the host.
+
+        Returns a :class:`PrecompiledKernel`, which runs the kernel when
+        called. Kernels are compiled one at a time, in the order in which
+        they were submitted.
+
+        Example::
+
+            next_kernel = self.core.precompile(self.measure, point)
+            self.prepare_next_point()
+            result = next_kernel()
+        """
+        if hasattr(function, "__self__") and hasattr(function, "__func__"):
+            # Bound kernel methods are compiled like the kernel decorator
+            # does, with the instance as first argument.
+            args = (function.__self__,) + args
+            function = function.__func__
+        return PrecompiledKernel(self, function, args, kwargs)
 
     @portable
     def seconds_to_mu(self, seconds):
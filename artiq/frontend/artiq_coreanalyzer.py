@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
+import shutil
 import sys
+import tempfile
 
 from artiq.tools import verbosity_args, init_logger
 from artiq.master.databases import DeviceDB
 from artiq.master.worker_db import DeviceManager
-from artiq.coredevice.comm_analyzer import (get_analyzer_dump,
-                                            decode_dump, decoded_dump_to_vcd)
+from artiq.coredevice.comm_analyzer import (receive_analyzer_dump, load_dump,
+                                            decode_dump, decoded_dump_to_vcd,
+                                            decoded_dump_to_file,
+                                            get_device_channels)
 
 
 def get_argparser():
@@ -24,6 +28,19 @@ def get_argparser():
                         help="print raw decoded messages")
     parser.add_argument("-w", "--write-vcd", type=str, default=None,
                         help="format and write contents to VCD file")
+    parser.add_argument("-e", "--export", type=str, default=None,
+                        help="write tables of events per channel to a HDF5 "
+                             "file, or a Numpy file if the name ends "
+                             "with .npz")
+    parser.add_argument("-c", "--channel", action="append", default=None,
+                        help="only decode the messages of this device or RTIO "
+                             "channel number (can be given several times)")
+    parser.add_argument("--start", type=int, default=None,
+                        help="only decode the messages from this timestamp "
+                             "(in machine units)")
+    parser.add_argument("--end", type=int, default=None,
+                        help="only decode the messages before this timestamp "
+                             "(in machine units)")
     parser.add_argument("-d", "--write-dump", type=str, default=None,
                         help="write raw dump file")
     return parser
@@ -33,31 +50,57 @@ def main():
     args = get_argparser().parse_args()
     init_logger(args)
 
-    if (not args.print_decoded
-            and args.write_vcd is None and args.write_dump is None):
-        print("No action selected, use -p, -w and/or -d. See -h for help.")
+    if (not args.print_decoded and args.write_vcd is None
+            and args.export is None and args.write_dump is None):
+        print("No action selected, use -p, -w, -e and/or -d. "
+              "See -h for help.")
         sys.exit(1)
 
     device_mgr = DeviceManager(DeviceDB(args.device_db))
+    # The dump is kept in a file and memory-mapped, as it can be larger
+    # than the available memory.
     if args.read_dump:
-        with open(args.read_dump, "rb") as f:
-            dump = f.read()
+        dump_file = open(args.read_dump, "rb")
+        dump = load_dump(dump_file)
+        if args.write_dump:
+            shutil.copyfile(args.read_dump, args.write_dump)
     else:
+        if args.write_dump:
+            dump_file = open(args.write_dump, "w+b")
+        else:
+            dump_file = tempfile.TemporaryFile()
         core_addr = device_mgr.get_desc("core")["arguments"]["host"]
-        dump = get_analyzer_dump(core_addr)
-    decoded_dump = decode_dump(dump)
-    if args.print_decoded:
-        print("Log channel:", decoded_dump.log_channel)
-        print("DDS one-hot:", decoded_dump.dds_onehot_sel)
-        for message in decoded_dump.messages:
-            print(message)
-    if args.write_vcd:
-        with open(args.write_vcd, "w") as f:
-            decoded_dump_to_vcd(f, device_mgr.get_device_db(),
-                                decoded_dump)
-    if args.write_dump:
-        with open(args.write_dump, "wb") as f:
-            f.write(dump)
+        dump = receive_analyzer_dump(core_addr, dump_file)
+    try:
+        decoded_dump = decode_dump(dump)
+        if args.channel is not None:
+            channels = set()
+            for channel in args.channel:
+                try:
+                    channels.add(int(channel))
+                except ValueError:
+                    channels |= get_device_channels(
+                        device_mgr.get_device_db(), channel)
+        else:
+            channels = None
+        if (channels is not None
+                or args.start is not None or args.end is not None):
+            decoded_dump = decoded_dump.filter(channels, args.start,
+                                               args.end)
+        if args.print_decoded:
+            print("Log channel:", decoded_dump.log_channel)
+            print("DDS one-hot:", decoded_dump.dds_onehot_sel)
+            for message in decoded_dump.iter_messages():
+                print(message)
+        if args.write_vcd:
+            with open(args.write_vcd, "w") as f:
+                decoded_dump_to_vcd(f, device_mgr.get_device_db(),
+                                    decoded_dump)
+        if args.export:
+            decoded_dump_to_file(args.export, device_mgr.get_device_db(),
+                                 decoded_dump)
+    finally:
+        dump_file.close()
 
 
 if __name__ == "__main__":
@@ -37,6 +37,11 @@ def get_argparser():
                        help="device database file (default: '%(default)s')")
     group.add_argument("--dataset-db", default="dataset_db.pyon",
                        help="dataset file (default: '%(default)s')")
+    group.add_argument("--dataset-journal", default=False,
+                       action="store_true",
+                       help="append dataset modifications to a journal and "
+                            "only rewrite the dataset file when the journal "
+                            "grows large")
 
     group = parser.add_argument_group("repository")
     group.add_argument(
@@ -45,6 +50,41 @@ def get_argparser():
     group.add_argument(
         "-r", "--repository", default="repository",
         help="path to the repository (default: '%(default)s')")
+    group.add_argument(
+        "--repository-cache", default="repository_cache.pyon",
+        help="file caching the results of repository scans across "
+             "master restarts (default: '%(default)s')")
+    group.add_argument(
+        "--repository-scan-workers", default=4, type=int,
+        help="number of worker processes examining repository files "
+             "in parallel (default: %(default)d)")
+
+    group = parser.add_argument_group("scheduler")
+    group.add_argument(
+        "--verify-rid-index", default=False, action="store_true",
+        help="when recovering the last RID from the results folder, scan all "
+             "result files instead of trusting the RID indices")
+    group.add_argument(
+        "--worker-pool-size", default=0, type=int,
+        help="number of idle worker processes to keep started in advance "
+             "to reduce the latency of starting runs (default: %(default)d)")
+    group.add_argument(
+        "--worker-max-idle-time", default=3600.0, type=float,
+        help="time in seconds after which idle worker processes are "
+             "replaced (default: %(default)s)")
+
+    group = parser.add_argument_group("notifications")
+    group.add_argument(
+        "--dataset-coalesce-window", default=0.05, type=float,
+        help="time in seconds during which dataset modifications are "
+             "collected before being sent to subscribers, so that repeated "
+             "modifications of the same item are sent once; "
+             "0 to disable (default: %(default)s)")
+    group.add_argument(
+        "--notify-max-queue", default=10000, type=int,
+        help="maximum number of messages queued for a notification "
+             "subscriber before it is sent the whole structure again; "
+             "0 for no limit (default: %(default)d)")
 
     log_args(parser)
 
@@ -90,7 +130,7 @@ def main():
         server_broadcast.broadcast("ccb", msg)
 
     device_db = DeviceDB(args.device_db)
-    dataset_db = DatasetDB(args.dataset_db)
+    dataset_db = DatasetDB(args.dataset_db, journal=args.dataset_journal)
     dataset_db.start()
     atexit_register_coroutine(dataset_db.stop)
     worker_handlers = dict()
@@ -99,10 +139,14 @@ def main():
         repo_backend = GitBackend(args.repository)
     else:
         repo_backend = FilesystemBackend(args.repository)
-    experiment_db = ExperimentDB(repo_backend, worker_handlers)
+    experiment_db = ExperimentDB(repo_backend, worker_handlers,
+                                 args.repository_cache,
+                                 args.repository_scan_workers)
     atexit.register(experiment_db.close)
 
-    scheduler = Scheduler(RIDCounter(), worker_handlers, experiment_db)
+    rid_counter = RIDCounter(verify_index=args.verify_rid_index)
+    scheduler = Scheduler(rid_counter, worker_handlers, experiment_db,
+                          args.worker_pool_size, args.worker_max_idle_time)
     scheduler.start()
     atexit_register_coroutine(scheduler.stop)
 
@@ -114,6 +158,7 @@ def main():
         "get_dataset": dataset_db.get,
         "update_dataset": dataset_db.update,
         "scheduler_submit": scheduler.submit,
+        "scheduler_submit_many": scheduler.submit_many,
         "scheduler_delete": scheduler.delete,
         "scheduler_request_termination": scheduler.request_termination,
         "scheduler_get_status": scheduler.get_status,
@@ -139,7 +184,8 @@ def main():
         "datasets": dataset_db.data,
         "explist": experiment_db.explist,
         "explist_status": experiment_db.status
-    })
+    }, coalesce_windows={"datasets": args.dataset_coalesce_window},
+       max_queue_size=args.notify_max_queue or None)
     loop.run_until_complete(server_notify.start(
         bind, args.port_notify))
     atexit_register_coroutine(server_notify.stop)
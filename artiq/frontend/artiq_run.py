@@ -99,6 +99,11 @@ class DummyScheduler:
         logger.info("Submitting: %s, RID=%s", expid, rid)
         return rid
 
+    def submit_many(self, pipeline_name=None, expids=None, priority=None,
+                    due_date=None, flush=False):
+        return [self.submit(pipeline_name, expid, priority, due_date, flush)
+                for expid in expids]
+
     def delete(self, rid):
         logger.info("Deleting RID %s", rid)
 
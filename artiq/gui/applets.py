@@ -13,6 +13,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from artiq.protocols.pipe_ipc import AsyncioParentComm
 from artiq.protocols.logging import LogParser
 from artiq.protocols import pyon
+from artiq.protocols.sync_struct import filter_mod
 from artiq.gui.tools import QDockWidgetCloseDetect, LayoutWidget
 
 
@@ -41,12 +42,9 @@ class AppletIPCServer(AsyncioParentComm):
         if mod["action"] == "init":
             mod = self._synthesize_init(mod["struct"])
         else:
-            if mod["path"]:
-                if mod["path"][0] not in self.datasets:
-                    return
-            elif mod["action"] in {"setitem", "delitem"}:
-                if mod["key"] not in self.datasets:
-                    return
+            mod = filter_mod(mod, [[dataset] for dataset in self.datasets])
+            if mod is None:
+                return
         self.write_pyon({"action": "mod", "mod": mod})
 
     async def serve(self, embed_cb, fix_initial_size_cb):
@@ -1,10 +1,22 @@
 import asyncio
+import copy
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+import numpy
+import h5py
 
 from artiq.protocols.sync_struct import Notifier, process_mod
 from artiq.protocols import pyon
 from artiq.tools import TaskObject
 
 
+logger = logging.getLogger(__name__)
+
+
 def device_db_from_file(filename):
     glbs = dict()
     with open(filename, "r") as f:
@@ -34,35 +46,382 @@ class DeviceDB:
         return self.data.read[key]
 
 
+def _is_hdf5(filename):
+    return os.path.splitext(filename)[1] in {".h5", ".hdf5"}
+
+
+def _file_digest(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_datasets(filename, data):
+    # Writes a temporary file next to the dataset file, to be renamed over it.
+    # Returns the name of the temporary file and a digest of its contents.
+    directory = os.path.abspath(os.path.dirname(filename))
+    with tempfile.NamedTemporaryFile("wb", dir=directory,
+                                     delete=False) as f:
+        tmpname = f.name
+        if not _is_hdf5(filename):
+            contents = (pyon.encode(data, True) + "\n").encode()
+            f.write(contents)
+    if _is_hdf5(filename):
+        # Arrays are stored as HDF5 datasets, everything else as PYON.
+        other = dict()
+        with h5py.File(tmpname, "w") as h5:
+            arrays = h5.create_group("arrays")
+            for key, value in data.items():
+                if (isinstance(value, numpy.ndarray)
+                        and value.dtype.kind in "biufc"
+                        and "/" not in key and key != "."):
+                    arrays[key] = value
+                else:
+                    other[key] = value
+            h5["pyon"] = pyon.encode(other)
+        digest = _file_digest(tmpname)
+    else:
+        digest = hashlib.sha1(contents).hexdigest()
+    return tmpname, digest
+
+
+def _load_datasets(filename):
+    # Returns the datasets in the file and a digest of its contents.
+    if _is_hdf5(filename):
+        digest = _file_digest(filename)
+        with h5py.File(filename, "r") as h5:
+            data = pyon.decode(h5["pyon"][()])
+            for key, value in h5["arrays"].items():
+                data[key] = value[()]
+        return data, digest
+    else:
+        with open(filename, "rb") as f:
+            contents = f.read()
+        return (pyon.decode(contents.decode()),
+                hashlib.sha1(contents).hexdigest())
+
+
+class _Journal:
+    """Append-only log of the modifications of the persistent datasets since
+    the dataset file was written.
+
+    The log starts with the digest of the dataset file it applies to, so
+    that a log left over from before the file was last written is ignored.
+    The log of a new dataset file is written (as ``filename`` with
+    ``.pending`` appended) before the dataset file is replaced, and only
+    renamed over the current log afterwards.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.pending_filename = filename + ".pending"
+        self.file = None
+        self.size = 0
+        self.pending_size = 0
+
+    @staticmethod
+    def _read(filename, digest):
+        # Returns the contents of the log if it belongs to the dataset file
+        # with the given digest, None otherwise.
+        try:
+            with open(filename, "rb") as f:
+                contents = f.read()
+        except FileNotFoundError:
+            return None
+        header = pyon.binary_frame_header
+        if len(contents) < header.size:
+            return None
+        length, = header.unpack_from(contents, 0)
+        if len(contents) < header.size + length:
+            return None
+        obj = pyon.decode_binary(contents[header.size:header.size + length])
+        if obj != {"snapshot": digest}:
+            return None
+        return contents
+
+    def replay(self, digest, data):
+        """Applies the modifications in the log to ``data`` if the log belongs
+        to the dataset file with the given digest, and opens the log for
+        appending. Otherwise, starts a new log."""
+        contents = self._read(self.pending_filename, digest)
+        if contents is not None:
+            # The dataset file was replaced but not its log.
+            os.replace(self.pending_filename, self.filename)
+        else:
+            try:
+                os.unlink(self.pending_filename)
+            except FileNotFoundError:
+                pass
+            contents = self._read(self.filename, digest)
+        if contents is None:
+            self.reset(digest)
+            return 0
+
+        header = pyon.binary_frame_header
+        length, = header.unpack_from(contents, 0)
+        offset = header.size + length
+        count = 0
+        while len(contents) - offset >= header.size:
+            length, = header.unpack_from(contents, offset)
+            end = offset + header.size + length
+            if end > len(contents):
+                break
+            process_mod(data, pyon.decode_binary(
+                contents[offset + header.size:end]))
+            count += 1
+            offset = end
+        if offset < len(contents):
+            logger.warning("ignoring truncated record at the end of "
+                           "dataset journal %s", self.filename)
+            os.truncate(self.filename, offset)
+        self.file = open(self.filename, "ab")
+        self.size = offset
+        return count
+
+    def prepare(self, digest, frames=()):
+        """Writes the log for the dataset file with the given digest,
+        containing the given already encoded records, to be installed by
+        ``commit`` once the dataset file is in place."""
+        header = pyon.encode_binary_frame({"snapshot": digest})
+        directory = os.path.abspath(os.path.dirname(self.filename))
+        with tempfile.NamedTemporaryFile("wb", dir=directory,
+                                         delete=False) as f:
+            f.write(header)
+            for frame in frames:
+                f.write(frame)
+            self.pending_size = f.tell()
+            tmpname = f.name
+        os.replace(tmpname, self.pending_filename)
+
+    def commit(self):
+        """Replaces the log with the one written by ``prepare``."""
+        self.close()
+        os.replace(self.pending_filename, self.filename)
+        self.size = self.pending_size
+        self.file = open(self.filename, "ab")
+
+    def reset(self, digest, frames=()):
+        """Starts a new log for the dataset file with the given digest,
+        containing the given already encoded records."""
+        self.prepare(digest, frames)
+        self.commit()
+
+    def append(self, mod):
+        """Appends a record and returns its encoding."""
+        frame = pyon.encode_binary_frame(mod)
+        self.file.write(frame)
+        self.file.flush()
+        self.size += len(frame)
+        return frame
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
 class DatasetDB(TaskObject):
-    def __init__(self, persist_file, autosave_period=30):
+    """Master-side dataset database.
+
+    :param persist_file: file storing the persistent datasets. Files with a
+        ``.h5`` or ``.hdf5`` extension use HDF5, with array values stored as
+        HDF5 datasets; other files use PYON.
+    :param autosave_period: period in seconds at which the file is written.
+        With the journal, this is the period at which the journal size is
+        checked.
+    :param journal: if ``True``, modifications of persistent datasets are
+        appended to a journal (``persist_file`` with ``.journal`` appended)
+        instead of periodically rewriting the whole file. The file is only
+        rewritten, and the journal cleared, when the journal becomes larger
+        than both ``journal_compact_size`` (in bytes) and the file.
+        At startup, the journal is replayed on top of the file.
+
+    The file is written in a thread, from a copy-on-write view of the
+    persistent datasets: values modified in place while the file is being
+    written are copied first. ``get_snapshot_stats`` returns the duration
+    and size of the last snapshot.
+    """
+    def __init__(self, persist_file, autosave_period=30, journal=False,
+                 journal_compact_size=16*1024*1024):
         self.persist_file = persist_file
         self.autosave_period = autosave_period
+        self.journal_compact_size = journal_compact_size
 
         try:
-            file_data = pyon.load_file(self.persist_file)
+            file_data, digest = _load_datasets(self.persist_file)
+            self._file_size = os.path.getsize(self.persist_file)
         except FileNotFoundError:
-            file_data = dict()
+            file_data, digest = dict(), None
+            self._file_size = 0
+        if journal:
+            self._journal = _Journal(self.persist_file + ".journal")
+            count = self._journal.replay(digest, file_data)
+            if count:
+                logger.info("replayed %d dataset modifications from journal",
+                            count)
+        else:
+            self._journal = None
         self.data = Notifier({k: (True, v) for k, v in file_data.items()})
 
-    def save(self):
+        # keys whose values are shared with the snapshot being written
+        self._shared = set()
+        # journal records written since the snapshot was taken
+        self._snapshot_records = None
+        self._snapshot_future = None
+        self._snapshot_stats = {
+            "count": 0,
+            "last_time": None,
+            "last_duration": None,
+            "max_duration": None,
+            "last_size": None
+        }
+
+    def _take_snapshot(self):
         data = {k: v[1] for k, v in self.data.read.items() if v[0]}
-        pyon.store_file(self.persist_file, data)
+        self._shared = set(data)
+        if self._journal is not None:
+            self._snapshot_records = []
+        return data
+
+    def _end_snapshot(self):
+        self._shared = set()
+        self._snapshot_records = None
+
+    def _commit_snapshot(self, tmpname, digest, start):
+        if self._journal is not None:
+            # The records written since the snapshot was taken must survive
+            # a crash right after the dataset file is replaced.
+            try:
+                self._journal.prepare(digest, self._snapshot_records)
+            except:
+                os.unlink(tmpname)
+                self._end_snapshot()
+                raise
+        os.replace(tmpname, self.persist_file)
+        self._file_size = os.path.getsize(self.persist_file)
+        if self._journal is not None:
+            self._journal.commit()
+        self._end_snapshot()
+
+        duration = time.monotonic() - start
+        stats = self._snapshot_stats
+        stats["count"] += 1
+        stats["last_time"] = time.time()
+        stats["last_duration"] = duration
+        if stats["max_duration"] is None or duration > stats["max_duration"]:
+            stats["max_duration"] = duration
+        stats["last_size"] = self._file_size
+
+    def save(self):
+        """Writes the persistent datasets to the file, blocking."""
+        start = time.monotonic()
+        data = self._take_snapshot()
+        try:
+            tmpname, digest = _write_datasets(self.persist_file, data)
+        except:
+            self._end_snapshot()
+            raise
+        self._commit_snapshot(tmpname, digest, start)
+
+    async def save_async(self):
+        """Writes the persistent datasets to the file in a thread, without
+        blocking the event loop."""
+        start = time.monotonic()
+        data = self._take_snapshot()
+        loop = asyncio.get_event_loop()
+        self._snapshot_future = loop.run_in_executor(
+            None, _write_datasets, self.persist_file, data)
+        try:
+            tmpname, digest = await asyncio.shield(self._snapshot_future)
+        except:
+            self._end_snapshot()
+            raise
+        else:
+            self._snapshot_future = None
+        self._commit_snapshot(tmpname, digest, start)
+
+    def get_snapshot_stats(self):
+        """Returns the number of snapshots written, and the time (as a UNIX
+        timestamp), duration (in seconds) and file size (in bytes) of the
+        last one."""
+        return dict(self._snapshot_stats)
+
+    def _compaction_due(self):
+        return self._journal.size > max(self.journal_compact_size,
+                                        self._file_size)
 
     async def _do(self):
         try:
             while True:
                 await asyncio.sleep(self.autosave_period)
-                self.save()
+                if self._journal is None or self._compaction_due():
+                    await self.save_async()
         finally:
-            self.save()
+            if self._snapshot_future is not None:
+                # Cancelled while writing: let the thread finish and discard
+                # its file.
+                try:
+                    tmpname, digest = await self._snapshot_future
+                except:
+                    pass
+                else:
+                    os.unlink(tmpname)
+                self._snapshot_future = None
+            if self._journal is None:
+                self.save()
+            else:
+                self._journal.close()
 
     def get(self, key):
         return self.data.read[key][1]
 
+    def _persistent(self, key):
+        entry = self.data.read.get(key)
+        return entry is not None and entry[0]
+
     def update(self, mod):
+        path = mod["path"]
+        if path:
+            keys = [path[0]]
+            if path[0] in self._shared:
+                # Copy on write: the snapshot being written keeps the
+                # original value.
+                persist, value = self.data.read[path[0]]
+                self.data.read[path[0]] = (persist, copy.deepcopy(value))
+                self._shared.discard(path[0])
+        else:
+            if mod["action"] == "update":
+                keys = list(mod["x"])
+            else:
+                keys = [mod["key"]]
+            self._shared.difference_update(keys)
+
+        if self._journal is None:
+            process_mod(self.data, mod)
+            return
+
+        persistent = {key: self._persistent(key) for key in keys}
         process_mod(self.data, mod)
 
+        # The journal contains modifications of the persistent datasets only,
+        # as {key: value} (without the persist flag).
+        for key in keys:
+            if self._persistent(key):
+                if persistent[key] and path[1:2] == [1]:
+                    self._log(dict(mod, path=[key] + path[2:]))
+                else:
+                    self._log({"action": "setitem", "path": [], "key": key,
+                               "value": self.data.read[key][1]})
+            elif persistent[key]:
+                self._log({"action": "delitem", "path": [], "key": key})
+
+    def _log(self, mod):
+        frame = self._journal.append(mod)
+        if self._snapshot_records is not None:
+            # Also goes into the journal of the snapshot being written.
+            self._snapshot_records.append(frame)
+
     # convenience functions (update() can be used instead)
     def set(self, key, value, persist=None):
         if persist is None:
@@ -70,8 +429,9 @@ class DatasetDB(TaskObject):
                 persist = self.data.read[key][0]
             else:
                 persist = False
-        self.data[key] = (persist, value)
+        self.update({"action": "setitem", "path": [], "key": key,
+                     "value": (persist, value)})
 
     def delete(self, key):
-        del self.data[key]
+        self.update({"action": "delitem", "path": [], "key": key})
     #
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import os
 import tempfile
 import shutil
@@ -6,27 +7,93 @@ import time
 import logging
 
 from artiq.protocols.sync_struct import Notifier
+from artiq.protocols import pyon
 from artiq.master.worker import (Worker, WorkerInternalException,
                                  log_worker_exception)
 from artiq.tools import get_windows_drives, exc_to_warning
+from artiq import __version__ as artiq_version
 
 
 logger = logging.getLogger(__name__)
 
 
+def _content_key(data):
+    # Same as the Git blob ID of a file with this contents, so that the cache
+    # is shared between the filesystem and Git backends.
+    h = hashlib.sha1()
+    h.update("blob {}\0".format(len(data)).encode())
+    h.update(data)
+    return h.hexdigest()
+
+
 class _RepoScanner:
-    def __init__(self, worker_handlers):
+    def __init__(self, worker_handlers, cache=None, max_workers=1):
         self.worker_handlers = worker_handlers
-        self.worker = None
+        self.max_workers = max_workers
+        # content key -> description returned by the worker
+        self.cache = dict() if cache is None else cache
+        self.used_keys = set()
+        # file name -> time taken by the worker to examine it
+        self.timings = dict()
+
+    def _list_files(self, root, subdir=""):
+        r = []
+        for de in sorted(os.scandir(os.path.join(root, subdir)),
+                         key=lambda de: de.name):
+            if de.name.startswith("."):
+                continue
+            if de.is_file() and de.name.endswith(".py"):
+                r.append(os.path.join(subdir, de.name))
+            if de.is_dir():
+                r += self._list_files(root, os.path.join(subdir, de.name))
+        return r
 
-    async def process_file(self, entry_dict, root, filename):
-        logger.debug("processing file %s %s", root, filename)
-        try:
-            description = await self.worker.examine(
-                "scan", os.path.join(root, filename))
-        except:
-            log_worker_exception()
-            raise
+    async def _examine_files(self, root, filenames):
+        descriptions = dict()
+        filenames = iter(filenames)
+
+        async def examine_next():
+            worker = None
+            try:
+                for filename in filenames:
+                    logger.debug("processing file %s %s", root, filename)
+                    path = os.path.join(root, filename)
+                    try:
+                        with open(path, "rb") as f:
+                            key = _content_key(f.read())
+                        self.used_keys.add(key)
+                        if key not in self.cache:
+                            if worker is None:
+                                worker = Worker(self.worker_handlers)
+                            t1 = time.monotonic()
+                            try:
+                                description = await worker.examine(
+                                    "scan", path)
+                            except:
+                                log_worker_exception()
+                                raise
+                            self.timings[filename] = time.monotonic() - t1
+                            logger.debug("examined file %s in %.3f seconds",
+                                         filename, self.timings[filename])
+                            self.cache[key] = description
+                        descriptions[filename] = self.cache[key]
+                    except Exception as exc:
+                        logger.warning("Skipping file '%s'", filename,
+                            exc_info=not isinstance(
+                                exc, WorkerInternalException))
+                        # restart worker
+                        if worker is not None:
+                            await worker.close()
+                            worker = None
+            finally:
+                if worker is not None:
+                    await worker.close()
+
+        await asyncio.gather(*[examine_next()
+                               for _ in range(self.max_workers)])
+        return descriptions
+
+    def process_file(self, entry_dict, filename, description):
         for class_name, class_desc in description.items():
             name = class_desc["name"]
             arginfo = class_desc["arginfo"]
@@ -50,34 +117,28 @@ class _RepoScanner:
             }
             entry_dict[name] = entry
 
-    async def _scan(self, root, subdir=""):
-        entry_dict = dict()
-        for de in os.scandir(os.path.join(root, subdir)):
-            if de.name.startswith("."):
-                continue
-            if de.is_file() and de.name.endswith(".py"):
-                filename = os.path.join(subdir, de.name)
-                try:
-                    await self.process_file(entry_dict, root, filename)
-                except Exception as exc:
-                    logger.warning("Skipping file '%s'", filename,
-                        exc_info=not isinstance(exc, WorkerInternalException))
-                    # restart worker
-                    await self.worker.close()
-                    self.worker = Worker(self.worker_handlers)
-            if de.is_dir():
-                subentries = await self._scan(
-                    root, os.path.join(subdir, de.name))
-                entries = {de.name + "/" + k: v for k, v in subentries.items()}
-                entry_dict.update(entries)
-        return entry_dict
-
     async def scan(self, root):
-        self.worker = Worker(self.worker_handlers)
-        try:
-            r = await self._scan(root)
-        finally:
-            await self.worker.close()
+        filenames = self._list_files(root)
+        descriptions = await self._examine_files(root, filenames)
+
+        # Experiment names only need to be unique within a directory.
+        # Resolve duplicates in file name order, regardless of the order in
+        # which the workers have completed.
+        dir_entries = dict()
+        for filename in filenames:
+            if filename in descriptions:
+                entry_dict = dir_entries.setdefault(
+                    os.path.dirname(filename), dict())
+                self.process_file(entry_dict, filename, descriptions[filename])
+        r = dict()
+        for dirname, entry_dict in dir_entries.items():
+            prefix = "".join(p + "/" for p in dirname.split(os.sep) if p)
+            for name, entry in entry_dict.items():
+                r[prefix + name] = entry
+
+        # drop the descriptions of files that no longer exist
+        for key in set(self.cache.keys()) - self.used_keys:
+            del self.cache[key]
         return r
 
 
@@ -91,20 +152,77 @@ def _sync_explist(target, source):
 
 
 class ExperimentDB:
-    def __init__(self, repo_backend, worker_handlers):
+    """Maintains the list of experiments in the repository.
+
+    The results of examining each file are cached by file contents, so that
+    a repository scan only starts workers for files that have changed.
+    If ``cache_file`` is given, the cache and the last experiment list are
+    persisted there, and the experiment list is available immediately after
+    the master restarts while the repository is being scanned again.
+
+    The cache file is ignored if it was written by another version of
+    ARTIQ, as the results of examining a file depend on the ARTIQ modules
+    it imports.
+
+    Note that the cache does not track dependencies between files: a file
+    whose contents are unchanged is not examined again when a module it
+    imports from the repository is modified.
+
+    Files that are not in the cache are examined by up to ``scan_workers``
+    worker processes in parallel.
+    """
+    def __init__(self, repo_backend, worker_handlers, cache_file=None,
+                 scan_workers=1):
         self.repo_backend = repo_backend
         self.worker_handlers = worker_handlers
+        self.cache_file = cache_file
+        self.scan_workers = scan_workers
 
         self.cur_rev = self.repo_backend.get_head_rev()
         self.repo_backend.request_rev(self.cur_rev)
         self.explist = Notifier(dict())
+        self._scan_cache = dict()
         self._scanning = False
+        self._load_cache()
 
         self.status = Notifier({
             "scanning": False,
             "cur_rev": self.cur_rev
         })
 
+    def _load_cache(self):
+        if self.cache_file is None:
+            return
+        try:
+            file_data = pyon.load_file(self.cache_file)
+        except FileNotFoundError:
+            return
+        except:
+            logger.warning("failed to load repository cache from '%s'",
+                           self.cache_file, exc_info=True)
+            return
+        if file_data.get("artiq_version") != artiq_version:
+            logger.info("ignoring repository cache from another version "
+                        "of ARTIQ")
+            return
+        self._scan_cache = file_data["descriptions"]
+        if file_data["rev"] == self.cur_rev:
+            _sync_explist(self.explist, file_data["explist"])
+
+    def _save_cache(self):
+        if self.cache_file is None:
+            return
+        try:
+            pyon.store_file(self.cache_file, {
+                "artiq_version": artiq_version,
+                "rev": self.cur_rev,
+                "explist": self.explist.read,
+                "descriptions": self._scan_cache
+            })
+        except:
+            logger.warning("failed to save repository cache to '%s'",
+                           self.cache_file, exc_info=True)
+
     def close(self):
         # The object cannot be used anymore after calling this method.
         self.repo_backend.release_rev(self.cur_rev)
@@ -122,10 +240,21 @@ class ExperimentDB:
             self.cur_rev = new_cur_rev
             self.status["cur_rev"] = new_cur_rev
             t1 = time.monotonic()
-            new_explist = await _RepoScanner(self.worker_handlers).scan(wd)
-            logger.info("repository scan took %d seconds", time.monotonic()-t1)
+            scanner = _RepoScanner(self.worker_handlers, self._scan_cache,
+                                   self.scan_workers)
+            new_explist = await scanner.scan(wd)
+            logger.info("repository scan took %d seconds, "
+                        "%d file(s) examined", time.monotonic()-t1,
+                        len(scanner.timings))
+            slowest = sorted(scanner.timings.items(),
+                             key=lambda e: e[1], reverse=True)[:5]
+            if slowest:
+                logger.info("slowest files to examine: %s",
+                            ", ".join("{} ({:.1f}s)".format(*e)
+                                      for e in slowest))
 
             _sync_explist(self.explist, new_explist)
+            self._save_cache()
         finally:
             self._scanning = False
             self.status["scanning"] = False
@@ -1,9 +1,10 @@
 import asyncio
+import heapq
 import logging
 from enum import Enum
 from time import time
 
-from artiq.master.worker import Worker, log_worker_exception
+from artiq.master.worker import Worker, WorkerPool, log_worker_exception
 from artiq.tools import asyncio_wait_or_cancel, TaskObject, Condition
 from artiq.protocols.sync_struct import Notifier
 
@@ -57,6 +58,7 @@ class Run:
         self.flush = flush
 
         self.worker = Worker(pool.worker_handlers)
+        self._worker_pool = pool.worker_pool
         self.termination_requested = False
 
         self._status = RunStatus.pending
@@ -70,8 +72,10 @@ class Run:
             "status": self._status.name
         }
         notification.update(kwargs)
+        # published by the pool
+        self.notification = notification
         self._notifier = pool.notifier
-        self._notifier[self.rid] = notification
+        self._pool_status_changed = pool.status_changed
         self._state_changed = pool.state_changed
 
     @property
@@ -83,6 +87,7 @@ class Run:
         self._status = value
         if not self.worker.closed.is_set():
             self._notifier[self.rid]["status"] = self._status.name
+        self._pool_status_changed(self)
         self._state_changed.notify()
 
     # The run with the largest priority_key is to be scheduled first
@@ -105,6 +110,13 @@ class Run:
     _build = _mk_worker_method("build")
 
     async def build(self):
+        if self.worker.ipc is None and not self.worker.closed.is_set():
+            # Our own worker has not started its process yet and the run
+            # has not been deleted (which closes the worker); replace it
+            # with a pre-started one if available.
+            worker = self._worker_pool.claim()
+            if worker is not None:
+                self.worker = worker
         await self._build(self.rid, self.pipeline_name,
                           self.wd, self.expid,
                           self.priority)
@@ -116,32 +128,95 @@ class Run:
     write_results = _mk_worker_method("write_results")
 
 
+def _heap_key(run):
+    # heapq returns the smallest entry first
+    return tuple(-k for k in run.priority_key())
+
+
 class RunPool:
-    def __init__(self, ridc, worker_handlers, notifier, experiment_db):
+    def __init__(self, ridc, worker_handlers, worker_pool, notifier,
+                 experiment_db):
         self.runs = dict()
         self.state_changed = Condition()
 
+        # Heaps of (_heap_key(run), run) for the statuses that the stages
+        # select runs from. Entries are removed lazily: a run that has left
+        # the status is discarded once it reaches the top of the heap.
+        self._queues = {status: [] for status in (RunStatus.pending,
+                                                  RunStatus.prepare_done,
+                                                  RunStatus.run_done)}
+        # Pending runs with a due date in the future are kept in
+        # _waiting (by priority) and in _timed (by due date), and moved to
+        # the pending queue once they are due.
+        self._waiting = []
+        self._timed = []
+
         self.ridc = ridc
         self.worker_handlers = worker_handlers
+        self.worker_pool = worker_pool
         self.notifier = notifier
         self.experiment_db = experiment_db
 
     def submit(self, expid, priority, due_date, flush, pipeline_name):
         # mutates expid to insert head repository revision if None.
         # called through scheduler.
-        rid = self.ridc.get()
+        run = self._create_run(self.ridc.get(), expid, priority, due_date,
+                               flush, pipeline_name)
+        self.notifier[run.rid] = run.notification
+        self.state_changed.notify()
+        return run.rid
+
+    def submit_many(self, expids, priority, due_date, flush, pipeline_name):
+        # mutates expids to insert head repository revision if None.
+        # called through scheduler.
+        # Nothing is added to the pool unless all the runs can be created.
+        taken = []
+        try:
+            for expid in expids:
+                taken.append((expid, self._request_rev(expid)))
+            runs = [Run(rid, pipeline_name, wd, expid, priority, due_date,
+                        flush, self, repo_msg=repo_msg)
+                    for rid, (expid, (wd, repo_msg)) in zip(
+                        self.ridc.get_many(len(expids)), taken)]
+        except:
+            for expid, _ in taken:
+                self._release_rev(expid)
+            raise
+        for run in runs:
+            self._add_run(run)
+        self.notifier.update({run.rid: run.notification for run in runs})
+        self.state_changed.notify()
+        return [run.rid for run in runs]
+
+    def _request_rev(self, expid):
         if "repo_rev" in expid:
             if expid["repo_rev"] is None:
                 expid["repo_rev"] = self.experiment_db.cur_rev
-            wd, repo_msg = self.experiment_db.repo_backend.request_rev(
+            return self.experiment_db.repo_backend.request_rev(
                 expid["repo_rev"])
         else:
-            wd, repo_msg = None, None
+            return None, None
+
+    def _release_rev(self, expid):
+        if "repo_rev" in expid:
+            self.experiment_db.repo_backend.release_rev(expid["repo_rev"])
+
+    def _create_run(self, rid, expid, priority, due_date, flush,
+                    pipeline_name):
+        wd, repo_msg = self._request_rev(expid)
         run = Run(rid, pipeline_name, wd, expid, priority, due_date, flush,
                   self, repo_msg=repo_msg)
-        self.runs[rid] = run
-        self.state_changed.notify()
-        return rid
+        self._add_run(run)
+        return run
+
+    def _add_run(self, run):
+        self.runs[run.rid] = run
+        if run.due_date is None:
+            heapq.heappush(self._queues[RunStatus.pending],
+                           (_heap_key(run), run))
+        else:
+            heapq.heappush(self._waiting, (_heap_key(run), run))
+            heapq.heappush(self._timed, (run.due_date, run.rid, run))
 
     async def delete(self, rid):
         # called through deleter
@@ -149,9 +224,62 @@ class RunPool:
             return
         run = self.runs[rid]
         await run.close()
-        if "repo_rev" in run.expid:
-            self.experiment_db.repo_backend.release_rev(run.expid["repo_rev"])
+        self._release_rev(run.expid)
         del self.runs[rid]
+        self._compact()
+
+    def status_changed(self, run):
+        # called through run
+        if run.status in self._queues:
+            heapq.heappush(self._queues[run.status], (_heap_key(run), run))
+
+    def _compact(self):
+        # Drop the stale entries that are not at the top of their heaps, so
+        # that the heaps do not grow without bounds. There are at most two
+        # valid entries per run.
+        if (sum(len(heap) for heap in self._queues.values())
+                + len(self._waiting) + len(self._timed)
+                <= 4*len(self.runs) + 64):
+            return
+        now = time()
+        for status, heap in self._queues.items():
+            heap[:] = [entry for entry in heap if entry[-1].status == status]
+        self._waiting[:] = [entry for entry in self._waiting
+                            if entry[-1].status == RunStatus.pending
+                            and not entry[-1].due_date < now]
+        self._timed[:] = [entry for entry in self._timed
+                          if entry[-1].status == RunStatus.pending]
+        for heap in list(self._queues.values()) + [self._waiting, self._timed]:
+            heapq.heapify(heap)
+
+    @staticmethod
+    def _top(heap, valid):
+        while heap:
+            run = heap[0][-1]
+            if valid(run):
+                return run
+            heapq.heappop(heap)
+        return None
+
+    def top_run(self, status):
+        """Returns the run with the given status and the largest
+        ``priority_key()``, or None if there is no such run."""
+        return self._top(self._queues[status], lambda r: r.status == status)
+
+    def top_pending_run(self, now):
+        """Returns the pending run with the largest ``priority_key(now)``,
+        or None if there is no pending run."""
+        while self._timed and self._timed[0][0] < now:
+            _, _, run = heapq.heappop(self._timed)
+            if run.status == RunStatus.pending:
+                heapq.heappush(self._queues[RunStatus.pending],
+                               (_heap_key(run), run))
+        run = self.top_run(RunStatus.pending)
+        if run is None:
+            run = self._top(self._waiting,
+                            lambda r: (r.status == RunStatus.pending
+                                       and not r.due_date < now))
+        return run
 
 
 class PrepareStage(TaskObject):
@@ -164,23 +292,12 @@ class PrepareStage(TaskObject):
         Otherwise, return a float representing the time before the next timed
         run becomes due, or None if there is no such run."""
         now = time()
-        pending_runs = filter(lambda r: r.status == RunStatus.pending,
-                              self.pool.runs.values())
-        try:
-            candidate = max(pending_runs, key=lambda r: r.priority_key(now))
-        except ValueError:
-            # pending_runs is an empty sequence
+        candidate = self.pool.top_pending_run(now)
+        if candidate is None:
             return None
 
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            top_prepared_run = max(prepared_runs,
-                                   key=lambda r: r.priority_key())
-        except ValueError:
-            # there are no existing prepared runs - go ahead with <candidate>
-            pass
-        else:
+        top_prepared_run = self.pool.top_run(RunStatus.prepare_done)
+        if top_prepared_run is not None:
             # prepare <candidate> (as well) only if it has higher priority than
             # the highest priority prepared run
             if top_prepared_run.priority_key() >= candidate.priority_key():
@@ -234,14 +351,7 @@ class RunStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            r = max(prepared_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # prepared_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.top_run(RunStatus.prepare_done)
 
     async def _do(self):
         stack = []
@@ -288,14 +398,7 @@ class AnalyzeStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        run_runs = filter(lambda r: r.status == RunStatus.run_done,
-                          self.pool.runs.values())
-        try:
-            r = max(run_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # run_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.top_run(RunStatus.run_done)
 
     async def _do(self):
         while True:
@@ -319,8 +422,10 @@ class AnalyzeStage(TaskObject):
 
 
 class Pipeline:
-    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db):
-        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db)
+    def __init__(self, ridc, deleter, worker_handlers, worker_pool, notifier,
+                 experiment_db):
+        self.pool = RunPool(ridc, worker_handlers, worker_pool, notifier,
+                            experiment_db)
         self._prepare = PrepareStage(self.pool, deleter.delete)
         self._run = RunStage(self.pool, deleter.delete)
         self._analyze = AnalyzeStage(self.pool, deleter.delete)
@@ -338,28 +443,28 @@ class Pipeline:
 
 
 class Deleter(TaskObject):
-    def __init__(self, pipelines):
+    def __init__(self, pipelines, rid_pipelines):
         self._pipelines = pipelines
+        self._rid_pipelines = rid_pipelines
         self._queue = asyncio.Queue()
 
     def delete(self, rid):
         logger.debug("delete request for RID %d", rid)
-        for pipeline in self._pipelines.values():
-            if rid in pipeline.pool.runs:
-                pipeline.pool.runs[rid].status = RunStatus.deleting
-                break
+        pipeline = self._rid_pipelines.get(rid)
+        if pipeline is not None:
+            pipeline.pool.runs[rid].status = RunStatus.deleting
         self._queue.put_nowait(rid)
 
     async def join(self):
         await self._queue.join()
 
     async def _delete(self, rid):
-        for pipeline in self._pipelines.values():
-            if rid in pipeline.pool.runs:
-                logger.debug("deleting RID %d...", rid)
-                await pipeline.pool.delete(rid)
-                logger.debug("deletion of RID %d completed", rid)
-                break
+        pipeline = self._rid_pipelines.get(rid)
+        if pipeline is not None:
+            logger.debug("deleting RID %d...", rid)
+            await pipeline.pool.delete(rid)
+            del self._rid_pipelines[rid]
+            logger.debug("deletion of RID %d completed", rid)
 
     async def _gc_pipelines(self):
         pipeline_names = list(self._pipelines.keys())
@@ -380,19 +485,25 @@ class Deleter(TaskObject):
 
 
 class Scheduler:
-    def __init__(self, ridc, worker_handlers, experiment_db):
+    def __init__(self, ridc, worker_handlers, experiment_db,
+                 worker_pool_size=0, worker_max_idle_time=3600.0):
         self.notifier = Notifier(dict())
 
         self._pipelines = dict()
         self._worker_handlers = worker_handlers
+        self._worker_pool = WorkerPool(worker_handlers, worker_pool_size,
+                                       worker_max_idle_time)
         self._experiment_db = experiment_db
         self._terminated = False
 
         self._ridc = ridc
-        self._deleter = Deleter(self._pipelines)
+        # RID -> pipeline of the runs that have not been deleted yet
+        self._rid_pipelines = dict()
+        self._deleter = Deleter(self._pipelines, self._rid_pipelines)
 
     def start(self):
         self._deleter.start()
+        self._worker_pool.start()
 
     async def stop(self):
         # NB: restart of a stopped scheduler is not supported
@@ -402,6 +513,7 @@ class Scheduler:
                 self._deleter.delete(rid)
         await self._deleter.join()
         await self._deleter.stop()
+        await self._worker_pool.stop()
         if self._pipelines:
             logger.warning("some pipelines were not garbage-collected")
 
@@ -414,16 +526,45 @@ class Scheduler:
         # mutates expid to insert head repository revision if None
         if self._terminated:
             return
+        pipeline = self._get_pipeline(pipeline_name)
+        rid = pipeline.pool.submit(expid, priority, due_date, flush,
+                                   pipeline_name)
+        self._rid_pipelines[rid] = pipeline
+        return rid
+
+    def submit_many(self, pipeline_name, expids, priority=0, due_date=None,
+                    flush=False):
+        """Submits several runs with the same pipeline, priority, due date
+        and flush setting, e.g. the points of a parameter sweep.
+
+        This is equivalent to calling ``submit`` for each element of
+        ``expids`` in turn, but the RIDs are allocated and the new runs are
+        published to the schedule in one step.
+
+        Returns the list of the RIDs of the new runs."""
+        # mutates expids to insert head repository revision if None
+        if self._terminated:
+            return
+        if not expids:
+            return []
+        pipeline = self._get_pipeline(pipeline_name)
+        rids = pipeline.pool.submit_many(expids, priority, due_date, flush,
+                                         pipeline_name)
+        for rid in rids:
+            self._rid_pipelines[rid] = pipeline
+        return rids
+
+    def _get_pipeline(self, pipeline_name):
         try:
-            pipeline = self._pipelines[pipeline_name]
+            return self._pipelines[pipeline_name]
         except KeyError:
             logger.debug("creating pipeline '%s'", pipeline_name)
             pipeline = Pipeline(self._ridc, self._deleter,
-                                self._worker_handlers, self.notifier,
-                                self._experiment_db)
+                                self._worker_handlers, self._worker_pool,
+                                self.notifier, self._experiment_db)
             self._pipelines[pipeline_name] = pipeline
             pipeline.start()
-        return pipeline.pool.submit(expid, priority, due_date, flush, pipeline_name)
+            return pipeline
 
     def delete(self, rid):
         """Kills the run with the specified RID."""
@@ -431,14 +572,13 @@ class Scheduler:
 
     def request_termination(self, rid):
         """Requests graceful termination of the run with the specified RID."""
-        for pipeline in self._pipelines.values():
-            if rid in pipeline.pool.runs:
-                run = pipeline.pool.runs[rid]
-                if run.status == RunStatus.running or run.status == RunStatus.paused:
-                    run.termination_requested = True
-                else:
-                    self.delete(rid)
-                break
+        pipeline = self._rid_pipelines.get(rid)
+        if pipeline is not None:
+            run = pipeline.pool.runs[rid]
+            if run.status == RunStatus.running or run.status == RunStatus.paused:
+                run.termination_requested = True
+            else:
+                self.delete(rid)
 
     def get_status(self):
         """Returns a dictionary containing information about the runs currently
@@ -457,20 +597,17 @@ class Scheduler:
         This function does not have side effects, and does not have to be
         followed by a call to ``pause``.
         """
-        for pipeline in self._pipelines.values():
-            if rid in pipeline.pool.runs:
-                run = pipeline.pool.runs[rid]
-                if run.status != RunStatus.running:
-                    return False
-                if run.termination_requested:
-                    return True
-
-                prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                                       pipeline.pool.runs.values())
-                try:
-                    r = max(prepared_runs, key=lambda r: r.priority_key())
-                except ValueError:
-                    # prepared_runs is an empty sequence
-                    return False
-                return r.priority_key() > run.priority_key()
-        raise KeyError("RID not found")
+        try:
+            pipeline = self._rid_pipelines[rid]
+        except KeyError:
+            raise KeyError("RID not found") from None
+        run = pipeline.pool.runs[rid]
+        if run.status != RunStatus.running:
+            return False
+        if run.termination_requested:
+            return True
+
+        r = pipeline.pool.top_run(RunStatus.prepare_done)
+        if r is None:
+            return False
+        return r.priority_key() > run.priority_key()
@@ -4,11 +4,12 @@ import asyncio
 import logging
 import subprocess
 import time
+from collections import deque
 
 from artiq.protocols import pipe_ipc, pyon
 from artiq.protocols.logging import LogParser
 from artiq.protocols.packed_exceptions import current_exc_packed
-from artiq.tools import asyncio_wait_or_cancel
+from artiq.tools import asyncio_wait_or_cancel, TaskObject
 
 
 logger = logging.getLogger(__name__)
@@ -48,6 +49,7 @@ class Worker:
         self.rid = None
         self.filename = None
         self.ipc = None
+        self.shm = pipe_ipc.SharedMemoryArrays()
         self.watchdogs = dict()  # wid -> expiration (using time.monotonic)
 
         self.io_lock = asyncio.Lock()
@@ -152,12 +154,13 @@ class Worker:
             except asyncio.TimeoutError:
                 logger.warning("worker refuses to die (RID %s)", self.rid)
         finally:
+            if self.ipc is not None:
+                self.shm.cleanup(self.ipc.process.pid)
             self.io_lock.release()
 
     async def _send(self, obj, cancellable=True):
         assert self.io_lock.locked()
-        line = pyon.encode(obj)
-        self.ipc.write((line + "\n").encode())
+        self.ipc.write(pyon.encode_binary_frame(obj, self.shm.put))
         ifs = [self.ipc.drain()]
         if cancellable:
             ifs.append(self.closed.wait())
@@ -172,20 +175,28 @@ class Worker:
         if cancellable and self.closed.is_set():
             raise WorkerError("Data transmission to worker cancelled")
 
+    async def _read_frame(self):
+        header = await self.ipc.readexactly(pyon.binary_frame_header.size)
+        n, = pyon.binary_frame_header.unpack(header)
+        return await self.ipc.readexactly(n)
+
     async def _recv(self, timeout):
         assert self.io_lock.locked()
         fs = await asyncio_wait_or_cancel(
-            [self.ipc.readline(), self.closed.wait()],
+            [self._read_frame(), self.closed.wait()],
             timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
         if all(f.cancelled() for f in fs):
             raise WorkerTimeout("Timeout receiving data from worker")
         if self.closed.is_set():
             raise WorkerError("Data transmission to worker cancelled")
-        line = fs[0].result()
-        if not line:
+        try:
+            frame = fs[0].result()
+        except asyncio.IncompleteReadError:
             raise WorkerError("Worker ended while attempting to receive data")
+        # The worker has read our messages before sending this one.
+        self.shm.acknowledge()
         try:
-            obj = pyon.decode(line.decode())
+            obj = pyon.decode_binary(frame, self.shm.get)
         except:
             raise WorkerError("Worker sent invalid PYON data")
         return obj
@@ -301,3 +312,80 @@ class Worker:
                                   timeout)
         del self.register_experiment
         return r
+
+
+class WorkerPool(TaskObject):
+    """Keeps a number of idle worker processes running, so that runs do not
+    have to wait for the Python interpreter to start and for the worker
+    to import its dependencies (Numpy, h5py, the compiler...).
+
+    A worker is handed out at most once, and a replacement is spawned in
+    the background after each ``claim``. Idle workers are retired and
+    replaced after ``max_idle_time`` seconds so that long-running masters
+    eventually pick up changes in the installed software.
+
+    :param size: Number of idle workers to maintain. Zero disables the pool.
+    :param max_idle_time: Maximum time in seconds a worker stays idle before
+        it is retired.
+    """
+    def __init__(self, worker_handlers, size=0, max_idle_time=3600.0):
+        self.worker_handlers = worker_handlers
+        self.size = size
+        self.max_idle_time = max_idle_time
+
+        self._idle = deque()  # (spawn time, worker) - oldest first
+        self._refill = asyncio.Event()
+
+    def _usable(self, spawn_time, worker, now):
+        return (worker.ipc.process.returncode is None
+                and now - spawn_time < self.max_idle_time)
+
+    def claim(self):
+        """Returns an idle worker whose process is already running, or
+        ``None`` if there is none available."""
+        now = time.monotonic()
+        r = None
+        while self._idle:
+            spawn_time, worker = self._idle.popleft()
+            if self._usable(spawn_time, worker, now):
+                r = worker
+                break
+            asyncio.ensure_future(worker.close())
+        if self.size:
+            self._refill.set()
+        return r
+
+    def _retire_stale(self):
+        now = time.monotonic()
+        while self._idle and not self._usable(*self._idle[0], now):
+            _, worker = self._idle.popleft()
+            logger.debug("retiring idle worker")
+            asyncio.ensure_future(worker.close())
+
+    async def _do(self):
+        try:
+            while True:
+                self._refill.clear()
+                self._retire_stale()
+                while len(self._idle) < self.size:
+                    worker = Worker(self.worker_handlers)
+                    try:
+                        await worker._create_process(logging.WARNING)
+                    except:
+                        logger.error("failed to spawn idle worker",
+                                     exc_info=True)
+                        await worker.close()
+                        await asyncio.sleep(10.0)
+                    else:
+                        self._idle.append((time.monotonic(), worker))
+                if self._idle:
+                    timeout = max(0.0, self._idle[0][0] + self.max_idle_time
+                                       - time.monotonic())
+                else:
+                    timeout = None
+                await asyncio_wait_or_cancel([self._refill.wait()],
+                                             timeout=timeout)
+        finally:
+            while self._idle:
+                _, worker = self._idle.popleft()
+                await worker.close()
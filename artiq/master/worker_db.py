@@ -1,5 +1,6 @@
 from operator import setitem
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 import logging
 import os
@@ -13,10 +14,75 @@ from artiq.protocols.pc_rpc import AutoTarget, Client, BestEffortClient
 logger = logging.getLogger(__name__)
 
 
+rid_index_filename = "rid_index"
+
+
+def append_rid_index(day_dir, rid):
+    """Records that the results of the run with the given RID were written
+    in the given day folder (``results/YYYY-MM-DD``).
+
+    The index contains one RID per line. It is only ever appended to, so that
+    workers writing results concurrently do not need to coordinate.
+    """
+    with open(os.path.join(day_dir, rid_index_filename), "a") as f:
+        f.write(str(rid) + "\n")
+
+
+def _read_rid_index(day_path):
+    r = -1
+    with open(os.path.join(day_path, rid_index_filename), "r") as f:
+        for line in f:
+            try:
+                rid = int(line)
+            except ValueError:
+                # truncated by a crash
+                continue
+            if rid > r:
+                r = rid
+    return r
+
+
+def _scan_day_folder(day_path):
+    r = -1
+    try:
+        hm_folders = os.listdir(day_path)
+    except:
+        return r
+    hm_folders = filter(lambda x: re.fullmatch("\\d\\d(-\\d\\d)?", x),
+                        hm_folders)
+    for hmf in hm_folders:
+        hm_path = os.path.join(day_path, hmf)
+        try:
+            h5files = os.listdir(hm_path)
+        except:
+            continue
+        for x in h5files:
+            m = re.fullmatch(
+                "(\\d\\d\\d\\d\\d\\d\\d\\d\\d)-.*\\.h5", x)
+            if m is None:
+                continue
+            rid = int(m.group(1))
+            if rid > r:
+                r = rid
+    return r
+
+
 class RIDCounter:
-    def __init__(self, cache_filename="last_rid.pyon", results_dir="results"):
+    """Allocates RIDs, caching the last one in ``cache_filename``.
+
+    If the cache is missing, the last RID is recovered from the RID indices
+    of the day folders in ``results_dir`` (see ``append_rid_index``). Only
+    the day folders without an index (e.g. written by older versions) are
+    scanned, and an index is then created for them. With ``verify_index``,
+    all day folders are scanned as well and inconsistencies with the indices
+    are reported. Scans run in ``scan_workers`` threads.
+    """
+    def __init__(self, cache_filename="last_rid.pyon", results_dir="results",
+                 verify_index=False, scan_workers=8):
         self.cache_filename = cache_filename
         self.results_dir = results_dir
+        self.verify_index = verify_index
+        self.scan_workers = scan_workers
         self._next_rid = self._last_rid() + 1
         logger.debug("Next RID is %d", self._next_rid)
 
@@ -26,6 +92,15 @@ class RIDCounter:
         self._update_cache(rid)
         return rid
 
+    def get_many(self, count):
+        """Allocates ``count`` consecutive RIDs, updating the cache only
+        once. Returns a ``range``."""
+        rids = range(self._next_rid, self._next_rid + count)
+        self._next_rid += count
+        if count:
+            self._update_cache(rids[-1])
+        return rids
+
     def _last_rid(self):
         try:
             rid = self._last_rid_from_cache()
@@ -57,31 +132,49 @@ class RIDCounter:
             day_folders = os.listdir(self.results_dir)
         except:
             return r
-        day_folders = filter(
-            lambda x: re.fullmatch("\\d\\d\\d\\d-\\d\\d-\\d\\d", x),
-            day_folders)
-        for df in day_folders:
-            day_path = os.path.join(self.results_dir, df)
+        day_paths = [os.path.join(self.results_dir, df) for df in day_folders
+                     if re.fullmatch("\\d\\d\\d\\d-\\d\\d-\\d\\d", df)]
+
+        indexed = dict()
+        for day_path in day_paths:
             try:
-                hm_folders = os.listdir(day_path)
-            except:
-                continue
-            hm_folders = filter(lambda x: re.fullmatch("\\d\\d(-\\d\\d)?", x),
-                                hm_folders)
-            for hmf in hm_folders:
-                hm_path = os.path.join(day_path, hmf)
-                try:
-                    h5files = os.listdir(hm_path)
-                except:
+                indexed[day_path] = _read_rid_index(day_path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning("failed to read RID index of %s, scanning it",
+                               day_path, exc_info=True)
+        if self.verify_index:
+            to_scan = day_paths
+        else:
+            to_scan = [d for d in day_paths if d not in indexed]
+        if to_scan:
+            logger.info("scanning %d results folder(s) for the last RID",
+                        len(to_scan))
+            with ThreadPoolExecutor(self.scan_workers) as executor:
+                scanned = dict(zip(to_scan,
+                                   executor.map(_scan_day_folder, to_scan)))
+        else:
+            scanned = dict()
+
+        for day_path, rid in scanned.items():
+            if day_path in indexed:
+                if rid <= indexed[day_path]:
                     continue
-                for x in h5files:
-                    m = re.fullmatch(
-                        "(\\d\\d\\d\\d\\d\\d\\d\\d\\d)-.*\\.h5", x)
-                    if m is None:
-                        continue
-                    rid = int(m.group(1))
-                    if rid > r:
-                        r = rid
+                logger.warning("RID index of %s is out of date "
+                               "(last RID %d, found %d)",
+                               day_path, indexed[day_path], rid)
+            elif rid < 0:
+                continue
+            indexed[day_path] = rid
+            try:
+                append_rid_index(day_path, rid)
+            except OSError:
+                logger.warning("failed to update RID index of %s",
+                               day_path, exc_info=True)
+        for rid in indexed.values():
+            if rid > r:
+                r = rid
         return r
 
 
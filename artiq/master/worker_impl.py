@@ -11,7 +11,8 @@ import artiq
 from artiq.protocols import pipe_ipc, pyon
 from artiq.protocols.packed_exceptions import raise_packed_exc
 from artiq.tools import multiline_log_config, file_import
-from artiq.master.worker_db import DeviceManager, DatasetManager, DummyDevice
+from artiq.master.worker_db import (DeviceManager, DatasetManager,
+                                    DummyDevice, append_rid_index)
 from artiq.language.environment import (is_experiment, TraceArgumentManager,
                                         ProcessArgumentManager)
 from artiq.language.core import set_watchdog_factory, TerminationRequested
@@ -22,16 +23,20 @@ from artiq import __version__ as artiq_version
 
 
 ipc = None
+shm = pipe_ipc.SharedMemoryArrays()
 
 
 def get_object():
-    line = ipc.readline().decode()
-    return pyon.decode(line)
+    header = ipc.readexactly(pyon.binary_frame_header.size)
+    n, = pyon.binary_frame_header.unpack(header)
+    frame = ipc.readexactly(n)
+    # The master has read our messages before sending this one.
+    shm.acknowledge()
+    return pyon.decode_binary(frame, shm.get)
 
 
 def put_object(obj):
-    ds = pyon.encode(obj)
-    ipc.write((ds + "\n").encode())
+    ipc.write(pyon.encode_binary_frame(obj, shm.put))
 
 
 def make_parent_action(action):
@@ -107,6 +112,16 @@ class Scheduler:
             priority = self.priority
         return self._submit(pipeline_name, expid, priority, due_date, flush)
 
+    _submit_many = staticmethod(make_parent_action("scheduler_submit_many"))
+    def submit_many(self, pipeline_name=None, expids=None, priority=None,
+                    due_date=None, flush=False):
+        if pipeline_name is None:
+            pipeline_name = self.pipeline_name
+        if priority is None:
+            priority = self.priority
+        return self._submit_many(pipeline_name, expids, priority, due_date,
+                                 flush)
+
     delete = staticmethod(make_parent_action("scheduler_delete"))
     request_termination = staticmethod(
         make_parent_action("scheduler_request_termination"))
@@ -245,6 +260,9 @@ def main():
                 start_time = time.time()
                 rid = obj["rid"]
                 expid = obj["expid"]
+                # the process may have been started in advance by the
+                # worker pool, before the log level was known
+                logging.getLogger().setLevel(expid["log_level"])
                 if obj["wd"] is not None:
                     # Using repository
                     experiment_file = os.path.join(obj["wd"], expid["file"])
@@ -290,6 +308,8 @@ def main():
                     f["start_time"] = start_time
                     f["run_time"] = run_time
                     f["expid"] = pyon.encode(expid)
+                # the day folder, for the master to recover the last RID
+                append_rid_index(os.pardir, rid)
                 put_object({"action": "completed"})
             elif action == "examine":
                 examine(ExamineDeviceMgr, ExamineDatasetMgr, obj["file"])
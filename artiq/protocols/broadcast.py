@@ -6,21 +6,26 @@ from artiq.protocols.asyncio_server import AsyncioServer
 
 
 _init_string = b"ARTIQ broadcast\n"
+_init_string_binary = b"ARTIQ broadcast binary\n"
 
 
 class Receiver:
-    def __init__(self, name, notify_cb, disconnect_cb=None):
+    def __init__(self, name, notify_cb, disconnect_cb=None, binary=False):
         self.name = name
         if not isinstance(notify_cb, list):
             notify_cb = [notify_cb]
         self.notify_cbs = notify_cb
         self.disconnect_cb = disconnect_cb
+        self.binary = binary
 
     async def connect(self, host, port):
         self.reader, self.writer = \
             await asyncio.open_connection(host, port, limit=100*1024*1024)
         try:
-            self.writer.write(_init_string)
+            if self.binary:
+                self.writer.write(_init_string_binary)
+            else:
+                self.writer.write(_init_string)
             self.writer.write((self.name + "\n").encode())
             self.receive_task = asyncio.ensure_future(self._receive_cr())
         except:
@@ -46,10 +51,20 @@ class Receiver:
         try:
             target = None
             while True:
-                line = await self.reader.readline()
-                if not line:
-                    return
-                obj = pyon.decode(line.decode())
+                if self.binary:
+                    try:
+                        header = await self.reader.readexactly(
+                            pyon.binary_frame_header.size)
+                        n, = pyon.binary_frame_header.unpack(header)
+                        obj = pyon.decode_binary(
+                            await self.reader.readexactly(n))
+                    except asyncio.IncompleteReadError:
+                        return
+                else:
+                    line = await self.reader.readline()
+                    if not line:
+                        return
+                    obj = pyon.decode(line.decode())
 
                 for notify_cb in self.notify_cbs:
                     notify_cb(obj)
@@ -67,7 +82,11 @@ class Broadcaster(AsyncioServer):
     async def _handle_connection_cr(self, reader, writer):
         try:
             line = await reader.readline()
-            if line != _init_string:
+            if line == _init_string:
+                binary = False
+            elif line == _init_string_binary:
+                binary = True
+            else:
                 return
 
             line = await reader.readline()
@@ -77,9 +96,9 @@ class Broadcaster(AsyncioServer):
 
             queue = asyncio.Queue(self._queue_limit)
             if name in self._recipients:
-                self._recipients[name].add(queue)
+                self._recipients[name][queue] = binary
             else:
-                self._recipients[name] = {queue}
+                self._recipients[name] = {queue: binary}
             try:
                 while True:
                     line = await queue.get()
@@ -87,7 +106,7 @@ class Broadcaster(AsyncioServer):
                     # raise exception on connection error
                     await writer.drain()
             finally:
-                self._recipients[name].remove(queue)
+                del self._recipients[name][queue]
                 if not self._recipients[name]:
                     del self._recipients[name]
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
@@ -98,11 +117,19 @@ class Broadcaster(AsyncioServer):
 
     def broadcast(self, name, obj):
         if name in self._recipients:
-            line = pyon.encode(obj) + "\n"
-            line = line.encode()
-            for recipient in self._recipients[name]:
+            line = None
+            frame = None
+            for recipient, binary in self._recipients[name].items():
+                if binary:
+                    if frame is None:
+                        frame = pyon.encode_binary_frame(obj)
+                    data = frame
+                else:
+                    if line is None:
+                        line = (pyon.encode(obj) + "\n").encode()
+                    data = line
                 try:
-                    recipient.put_nowait(line)
+                    recipient.put_nowait(data)
                 except asyncio.QueueFull:
                     # do not log: log messages may be sent back to us
                     # as broadcasts, and cause infinite recursion.
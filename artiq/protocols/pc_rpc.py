@@ -2,7 +2,8 @@
 This module provides a remote procedure call (RPC) mechanism over sockets
 between conventional computers (PCs) running Python. It strives to be
 transparent and uses ``artiq.protocols.pyon`` internally so that e.g. Numpy
-arrays can be easily used.
+arrays can be easily used. Clients and servers negotiate the binary PYON
+encoding when both sides support it, and fall back to textual PYON otherwise.
 
 Note that the server operates on copies of objects provided by the client,
 and modifications to mutable types are not written back. For example, if the
@@ -41,6 +42,7 @@ class IncompatibleServer(Exception):
 
 
 _init_string = b"ARTIQ pc_rpc\n"
+_binary_string = b"ARTIQ pc_rpc binary\n"
 
 
 def _validate_target_name(target_name, target_names):
@@ -56,6 +58,28 @@ def _validate_target_name(target_name, target_names):
     return target_name
 
 
+def _socket_recv_binary(sock):
+    def recv_exactly(n):
+        buf = bytearray(n)
+        view = memoryview(buf)
+        while view:
+            nbytes = sock.recv_into(view)
+            if not nbytes:
+                raise ConnectionResetError("Connection closed by the server")
+            view = view[nbytes:]
+        return buf
+
+    header = recv_exactly(pyon.binary_frame_header.size)
+    n, = pyon.binary_frame_header.unpack(header)
+    return pyon.decode_binary(recv_exactly(n))
+
+
+async def _stream_recv_binary(reader):
+    header = await reader.readexactly(pyon.binary_frame_header.size)
+    n, = pyon.binary_frame_header.unpack(header)
+    return pyon.decode_binary(await reader.readexactly(n))
+
+
 class Client:
     """This class proxies the methods available on the server so that they
     can be used as if they were local methods.
@@ -93,16 +117,23 @@ class Client:
         ``socket.settimeout()`` in the Python standard library. A timeout
         in the middle of a RPC can break subsequent RPCs (from the same
         client).
+    :param binary: Use the binary PYON encoding if the server supports it.
+        Servers that do not support it are transparently communicated with
+        using textual PYON.
     """
-    def __init__(self, host, port, target_name=AutoTarget, timeout=None):
+    def __init__(self, host, port, target_name=AutoTarget, timeout=None,
+                 binary=True):
         self.__socket = socket.create_connection((host, port), timeout)
 
         try:
             self.__socket.sendall(_init_string)
 
+            self.__binary = False
             server_identification = self.__recv()
             self.__target_names = server_identification["targets"]
             self.__description = server_identification["description"]
+            self.__binary_supported = (
+                binary and server_identification.get("binary", False))
             self.__selected_target = None
             self.__valid_methods = set()
             if target_name is not None:
@@ -115,6 +146,9 @@ class Client:
         """Selects a RPC target by name. This function should be called
         exactly once if the object was created with ``target_name=None``."""
         target_name = _validate_target_name(target_name, self.__target_names)
+        if self.__binary_supported:
+            self.__socket.sendall(_binary_string)
+            self.__binary = True
         self.__socket.sendall((target_name + "\n").encode())
         self.__selected_target = target_name
         self.__valid_methods = self.__recv()
@@ -141,10 +175,15 @@ class Client:
         self.__socket.close()
 
     def __send(self, obj):
-        line = pyon.encode(obj) + "\n"
-        self.__socket.sendall(line.encode())
+        if self.__binary:
+            self.__socket.sendall(pyon.encode_binary_frame(obj))
+        else:
+            line = pyon.encode(obj) + "\n"
+            self.__socket.sendall(line.encode())
 
     def __recv(self):
+        if self.__binary:
+            return _socket_recv_binary(self.__socket)
         buf = self.__socket.recv(4096).decode()
         while "\n" not in buf:
             more = self.__socket.recv(4096)
@@ -195,8 +234,9 @@ class AsyncioClient:
         self.__writer = None
         self.__target_names = None
         self.__description = None
+        self.__binary = False
 
-    async def connect_rpc(self, host, port, target_name):
+    async def connect_rpc(self, host, port, target_name, binary=True):
         """Connects to the server. This cannot be done in __init__ because
         this method is a coroutine. See ``Client`` for a description of the
         parameters."""
@@ -204,9 +244,12 @@ class AsyncioClient:
             await asyncio.open_connection(host, port, limit=100*1024*1024)
         try:
             self.__writer.write(_init_string)
+            self.__binary = False
             server_identification = await self.__recv()
             self.__target_names = server_identification["targets"]
             self.__description = server_identification["description"]
+            self.__binary_supported = (
+                binary and server_identification.get("binary", False))
             self.__selected_target = None
             self.__valid_methods = set()
             if target_name is not None:
@@ -220,6 +263,9 @@ class AsyncioClient:
         exactly once if the connection was created with ``target_name=None``.
         """
         target_name = _validate_target_name(target_name, self.__target_names)
+        if self.__binary_supported:
+            self.__writer.write(_binary_string)
+            self.__binary = True
         self.__writer.write((target_name + "\n").encode())
         self.__selected_target = target_name
         self.__valid_methods = await self.__recv()
@@ -250,10 +296,15 @@ class AsyncioClient:
         self.__description = None
 
     def __send(self, obj):
-        line = pyon.encode(obj) + "\n"
-        self.__writer.write(line.encode())
+        if self.__binary:
+            self.__writer.write(pyon.encode_binary_frame(obj))
+        else:
+            line = pyon.encode(obj) + "\n"
+            self.__writer.write(line.encode())
 
     async def __recv(self):
+        if self.__binary:
+            return await _stream_recv_binary(self.__reader)
         line = await self.__reader.readline()
         return pyon.decode(line.decode())
 
@@ -295,13 +346,16 @@ class BestEffortClient:
         connection attempt at object initialization.
     :param retry: Amount of time to wait between retries when reconnecting
         in the background.
+    :param binary: Use the binary PYON encoding if the server supports it.
     """
     def __init__(self, host, port, target_name,
-                 firstcon_timeout=1.0, retry=5.0):
+                 firstcon_timeout=1.0, retry=5.0, binary=True):
         self.__host = host
         self.__port = port
         self.__target_name = target_name
         self.__retry = retry
+        self.__binary_requested = binary
+        self.__binary = False
 
         self.__conretry_terminate = False
         self.__socket = None
@@ -326,9 +380,14 @@ class BestEffortClient:
                 (self.__host, self.__port), timeout)
             self.__socket.settimeout(None)
         self.__socket.sendall(_init_string)
+        self.__binary = False
         server_identification = self.__recv()
         target_name = _validate_target_name(self.__target_name,
                                             server_identification["targets"])
+        if (self.__binary_requested
+                and server_identification.get("binary", False)):
+            self.__socket.sendall(_binary_string)
+            self.__binary = True
         self.__socket.sendall((target_name + "\n").encode())
         self.__valid_methods = self.__recv()
 
@@ -369,10 +428,15 @@ class BestEffortClient:
             self.__conretry_terminate = True
 
     def __send(self, obj):
-        line = pyon.encode(obj) + "\n"
-        self.__socket.sendall(line.encode())
+        if self.__binary:
+            self.__socket.sendall(pyon.encode_binary_frame(obj))
+        else:
+            line = pyon.encode(obj) + "\n"
+            self.__socket.sendall(line.encode())
 
     def __recv(self):
+        if self.__binary:
+            return _socket_recv_binary(self.__socket)
         buf = self.__socket.recv(4096).decode()
         while "\n" not in buf:
             more = self.__socket.recv(4096)
@@ -548,13 +612,19 @@ class Server(_AsyncioServer):
 
             obj = {
                 "targets": sorted(self.targets.keys()),
-                "description": self.description
+                "description": self.description,
+                "binary": True
             }
             line = pyon.encode(obj) + "\n"
             writer.write(line.encode())
             line = await reader.readline()
             if not line:
                 return
+            binary = line == _binary_string
+            if binary:
+                line = await reader.readline()
+                if not line:
+                    return
             target_name = line.decode()[:-1]
             try:
                 target = self.targets[target_name]
@@ -568,14 +638,24 @@ class Server(_AsyncioServer):
             valid_methods = {m[0] for m in valid_methods}
             if self.builtin_terminate:
                 valid_methods.add("terminate")
-            writer.write((pyon.encode(valid_methods) + "\n").encode())
 
-            while True:
-                line = await reader.readline()
-                if not line:
-                    break
-                reply = await self._process_action(target, pyon.decode(line.decode()))
-                writer.write((pyon.encode(reply) + "\n").encode())
+            if binary:
+                writer.write(pyon.encode_binary_frame(valid_methods))
+                while True:
+                    try:
+                        obj = await _stream_recv_binary(reader)
+                    except asyncio.IncompleteReadError:
+                        break
+                    reply = await self._process_action(target, obj)
+                    writer.write(pyon.encode_binary_frame(reply))
+            else:
+                writer.write((pyon.encode(valid_methods) + "\n").encode())
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    reply = await self._process_action(target, pyon.decode(line.decode()))
+                    writer.write((pyon.encode(reply) + "\n").encode())
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
             # May happens on Windows when client disconnects
             pass
@@ -1,9 +1,12 @@
 import os
+import mmap
+import tempfile
 import asyncio
 from asyncio.streams import FlowControlMixin
 
 
-__all__ = ["AsyncioParentComm", "AsyncioChildComm", "ChildComm"]
+__all__ = ["AsyncioParentComm", "AsyncioChildComm", "ChildComm",
+           "SharedMemoryArrays"]
 
 
 class _BaseIO:
@@ -19,6 +22,93 @@ class _BaseIO:
     async def read(self, n):
         return await self.reader.read(n)
 
+    async def readexactly(self, n):
+        return await self.reader.readexactly(n)
+
+
+def _readexactly(f, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while view:
+        nbytes = f.readinto(view)
+        if not nbytes:
+            raise EOFError("Pipe closed after {} of {} bytes"
+                           .format(n - len(view), n))
+        view = view[nbytes:]
+    return buf
+
+
+_shm_dir = "/dev/shm"
+
+
+class SharedMemoryArrays:
+    """Out-of-band channel for large Numpy arrays exchanged over a pipe.
+
+    Use ``put`` as the ``buffer_callback`` of ``pyon.encode_binary_frame``
+    on the sending side, and ``get`` as the ``buffer_loader`` of
+    ``pyon.decode_binary`` on the receiving side. Arrays of at least
+    ``threshold`` bytes are written to a file in shared memory and only its
+    name goes through the pipe. The receiver maps the file copy-on-write and
+    unlinks it immediately, and the decoded array is backed directly by the
+    mapping.
+
+    The sender keeps track of the segments that may not have been consumed
+    yet. ``acknowledge`` must be called when a message from the peer shows
+    that it has decoded everything sent so far (e.g. when its reply
+    arrives).
+
+    On systems without ``/dev/shm``, all arrays are sent in-band.
+    """
+    def __init__(self, threshold=1024*1024):
+        self.threshold = threshold
+        self.available = os.path.isdir(_shm_dir)
+        self._sent = set()
+
+    def put(self, array):
+        if (not self.available or array.nbytes < self.threshold
+                or not array.nbytes):
+            return None
+        fd, path = tempfile.mkstemp(
+            prefix="artiq-{}-".format(os.getpid()), dir=_shm_dir)
+        with open(fd, "wb") as f:
+            f.write(array.data)
+        name = os.path.basename(path)
+        self._sent.add(name)
+        return name
+
+    def get(self, name):
+        if os.path.basename(name) != name or not name.startswith("artiq-"):
+            raise ValueError("Invalid shared memory segment name")
+        path = os.path.join(_shm_dir, name)
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        os.unlink(path)
+        return buf
+
+    def acknowledge(self):
+        """Forgets the segments sent so far, which the peer has consumed."""
+        self._sent.clear()
+
+    def cleanup(self, peer_pid=None):
+        """Removes the segments sent by us that the peer did not consume,
+        and, if ``peer_pid`` is given, the segments created by the peer
+        process that we did not consume. Should be called once the peer
+        has exited."""
+        for name in self._sent:
+            try:
+                os.unlink(os.path.join(_shm_dir, name))
+            except FileNotFoundError:
+                pass
+        self._sent.clear()
+        if peer_pid is not None and self.available:
+            prefix = "artiq-{}-".format(peer_pid)
+            for de in os.scandir(_shm_dir):
+                if de.name.startswith(prefix):
+                    try:
+                        os.unlink(de.path)
+                    except FileNotFoundError:
+                        pass
+
 
 if os.name != "nt":
     async def _fds_to_asyncio(rfd, wfd, loop):
@@ -86,6 +176,9 @@ if os.name != "nt":
         def readline(self):
             return self.rf.readline()
 
+        def readexactly(self, n):
+            return _readexactly(self.rf, n)
+
         def write(self, data):
             return self.wf.write(data)
 
@@ -181,6 +274,10 @@ else:  # windows
             await self.ready.wait()
             return await self.reader.read(n)
 
+        async def readexactly(self, n):
+            await self.ready.wait()
+            return await self.reader.readexactly(n)
+
 
     class AsyncioChildComm(_BaseIO):
         """Requires ProactorEventLoop"""
@@ -211,6 +308,9 @@ else:  # windows
         def readline(self):
             return self.f.readline()
 
+        def readexactly(self, n):
+            return _readexactly(self.f, n)
+
         def write(self, data):
             return self.f.write(data)
 
@@ -14,6 +14,14 @@ The main rationale for this new custom serializer (instead of using JSON) is
 that JSON does not support Numpy and more generally cannot be extended with
 other data types while keeping a concise syntax. Here we can use the Python
 function call syntax to express special data types.
+
+In addition to the textual format, this module provides a compact binary
+encoding of the same data types (``encode_binary``/``decode_binary``). Each
+object is represented by a one-byte tag followed by its length-prefixed
+contents, and Numpy arrays are transmitted as their raw buffers. Containers
+of plain Python objects are packed with ``marshal``. The binary
+encoding is intended for network and IPC transports that negotiate it; the
+textual format remains the reference for files and for interoperability.
 """
 
 
@@ -21,6 +29,8 @@ import base64
 from fractions import Fraction
 from collections import OrderedDict
 import os
+import marshal
+import struct
 import tempfile
 
 import numpy
@@ -202,6 +212,371 @@ def decode(s):
     return eval(s, _eval_dict, {})
 
 
+_u8 = struct.Struct(">B")
+_u32 = struct.Struct(">I")
+_u64 = struct.Struct(">Q")
+_i64 = struct.Struct(">q")
+_f64 = struct.Struct(">d")
+_c128 = struct.Struct(">dd")
+
+_marshal_scalars = {type(None), bool, int, float, complex, str, bytes}
+_marshal_containers = {tuple, list, set, dict}
+_marshal_types = _marshal_scalars | _marshal_containers
+
+
+def _items_marshallable(items):
+    types = set(map(type, items))
+    if types <= _marshal_scalars:
+        return True
+    if not types <= _marshal_types:
+        return False
+    return all(_marshallable(item) for item in items
+               if type(item) in _marshal_containers)
+
+
+def _marshallable(x):
+    if type(x) is dict:
+        return _items_marshallable(x.keys()) and \
+            _items_marshallable(x.values())
+    else:
+        return _items_marshallable(x)
+
+
+class _BinaryEncoder:
+    def __init__(self, buffer_callback=None):
+        self.out = bytearray()
+        self.buffer_callback = buffer_callback
+
+    def encode_none(self, x):
+        self.out += b"n"
+
+    def encode_bool(self, x):
+        self.out += b"t" if x else b"f"
+
+    def encode_int(self, x):
+        if -2**63 <= x < 2**63:
+            self.out += b"i"
+            self.out += _i64.pack(x)
+        else:
+            self.out += b"I"
+            self._encode_raw(x.to_bytes((x.bit_length() + 8)//8, "big",
+                                        signed=True))
+
+    def encode_float(self, x):
+        self.out += b"d"
+        self.out += _f64.pack(x)
+
+    def encode_complex(self, x):
+        self.out += b"c"
+        self.out += _c128.pack(x.real, x.imag)
+
+    def _encode_raw(self, data):
+        self.out += _u32.pack(len(data))
+        self.out += data
+
+    def encode_str(self, x):
+        self.out += b"s"
+        self._encode_raw(x.encode())
+
+    def encode_bytes(self, x):
+        self.out += b"b"
+        self._encode_raw(x)
+
+    def _encode_marshal(self, x):
+        # Containers holding only plain Python objects are handed over to
+        # the C implementation of marshal in one go, which is much faster
+        # than visiting each item here. marshal also accepts any object
+        # supporting the buffer protocol (e.g. Numpy arrays and scalars),
+        # which would then be silently turned into bytes, hence the type
+        # check beforehand.
+        if not _marshallable(x):
+            return False
+        self.out += b"M"
+        self._encode_raw(marshal.dumps(x, 4))
+        return True
+
+    def _encode_items(self, tag, x):
+        if self._encode_marshal(x):
+            return
+        self.out += tag
+        self.out += _u32.pack(len(x))
+        for item in x:
+            self.encode(item)
+
+    def encode_tuple(self, x):
+        self._encode_items(b"(", x)
+
+    def encode_list(self, x):
+        self._encode_items(b"[", x)
+
+    def encode_set(self, x):
+        self._encode_items(b"{", x)
+
+    def encode_dict(self, x):
+        if self._encode_marshal(x):
+            return
+        self._encode_pairs(b"D", x)
+
+    def _encode_pairs(self, tag, x):
+        self.out += tag
+        self.out += _u32.pack(len(x))
+        for k, v in x.items():
+            self.encode(k)
+            self.encode(v)
+
+    def encode_ordereddict(self, x):
+        self._encode_pairs(b"O", x)
+
+    def encode_slice(self, x):
+        self.out += b"S"
+        self.encode(x.start)
+        self.encode(x.stop)
+        self.encode(x.step)
+
+    def encode_fraction(self, x):
+        self.out += b"F"
+        self.encode(x.numerator)
+        self.encode(x.denominator)
+
+    def _encode_dtype(self, dtype):
+        self._encode_raw(dtype.str.encode())
+
+    def encode_nparray(self, x):
+        if x.dtype.hasobject:
+            raise TypeError("Numpy object arrays are not PYON serializable")
+        if not x.flags.c_contiguous:
+            x = numpy.ascontiguousarray(x)
+        reference = None
+        if self.buffer_callback is not None:
+            reference = self.buffer_callback(x)
+        self.out += b"a" if reference is None else b"A"
+        self._encode_dtype(x.dtype)
+        self.out += _u8.pack(x.ndim)
+        for n in x.shape:
+            self.out += _u64.pack(n)
+        if reference is None:
+            data = memoryview(x.reshape(-1).view(numpy.uint8))
+            self.out += _u64.pack(len(data))
+            self.out += data
+        else:
+            self.encode(reference)
+
+    def encode_npscalar(self, x):
+        self.out += b"p"
+        self._encode_dtype(x.dtype)
+        self._encode_raw(x.tobytes())
+
+    def encode(self, x):
+        try:
+            f = _binary_encode_dispatch[type(x)]
+        except KeyError:
+            raise TypeError("`{!r}` ({}) is not PYON serializable"
+                            .format(x, type(x)))
+        f(self, x)
+
+
+_binary_encode_dispatch = {
+    ty: getattr(_BinaryEncoder, "encode_" + name)
+    for ty, name in _encode_map.items() if name != "number"
+}
+_binary_encode_dispatch.update({
+    int: _BinaryEncoder.encode_int,
+    float: _BinaryEncoder.encode_float,
+    complex: _BinaryEncoder.encode_complex
+})
+
+
+def encode_binary(x, buffer_callback=None):
+    """Serializes a Python object and returns the corresponding binary
+    PYON representation as ``bytes``.
+
+    If ``buffer_callback`` is given, it is called with each (C-contiguous)
+    Numpy array to serialize. If it returns a value other than ``None``,
+    the array contents are not included in the output; the returned value,
+    which must be PYON serializable, is encoded instead and passed to the
+    ``buffer_loader`` of ``decode_binary`` to retrieve the data. This allows
+    large arrays to be transferred out of band, e.g. through shared memory.
+    """
+    encoder = _BinaryEncoder(buffer_callback)
+    encoder.encode(x)
+    return bytes(encoder.out)
+
+
+class _BinaryDecoder:
+    def __init__(self, data, buffer_loader=None):
+        self.data = memoryview(data).cast("B")
+        self.pos = 0
+        self.buffer_loader = buffer_loader
+
+    def _unpack(self, st):
+        r = st.unpack_from(self.data, self.pos)
+        self.pos += st.size
+        return r
+
+    def _raw(self, n):
+        if self.pos + n > len(self.data):
+            raise ValueError("Truncated binary PYON data")
+        r = self.data[self.pos:self.pos+n]
+        self.pos += n
+        return r
+
+    def _raw_u32(self):
+        n, = self._unpack(_u32)
+        return self._raw(n)
+
+    def decode_none(self):
+        return None
+
+    def decode_true(self):
+        return True
+
+    def decode_false(self):
+        return False
+
+    def decode_int(self):
+        return self._unpack(_i64)[0]
+
+    def decode_bigint(self):
+        return int.from_bytes(self._raw_u32(), "big", signed=True)
+
+    def decode_float(self):
+        return self._unpack(_f64)[0]
+
+    def decode_complex(self):
+        return complex(*self._unpack(_c128))
+
+    def decode_str(self):
+        return str(self._raw_u32(), "utf-8")
+
+    def decode_bytes(self):
+        return bytes(self._raw_u32())
+
+    def decode_marshal(self):
+        return marshal.loads(self._raw_u32())
+
+    def _decode_items(self):
+        n, = self._unpack(_u32)
+        return [self.decode() for _ in range(n)]
+
+    def decode_tuple(self):
+        return tuple(self._decode_items())
+
+    def decode_list(self):
+        return self._decode_items()
+
+    def decode_set(self):
+        return set(self._decode_items())
+
+    def _decode_pairs(self):
+        n, = self._unpack(_u32)
+        for _ in range(n):
+            k = self.decode()
+            yield k, self.decode()
+
+    def decode_dict(self):
+        return dict(self._decode_pairs())
+
+    def decode_ordereddict(self):
+        return OrderedDict(self._decode_pairs())
+
+    def decode_slice(self):
+        start = self.decode()
+        stop = self.decode()
+        return slice(start, stop, self.decode())
+
+    def decode_fraction(self):
+        numerator = self.decode()
+        return Fraction(numerator, self.decode())
+
+    def _decode_dtype(self):
+        return numpy.dtype(str(self._raw_u32(), "ascii"))
+
+    def _decode_shape(self):
+        ndim, = self._unpack(_u8)
+        return tuple(self._unpack(_u64)[0] for _ in range(ndim))
+
+    def decode_nparray(self):
+        dtype = self._decode_dtype()
+        shape = self._decode_shape()
+        n, = self._unpack(_u64)
+        data = self._raw(n)
+        a = numpy.frombuffer(data, dtype=dtype)
+        if data.readonly:
+            a = a.copy()
+        return a.reshape(shape)
+
+    def decode_nparray_reference(self):
+        dtype = self._decode_dtype()
+        shape = self._decode_shape()
+        reference = self.decode()
+        if self.buffer_loader is None:
+            raise ValueError("Out-of-band array data without buffer loader")
+        a = numpy.frombuffer(self.buffer_loader(reference), dtype=dtype)
+        return a.reshape(shape)
+
+    def decode_npscalar(self):
+        dtype = self._decode_dtype()
+        return numpy.frombuffer(self._raw_u32(), dtype=dtype)[0]
+
+    def decode(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        try:
+            f = _binary_decode_dispatch[tag]
+        except KeyError:
+            raise ValueError("Invalid binary PYON tag {:#04x}".format(tag))
+        return f(self)
+
+
+_binary_decode_dispatch = {
+    ord(tag): getattr(_BinaryDecoder, "decode_" + name)
+    for tag, name in [
+        ("n", "none"), ("t", "true"), ("f", "false"),
+        ("i", "int"), ("I", "bigint"), ("d", "float"), ("c", "complex"),
+        ("s", "str"), ("b", "bytes"), ("M", "marshal"),
+        ("(", "tuple"), ("[", "list"), ("{", "set"),
+        ("D", "dict"), ("O", "ordereddict"),
+        ("S", "slice"), ("F", "fraction"),
+        ("a", "nparray"), ("A", "nparray_reference"), ("p", "npscalar")
+    ]
+}
+
+
+def decode_binary(data, buffer_loader=None):
+    """Parses binary PYON data (``bytes``, ``bytearray`` or any object
+    supporting the buffer protocol), reconstructs the corresponding object,
+    and returns it.
+
+    Numpy arrays decoded from a writable buffer (e.g. a ``bytearray``)
+    share its memory instead of being copied.
+
+    ``buffer_loader`` is called with the references produced by the
+    ``buffer_callback`` of ``encode_binary`` and must return an object
+    supporting the buffer protocol with the array contents. The array is
+    created on top of that object without copying."""
+    decoder = _BinaryDecoder(data, buffer_loader)
+    r = decoder.decode()
+    if decoder.pos != len(decoder.data):
+        raise ValueError("Trailing data after binary PYON object")
+    return r
+
+
+binary_frame_header = struct.Struct(">Q")
+
+
+def encode_binary_frame(x, buffer_callback=None):
+    """Serializes a Python object in binary PYON and prefixes it with its
+    length (``binary_frame_header``) for transmission over a stream.
+
+    See ``encode_binary`` for the meaning of ``buffer_callback``."""
+    encoder = _BinaryEncoder(buffer_callback)
+    encoder.out += bytes(binary_frame_header.size)
+    encoder.encode(x)
+    binary_frame_header.pack_into(
+        encoder.out, 0, len(encoder.out) - binary_frame_header.size)
+    return bytes(encoder.out)
+
+
 def store_file(filename, x):
     """Encodes a Python object and writes it to the specified file."""
     contents = encode(x, True)
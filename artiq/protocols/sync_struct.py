@@ -8,9 +8,18 @@ describing each modification made to the structure (*mods*).
 
 Structures must be PYON serializable and contain only lists, dicts, and
 immutable types. Lists and dicts can be nested arbitrarily.
+
+Subscribers may request the binary PYON encoding, which the publisher then
+uses for all data sent to them. They may also restrict the data they receive
+to some parts of the structure, given as paths.
+
+The publisher can hold back the mods of a structure for a short time and
+collapse repeated modifications of the same item, and resends the whole
+structure to subscribers that fall too far behind.
 """
 
 import asyncio
+from copy import deepcopy
 from operator import getitem
 from functools import partial
 
@@ -20,6 +29,9 @@ from artiq.protocols.asyncio_server import AsyncioServer
 
 
 _init_string = b"ARTIQ sync_struct\n"
+_init_string_binary = b"ARTIQ sync_struct binary\n"
+# followed by the notifier name and a PYON line with the options
+_init_string_options = b"ARTIQ sync_struct options\n"
 
 
 def process_mod(target, mod):
@@ -37,10 +49,76 @@ def process_mod(target, mod):
         target.__setitem__(mod["key"], mod["value"])
     elif action == "delitem":
         target.__delitem__(mod["key"])
+    elif action == "update":
+        for key, value in mod["x"].items():
+            target.__setitem__(key, value)
     else:
         raise ValueError
 
 
+def _mod_location(mod):
+    if (mod["action"] in {"setitem", "delitem"}
+            and not isinstance(mod["key"], slice)):
+        return mod["path"] + [mod["key"]]
+    else:
+        return mod["path"]
+
+
+def _related(location, prefixes):
+    # True if location is inside one of the prefixes, or is an ancestor of
+    # one of them.
+    for prefix in prefixes:
+        n = min(len(location), len(prefix))
+        if list(location[:n]) == list(prefix[:n]):
+            return True
+    return False
+
+
+def _filter_value(location, value, prefixes):
+    # Filters the value of the item at location.
+    sub_prefixes = []
+    for prefix in prefixes:
+        if list(location[:len(prefix)]) == list(prefix):
+            return value
+        if list(prefix[:len(location)]) == list(location):
+            sub_prefixes.append(prefix[len(location):])
+    return filter_struct(value, sub_prefixes)
+
+
+def filter_struct(struct, prefixes):
+    """Returns a copy of the structure that only contains the items at
+    the given paths and their ancestors. The paths should only go through
+    dictionaries; lists along the paths are kept whole."""
+    if any(not prefix for prefix in prefixes) or not isinstance(struct, dict):
+        return struct
+    children = dict()
+    for prefix in prefixes:
+        children.setdefault(prefix[0], []).append(prefix[1:])
+    return {key: filter_struct(struct[key], sub_prefixes)
+            for key, sub_prefixes in children.items() if key in struct}
+
+
+def filter_mod(mod, prefixes):
+    """Returns the part of a mod that concerns the given paths, or
+    ``None`` if the mod does not affect them."""
+    if mod["action"] == "init":
+        return {"action": "init",
+                "struct": filter_struct(mod["struct"], prefixes)}
+    location = _mod_location(mod)
+    if not _related(location, prefixes):
+        return None
+    if mod["action"] == "update":
+        x = {key: _filter_value(location + [key], value, prefixes)
+             for key, value in mod["x"].items()
+             if _related(location + [key], prefixes)}
+        if not x:
+            return None
+        mod = dict(mod, x=x)
+    elif mod["action"] == "setitem" and location is not mod["path"]:
+        mod = dict(mod, value=_filter_value(location, mod["value"], prefixes))
+    return mod
+
+
 class Subscriber:
     """An asyncio-based client to connect to a ``Publisher``.
 
@@ -54,8 +132,15 @@ class Subscriber:
         A list of functions may also be used, and they will be called in turn.
     :param disconnect_cb: An optional function called when disconnection happens
         from external causes (i.e. not when ``close`` is called).
+    :param binary: Request the binary PYON encoding from the publisher. This
+        is not supported by publishers from older ARTIQ versions.
+    :param prefixes: An optional list of paths (lists of keys) in the
+        structure. If given, the publisher only sends the items at these
+        paths, their ancestors, and the mods that affect them. This is not
+        supported by publishers from older ARTIQ versions.
     """
-    def __init__(self, notifier_name, target_builder, notify_cb=None, disconnect_cb=None):
+    def __init__(self, notifier_name, target_builder, notify_cb=None,
+                 disconnect_cb=None, binary=False, prefixes=None):
         self.notifier_name = notifier_name
         self.target_builder = target_builder
         if notify_cb is None:
@@ -64,6 +149,8 @@ class Subscriber:
             notify_cb = [notify_cb]
         self.notify_cbs = notify_cb
         self.disconnect_cb = disconnect_cb
+        self.binary = binary
+        self.prefixes = prefixes
 
     async def connect(self, host, port, before_receive_cb=None):
         self.reader, self.writer = \
@@ -71,8 +158,19 @@ class Subscriber:
         try:
             if before_receive_cb is not None:
                 before_receive_cb()
-            self.writer.write(_init_string)
-            self.writer.write((self.notifier_name + "\n").encode())
+            if self.prefixes is not None:
+                self.writer.write(_init_string_options)
+                self.writer.write((self.notifier_name + "\n").encode())
+                options = {"binary": self.binary,
+                           "prefixes": [list(prefix)
+                                        for prefix in self.prefixes]}
+                self.writer.write((pyon.encode(options) + "\n").encode())
+            else:
+                if self.binary:
+                    self.writer.write(_init_string_binary)
+                else:
+                    self.writer.write(_init_string)
+                self.writer.write((self.notifier_name + "\n").encode())
             self.receive_task = asyncio.ensure_future(self._receive_cr())
         except:
             self.writer.close()
@@ -97,10 +195,20 @@ class Subscriber:
         try:
             target = None
             while True:
-                line = await self.reader.readline()
-                if not line:
-                    return
-                mod = pyon.decode(line.decode())
+                if self.binary:
+                    try:
+                        header = await self.reader.readexactly(
+                            pyon.binary_frame_header.size)
+                        n, = pyon.binary_frame_header.unpack(header)
+                        mod = pyon.decode_binary(
+                            await self.reader.readexactly(n))
+                    except asyncio.IncompleteReadError:
+                        return
+                else:
+                    line = await self.reader.readline()
+                    if not line:
+                        return
+                    mod = pyon.decode(line.decode())
 
                 if mod["action"] == "init":
                     target = self.target_builder(mod["struct"])
@@ -167,14 +275,21 @@ class Notifier:
                                "i": i, "x": x})
 
     def pop(self, i=-1):
-        """Pop an element from a list. The returned element is not
-        encapsulated in a ``Notifier`` and its mutations are no longer
+        """Pop an element from a list or dictionary. The returned element is
+        not encapsulated in a ``Notifier`` and its mutations are no longer
         tracked."""
         r = self._backing_struct.pop(i)
         if self.root.publish is not None:
-            self.root.publish({"action": "pop",
-                               "path": self._path,
-                               "i": i})
+            if isinstance(self._backing_struct, dict):
+                # Same effect, and subscribers can tell which item is
+                # affected without knowing the structure.
+                self.root.publish({"action": "delitem",
+                                   "path": self._path,
+                                   "key": i})
+            else:
+                self.root.publish({"action": "pop",
+                                   "path": self._path,
+                                   "i": i})
         return r
 
     def __setitem__(self, key, value):
@@ -192,6 +307,15 @@ class Notifier:
                                "path": self._path,
                                "key": key})
 
+    def update(self, x):
+        """Set several items of a dictionary, publishing them as a single
+        mod."""
+        self._backing_struct.update(x)
+        if self.root.publish is not None:
+            self.root.publish({"action": "update",
+                               "path": self._path,
+                               "x": x})
+
     def __getitem__(self, key):
         item = getitem(self._backing_struct, key)
         return Notifier(item, self.root, self._path + [key])
@@ -204,20 +328,56 @@ class Publisher(AsyncioServer):
     :param notifiers: A dictionary containing the notifiers to associate with
         the ``Publisher``. The keys of the dictionary are the names of the
         notifiers to be used with ``Subscriber``.
+    :param coalesce_windows: An optional dictionary giving, for some of the
+        notifier names, a time in seconds during which the mods of the
+        notifier are held back and sent together. Within that time,
+        consecutive ``setitem`` mods on the same item are collapsed into the
+        last one.
+    :param max_queue_size: The maximum number of messages waiting to be sent
+        to each subscriber, or ``None`` for no limit. The messages pending for
+        a subscriber that falls further behind are replaced with a new
+        ``init`` message containing the whole structure.
     """
-    def __init__(self, notifiers):
+    def __init__(self, notifiers, coalesce_windows=None, max_queue_size=None):
         AsyncioServer.__init__(self)
         self.notifiers = notifiers
-        self._recipients = {k: set() for k in notifiers.keys()}
+        if coalesce_windows is None:
+            coalesce_windows = dict()
+        self.coalesce_windows = coalesce_windows
+        self.max_queue_size = max_queue_size
+        self._recipients = {k: dict() for k in notifiers.keys()}
         self._notifier_names = {id(v): k for k, v in notifiers.items()}
 
+        # Mods held back by the coalescing window, with None in place of
+        # collapsed mods, and the position in that list of the last setitem
+        # mod of each item that may still be collapsed (path -> key -> index).
+        self._pending = {k: [] for k in notifiers.keys()}
+        self._pending_setitems = {k: dict() for k in notifiers.keys()}
+        self._flush_handles = dict()
+
+        # Encoded init messages, by (binary, prefixes), for the current
+        # version of each structure. The version is incremented by each mod.
+        self._versions = {k: 0 for k in notifiers.keys()}
+        self._init_cache = {k: dict() for k in notifiers.keys()}
+
         for notifier in notifiers.values():
             notifier.publish = partial(self.publish, notifier)
 
+    async def stop(self):
+        for handle in self._flush_handles.values():
+            handle.cancel()
+        self._flush_handles.clear()
+        await AsyncioServer.stop(self)
+
     async def _handle_connection_cr(self, reader, writer):
         try:
             line = await reader.readline()
-            if line != _init_string:
+            options = line == _init_string_options
+            if line == _init_string or options:
+                binary = False
+            elif line == _init_string_binary:
+                binary = True
+            else:
                 return
 
             line = await reader.readline()
@@ -230,12 +390,23 @@ class Publisher(AsyncioServer):
             except KeyError:
                 return
 
-            obj = {"action": "init", "struct": notifier.read}
-            line = pyon.encode(obj) + "\n"
-            writer.write(line.encode())
-
-            queue = asyncio.Queue()
-            self._recipients[notifier_name].add(queue)
+            prefixes = None
+            if options:
+                line = await reader.readline()
+                if not line:
+                    return
+                options = pyon.decode(line.decode())
+                binary = bool(options.get("binary", False))
+                if options.get("prefixes") is not None:
+                    prefixes = tuple(tuple(prefix)
+                                     for prefix in options["prefixes"])
+
+            # No mod may be published between getting the init message
+            # and registering the queue below.
+            writer.write(await self._get_init(notifier_name, binary,
+                                              prefixes))
+            queue = asyncio.Queue(self.max_queue_size or 0)
+            self._recipients[notifier_name][queue] = binary, prefixes
             try:
                 while True:
                     line = await queue.get()
@@ -243,16 +414,134 @@ class Publisher(AsyncioServer):
                     # raise exception on connection error
                     await writer.drain()
             finally:
-                self._recipients[notifier_name].remove(queue)
+                del self._recipients[notifier_name][queue]
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
             # subscribers disconnecting are a normal occurence
             pass
         finally:
             writer.close()
 
+    async def _get_init(self, notifier_name, binary, prefixes):
+        # Encoding large structures takes time, so it is done in a thread
+        # and retried if the structure is modified in the meantime.
+        cache = self._init_cache[notifier_name]
+        key = binary, prefixes
+        for _ in range(3):
+            # The held back mods are already part of the structure, so they
+            # must not be sent to the new subscriber again.
+            self._flush(notifier_name)
+            if key in cache:
+                return cache[key]
+            version = self._versions[notifier_name]
+            try:
+                init = await asyncio.get_event_loop().run_in_executor(
+                    None, self._encode_init, notifier_name, binary, prefixes)
+            except RuntimeError:
+                # e.g. dictionary changed size during iteration
+                continue
+            if self._versions[notifier_name] == version:
+                cache[key] = init
+                return init
+        self._flush(notifier_name)
+        init = self._encode_init(notifier_name, binary, prefixes)
+        cache[key] = init
+        return init
+
+    def _encode_init(self, notifier_name, binary, prefixes):
+        struct = self.notifiers[notifier_name].read
+        if prefixes is not None:
+            struct = filter_struct(struct, prefixes)
+        obj = {"action": "init", "struct": struct}
+        if binary:
+            return pyon.encode_binary_frame(obj)
+        else:
+            return (pyon.encode(obj) + "\n").encode()
+
     def publish(self, notifier, mod):
-        line = pyon.encode(mod) + "\n"
-        line = line.encode()
         notifier_name = self._notifier_names[id(notifier)]
-        for recipient in self._recipients[notifier_name]:
-            recipient.put_nowait(line)
+        self._versions[notifier_name] += 1
+        if self._init_cache[notifier_name]:
+            self._init_cache[notifier_name].clear()
+        window = self.coalesce_windows.get(notifier_name)
+        if not window:
+            self._send(notifier_name, [mod])
+            return
+        if not self._recipients[notifier_name]:
+            # New subscribers will receive the whole structure.
+            return
+
+        pending = self._pending[notifier_name]
+        setitems = self._pending_setitems[notifier_name]
+        path = mod["path"]
+        # Mods inside an item depend on its earlier setitem mods.
+        for i in range(len(path)):
+            keys = setitems.get(tuple(path[:i]))
+            if keys is not None:
+                keys.pop(path[i], None)
+        if mod["action"] == "setitem" and not isinstance(mod["key"], slice):
+            keys = setitems.setdefault(tuple(path), dict())
+            index = keys.get(mod["key"])
+            if index is not None:
+                pending[index] = None
+            keys[mod["key"]] = len(pending)
+        else:
+            # e.g. list insertions, removals and slice assignments change
+            # the meaning of the keys of earlier mods.
+            setitems.pop(tuple(path), None)
+        # The values may be modified in place by later mods, which would
+        # then be applied twice by the subscribers.
+        pending.append(deepcopy(mod))
+
+        if notifier_name not in self._flush_handles:
+            self._flush_handles[notifier_name] = \
+                asyncio.get_event_loop().call_later(
+                    window, self._flush, notifier_name)
+
+    def _flush(self, notifier_name):
+        handle = self._flush_handles.pop(notifier_name, None)
+        if handle is not None:
+            handle.cancel()
+        mods = [mod for mod in self._pending[notifier_name]
+                if mod is not None]
+        self._pending[notifier_name] = []
+        self._pending_setitems[notifier_name] = dict()
+        self._send(notifier_name, mods)
+
+    def _send(self, notifier_name, mods):
+        if not mods:
+            return
+        # encode at most once per encoding and filter in use
+        encoded = dict()
+        for recipient, (binary, prefixes) in \
+                self._recipients[notifier_name].items():
+            key = "mods", binary, prefixes
+            if key not in encoded:
+                if prefixes is None:
+                    recipient_mods = mods
+                else:
+                    recipient_mods = [filter_mod(mod, prefixes)
+                                      for mod in mods]
+                    recipient_mods = [mod for mod in recipient_mods
+                                      if mod is not None]
+                if binary:
+                    encoded[key] = b"".join(
+                        pyon.encode_binary_frame(mod)
+                        for mod in recipient_mods)
+                else:
+                    encoded[key] = "".join(
+                        pyon.encode(mod) + "\n"
+                        for mod in recipient_mods).encode()
+            if not encoded[key]:
+                continue
+            try:
+                recipient.put_nowait(encoded[key])
+            except asyncio.QueueFull:
+                # The subscriber is too slow: drop what it has not received
+                # yet and send it the current structure instead.
+                while not recipient.empty():
+                    recipient.get_nowait()
+                cache = self._init_cache[notifier_name]
+                if (binary, prefixes) not in cache:
+                    cache[binary, prefixes] = self._encode_init(
+                        notifier_name, binary, prefixes)
+                recipient.put_nowait(cache[binary, prefixes])
@@ -0,0 +1,96 @@
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from artiq.compiler.dwarf import Symbolizer
+
+
+source = """
+static inline __attribute__((always_inline)) int leaf(int x) {
+    if (x > 3)
+        return 7*x;
+    return x - 2;
+}
+static inline __attribute__((always_inline)) int mid(int x) {
+    int r = leaf(x);
+    r += leaf(r);
+    return r;
+}
+__attribute__((noinline)) int other(int x) { return x ^ 0x55; }
+int top(int x) {
+    int s = 0;
+    for (int i = 0; i < x; i++)
+        s += mid(i) + other(i);
+    return s;
+}
+"""
+
+
+def addr2line(library, address):
+    output = subprocess.check_output(
+        ["addr2line", "--functions", "--inlines", "--exe=" + library,
+         hex(address)])
+    lines = output.decode().rstrip().split("\n")
+    backtrace = []
+    for function, location in zip(lines[::2], lines[1::2]):
+        filename, line = location.rsplit(":", 1)
+        line = line.split(" ")[0]
+        # Entries without line information are not produced by ARTIQ.
+        if filename not in ("", "??") and line not in ("?", "0"):
+            backtrace.append((filename, int(line), -1, function, address + 1))
+    return backtrace
+
+
+@unittest.skipUnless(shutil.which("cc") and shutil.which("addr2line")
+                     and shutil.which("objdump"), "no native toolchain")
+class SymbolizerCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "lib.c")
+        with open(self.src, "w") as f:
+            f.write(source)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_library(self, *flags):
+        library = os.path.join(self.tmpdir.name, "lib.so")
+        subprocess.check_call(["cc", "-shared", "-fPIC", "-o", library,
+                               self.src] + list(flags))
+        disassembly = subprocess.check_output(["objdump", "-d", library])
+        addresses = [int(address, 16) for address in re.findall(
+            r"^\s+([0-9a-f]+):", disassembly.decode(), re.M)]
+        with open(library, "rb") as f:
+            symbolizer = Symbolizer(f.read())
+
+        inlined = False
+        for address in addresses:
+            expected = addr2line(library, address)
+            backtrace = [entry for entry in symbolizer.symbolize([address + 1])
+                         if entry[1]]
+            self.assertEqual(backtrace, expected)
+            if len(backtrace) > 1:
+                inlined = True
+        return inlined
+
+    def test_dwarf2(self):
+        self.check_library("-O0", "-gdwarf-2")
+
+    def test_dwarf4_inlined(self):
+        self.assertTrue(self.check_library("-O2", "-gdwarf-4"))
+
+    def test_no_debug_info(self):
+        library = os.path.join(self.tmpdir.name, "lib.so")
+        subprocess.check_call(["cc", "-shared", "-fPIC", "-o", library,
+                               self.src])
+        with open(library, "rb") as f:
+            self.assertEqual(Symbolizer(f.read()).symbolize([0x1000]), [])
+
+    def test_not_elf(self):
+        symbolizer = Symbolizer(b"")
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                symbolizer.symbolize([0x1000])
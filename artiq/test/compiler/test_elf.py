@@ -0,0 +1,62 @@
+import os
+import shutil
+import ctypes
+import tempfile
+import subprocess
+import unittest
+
+from artiq.compiler.elf import strip_debug
+
+
+source = """
+static int helper(int x) { return 3*x; }
+int f(int x) { return helper(x) + 1; }
+"""
+
+
+def section_names(filename):
+    output = subprocess.check_output(["readelf", "-S", "-W", filename])
+    return [line.split("]", 1)[1].split()[0]
+            for line in output.decode().splitlines()
+            if line.lstrip().startswith("[") and "Nr]" not in line
+            and line.split("]", 1)[1].strip()]
+
+
+@unittest.skipUnless(shutil.which("cc") and shutil.which("readelf"),
+                     "no native toolchain")
+class StripDebugCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmpdir.name, "lib.c")
+        with open(src, "w") as f:
+            f.write(source)
+        self.library = os.path.join(self.tmpdir.name, "lib.so")
+        subprocess.check_call(["cc", "-g", "-shared", "-fPIC",
+                               "-o", self.library, src])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_strip_debug(self):
+        with open(self.library, "rb") as f:
+            library = f.read()
+        stripped = os.path.join(self.tmpdir.name, "lib_stripped.so")
+        with open(stripped, "wb") as f:
+            f.write(strip_debug(library))
+
+        names = section_names(self.library)
+        stripped_names = section_names(stripped)
+        self.assertTrue(any(name.startswith(".debug") for name in names))
+        self.assertEqual(stripped_names,
+                         [name for name in names
+                          if not name.startswith((".debug", ".rela.debug"))])
+        self.assertEqual(ctypes.CDLL(stripped).f(4), 13)
+
+    def test_idempotent(self):
+        with open(self.library, "rb") as f:
+            stripped = strip_debug(f.read())
+        self.assertEqual(strip_debug(stripped), stripped)
+
+    def test_not_elf(self):
+        with self.assertRaises(ValueError):
+            strip_debug(b"\0"*64)
@@ -0,0 +1,55 @@
+import os
+import time
+import tempfile
+import unittest
+
+from artiq.compiler.kernel_cache import KernelCache
+
+
+class DummyTarget:
+    triple = "or1k-linux"
+    data_layout = "E-m:e-p:32:32"
+    features = ["mul", "div"]
+
+
+class DummyTarget2(DummyTarget):
+    features = ["mul"]
+
+
+class KernelCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = KernelCache(self.tmpdir.name, max_size=1000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        key = self.cache.key(DummyTarget(), ["define void @f() {}"])
+        self.assertEqual(key,
+                         self.cache.key(DummyTarget(), ["define void @f() {}"]))
+        self.assertNotEqual(key,
+                            self.cache.key(DummyTarget(), ["define void @g() {}"]))
+        self.assertNotEqual(key,
+                            self.cache.key(DummyTarget2(), ["define void @f() {}"]))
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", b"library", b"stripped")
+        self.assertEqual(self.cache.get("a"), (b"library", b"stripped"))
+        self.cache.put("b", b"", b"")
+        self.assertEqual(self.cache.get("b"), (b"", b""))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_eviction(self):
+        self.cache.put("a", b"x"*300, b"x"*100)
+        self.cache.put("b", b"x"*300, b"x"*100)
+        # make "a" the most recently used entry
+        past = time.time() - 10
+        os.utime(os.path.join(self.tmpdir.name, "b.elf"), (past, past))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.cache.put("c", b"x"*300, b"x"*100)
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
@@ -290,3 +290,34 @@ class LargePayloadTest(ExperimentCase):
     def test_1MB(self):
         exp = self.create(_Payload1MB)
         exp.run()
+
+
+class _Precompile(EnvExperiment):
+    def build(self):
+        self.setattr_device("core")
+        self.x = 1
+
+    @kernel
+    def add(self, y) -> TInt32:
+        return self.x + y
+
+
+class PrecompileTest(ExperimentCase):
+    def test_precompile(self):
+        exp = self.create(_Precompile)
+        first = exp.core.precompile(exp.add, 2)
+        second = exp.core.precompile(exp.add, 3)
+        self.assertEqual(first(), 3)
+        self.assertEqual(second(), 4)
+        self.assertEqual(first(), 3)
+
+    def test_host_attribute(self):
+        exp = self.create(_Precompile)
+        kernel = exp.core.precompile(exp.add, 2)
+        exp.x = 10
+        # the kernel sees the value at compile time and does not overwrite
+        # the new one
+        self.assertEqual(kernel(), 3)
+        self.assertEqual(exp.x, 10)
+        self.assertEqual(kernel(), 3)
+        self.assertEqual(exp.x, 10)
@@ -1,7 +1,14 @@
 import os
+import time
+import socket
+import struct
+import threading
 import unittest
 
+import numpy
+
 from artiq.experiment import *
+from artiq.coredevice.comm_kernel import CommKernel
 from artiq.test.hardware_testbench import ExperimentCase
 
 
@@ -52,3 +59,88 @@ class TransferTest(ExperimentCase):
         device_to_host_rate = exp.device_to_host()
         print(device_to_host_rate, "B/s")
         self.assertGreater(device_to_host_rate, 2e6)
+
+
+class _LoopbackComm:
+    """Connects a :class:`CommKernel` to a local socket that discards
+    everything it receives, to benchmark the host side of the protocol."""
+    def __init__(self):
+        self.comm = CommKernel(None)
+        self.comm.socket, self.device = socket.socketpair()
+        self.received = 0
+        self.thread = threading.Thread(target=self._drain)
+        self.thread.start()
+
+    def _drain(self):
+        while True:
+            data = self.device.recv(1 << 20)
+            if not data:
+                break
+            self.received += len(data)
+
+    def close(self):
+        self.comm.socket.shutdown(socket.SHUT_WR)
+        self.thread.join()
+        self.comm.close()
+        self.device.close()
+
+
+class LoopbackTransferTest(unittest.TestCase):
+    def host_to_device_rate(self, tags, value):
+        loopback = _LoopbackComm()
+        try:
+            t0 = time.monotonic()
+            loopback.comm._send_rpc_value(bytearray(tags), value, value, None)
+            loopback.comm.flush()
+            t1 = time.monotonic()
+        finally:
+            loopback.close()
+        return loopback.received/(t1-t0)
+
+    def device_to_host_rate(self, data):
+        comm = CommKernel(None)
+        comm.socket, device = socket.socketpair()
+        try:
+            thread = threading.Thread(target=device.sendall, args=(data,))
+            thread.start()
+            t0 = time.monotonic()
+            comm._receive_rpc_value(None)
+            t1 = time.monotonic()
+            thread.join()
+        finally:
+            comm.close()
+            device.close()
+        return len(data)/(t1-t0)
+
+    @unittest.skipUnless(artiq_low_latency,
+                         "timings are dependent on CPU load")
+    def test_host_to_device_bytes(self):
+        rate = self.host_to_device_rate(b"B", b"\x00"*(10**6))
+        print(rate, "B/s")
+        self.assertGreater(rate, 100e6)
+
+    @unittest.skipUnless(artiq_low_latency,
+                         "timings are dependent on CPU load")
+    def test_host_to_device_int32_list(self):
+        rate = self.host_to_device_rate(b"li", list(range(10**5)))
+        print(rate, "B/s")
+        self.assertGreater(rate, 10e6)
+
+    @unittest.skipUnless(artiq_low_latency,
+                         "timings are dependent on CPU load")
+    def test_host_to_device_float_list(self):
+        rate = self.host_to_device_rate(b"lf", [float(x) for x in range(10**5)])
+        print(rate, "B/s")
+        self.assertGreater(rate, 10e6)
+
+    @unittest.skipUnless(artiq_low_latency,
+                         "timings are dependent on CPU load")
+    def test_device_to_host_int32_array(self):
+        n = 10**5
+        records = numpy.empty(n, [("tag", "u1"), ("value", ">i4")])
+        records["tag"] = ord("i")
+        records["value"] = numpy.arange(n)
+        rate = self.device_to_host_rate(
+            b"a" + struct.pack(">l", n) + records.tobytes())
+        print(rate, "B/s")
+        self.assertGreater(rate, 10e6)
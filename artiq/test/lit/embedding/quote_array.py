@@ -0,0 +1,28 @@
+# RUN: env ARTIQ_DUMP_UNOPT_LLVM=%t %python -m artiq.compiler.testbench.embedding +compile %s
+# RUN: OutputCheck %s --file-to-check=%t_unopt.ll
+
+from artiq.language.core import *
+from artiq.language.types import *
+import numpy
+
+# Lists and arrays of scalars are embedded as a single constant blob, in the
+# byte order of the target (big-endian OR1K).
+# CHECK-L: constant { [0 x i32], [16 x i8] } { [0 x i32] zeroinitializer, [16 x i8] c"\00\00\00\01\00\00\00\02\00\00\00\03\00\00\00\04" }
+int32_array = numpy.array([1, 2, 3, 4], dtype=numpy.int32)
+# CHECK-L: constant { [0 x i64], [16 x i8] } { [0 x i64] zeroinitializer, [16 x i8] c"\00\00\00\00\00\00\00\01\00\00\00\02\00\00\00\00" }
+int_list = [1, 2**33]
+# CHECK-L: constant { [0 x i1], [3 x i8] } { [0 x i1] zeroinitializer, [3 x i8] c"\01\00\01" }
+bool_list = [True, False, True]
+
+@kernel
+def entrypoint():
+    s = 0
+    for x in int32_array:
+        s += x
+    t = int64(0)
+    for y in int_list:
+        t += y
+    n = 0
+    for z in bool_list:
+        if z:
+            n += 1
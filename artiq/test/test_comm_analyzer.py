@@ -0,0 +1,285 @@
+import io
+import os
+import random
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+import numpy
+import h5py
+
+from artiq.coredevice.comm_analyzer import (
+    get_analyzer_dump, receive_analyzer_dump, load_dump,
+    decode_dump, decode_message, decoded_dump_to_vcd, get_message_time,
+    decoded_dump_to_tables, decoded_dump_to_file, get_device_channels,
+    MessageType, ExceptionType, OutputMessage, StoppedMessage)
+
+
+def encode_message(message_type, channel, data=0, address=0, rtio_counter=0,
+                   timestamp=0):
+    return struct.pack(">QIQQI", data, address, rtio_counter, timestamp,
+                       (channel << 2) | message_type.value)
+
+
+def encode_dump(messages, log_channel=0, dds_onehot_sel=0):
+    data = b"".join(messages)
+    return struct.pack(">IQbbb", len(data), len(data), 0, log_channel,
+                       dds_onehot_sel) + data
+
+
+def random_messages(n, channels=8, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        message_type = rng.choice([MessageType.output, MessageType.input,
+                                   MessageType.exception])
+        if message_type == MessageType.exception:
+            address = rng.choice(list(ExceptionType)).value
+        else:
+            address = rng.randrange(2)
+        messages.append(encode_message(
+            message_type, rng.randrange(channels),
+            data=rng.randrange(2**64), address=address,
+            rtio_counter=rng.randrange(2**40),
+            timestamp=rng.randrange(2**40)))
+    messages.append(encode_message(MessageType.stopped, 0,
+                                   rtio_counter=2**41))
+    return messages
+
+
+class AnalyzerDecodeCase(unittest.TestCase):
+    def test_decode(self):
+        messages = random_messages(1000)
+        dump = decode_dump(encode_dump(messages, log_channel=3,
+                                       dds_onehot_sel=1))
+        self.assertEqual(dump.log_channel, 3)
+        self.assertIs(dump.dds_onehot_sel, True)
+        self.assertEqual(dump.messages,
+                         [decode_message(m) for m in messages])
+        self.assertIsInstance(dump.messages[-1], StoppedMessage)
+
+        self.assertEqual(dump.channel.tolist(),
+                         [getattr(m, "channel", 0) for m in dump.messages])
+        self.assertEqual(dump.time.tolist(),
+                         [get_message_time(m) for m in dump.messages])
+        order = dump.sort_order().tolist()
+        self.assertEqual([dump.messages[i] for i in order],
+                         sorted(dump.messages, key=get_message_time))
+
+    def test_bad_length(self):
+        with self.assertRaises(ValueError):
+            decode_dump(encode_dump(random_messages(3))[:-1])
+
+    def test_vcd(self):
+        devices = {
+            "core": {
+                "type": "local",
+                "module": "artiq.coredevice.core",
+                "class": "Core",
+                "arguments": {"host": None, "ref_period": 1e-9}
+            },
+            "ttl0": {
+                "type": "local",
+                "module": "artiq.coredevice.ttl",
+                "class": "TTLOut",
+                "arguments": {"channel": 1}
+            }
+        }
+        messages = [
+            encode_message(MessageType.output, 1, data=1, timestamp=20,
+                           rtio_counter=10),
+            encode_message(MessageType.output, 1, data=0, timestamp=15,
+                           rtio_counter=11),
+            encode_message(MessageType.stopped, 0, rtio_counter=30)
+        ]
+        out = io.StringIO()
+        decoded_dump_to_vcd(out, devices, decode_dump(encode_dump(messages)))
+        lines = out.getvalue().splitlines()
+        self.assertIn("$timescale 1000ps $end", lines)
+        changes = lines[lines.index("#0"):]
+        self.assertEqual([l for l in changes if l.startswith("#")],
+                         ["#0", "#5"])
+        # ttl0 is the first VCD channel, with code "!"
+        self.assertEqual([l for l in changes if l[1:] == "!"], ["0!", "1!"])
+
+
+class AnalyzerCaptureCase(unittest.TestCase):
+    def serve(self, data):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        def send():
+            conn, _ = server.accept()
+            with conn:
+                for i in range(0, len(data), 1000):
+                    conn.sendall(data[i:i+1000])
+        thread = threading.Thread(target=send)
+        thread.start()
+        self.addCleanup(thread.join)
+        return server.getsockname()
+
+    def test_get(self):
+        data = encode_dump(random_messages(1000))
+        host, port = self.serve(data)
+        self.assertEqual(get_analyzer_dump(host, port), data)
+
+    def test_receive(self):
+        data = encode_dump(random_messages(1000))
+        host, port = self.serve(data)
+        with tempfile.TemporaryFile() as f:
+            dump = receive_analyzer_dump(host, f, port)
+            self.assertEqual(dump[:], data)
+            f.seek(0)
+            self.assertEqual(f.read(), data)
+            self.assertEqual(decode_dump(load_dump(f)).messages,
+                             decode_dump(data).messages)
+
+    def test_truncated(self):
+        data = encode_dump(random_messages(10))
+        host, port = self.serve(data[:-1])
+        with self.assertRaises(IOError):
+            get_analyzer_dump(host, port)
+
+
+def encode_log(channel, timestamp, text):
+    data = text.encode()
+    data += bytes(-len(data) % 4)
+    return [encode_message(MessageType.output, channel,
+                           data=int.from_bytes(data[i:i+4], "big"),
+                           timestamp=timestamp)
+            for i in range(0, len(data), 4)]
+
+
+class AnalyzerExportCase(unittest.TestCase):
+    devices = {
+        "core": {
+            "type": "local",
+            "module": "artiq.coredevice.core",
+            "class": "Core",
+            "arguments": {"host": None, "ref_period": 1e-9}
+        },
+        "ttl0": {
+            "type": "local",
+            "module": "artiq.coredevice.ttl",
+            "class": "TTLInOut",
+            "arguments": {"channel": 0}
+        },
+        "clkgen": {
+            "type": "local",
+            "module": "artiq.coredevice.ttl",
+            "class": "TTLClockGen",
+            "arguments": {"channel": 1}
+        },
+        "spi": {
+            "type": "local",
+            "module": "artiq.coredevice.spi",
+            "class": "SPIMaster",
+            "arguments": {"channel": 2}
+        },
+        "dds_bus": {
+            "type": "local",
+            "module": "artiq.coredevice.dds",
+            "class": "DDSGroupAD9914",
+            "arguments": {"sysclk": 2**32}
+        },
+        "dds0": {
+            "type": "local",
+            "module": "artiq.coredevice.dds",
+            "class": "DDSChannelAD9914",
+            "arguments": {"bus_channel": 3, "channel": 0}
+        }
+    }
+
+    def dump(self):
+        output, input = MessageType.output, MessageType.input
+        messages = [
+            encode_message(output, 0, data=1, address=0, timestamp=110,
+                           rtio_counter=100),
+            encode_message(output, 0, data=0, address=0, timestamp=100,
+                           rtio_counter=90),
+            encode_message(output, 0, data=0, address=1, timestamp=120,
+                           rtio_counter=100),
+            encode_message(input, 0, data=1, timestamp=130),
+            encode_message(output, 1, data=2**24, timestamp=100),
+            encode_message(output, 2, data=0xab, address=0, timestamp=100),
+            encode_message(output, 2, data=0, address=0b100, timestamp=110),
+            encode_message(input, 2, data=0xcd, timestamp=115,
+                           rtio_counter=125),
+            encode_message(output, 3, data=0, address=0x81, timestamp=1),
+            encode_message(output, 3, data=2, address=0x2d, timestamp=2),
+            encode_message(output, 3, data=1, address=0x2f, timestamp=3),
+            encode_message(output, 3, address=0x80, timestamp=4),
+            encode_message(MessageType.exception, 2,
+                           address=ExceptionType.o_underflow.value,
+                           rtio_counter=5)
+        ]
+        messages += encode_log(4, 200, "chan\x1Ehello\x1D")
+        messages.append(encode_message(MessageType.stopped, 0,
+                                       rtio_counter=1000))
+        return decode_dump(encode_dump(messages, log_channel=4))
+
+    def check(self, tables):
+        self.assertEqual(tables["ttl/ttl0/output"].tolist(),
+                         [(100, 0, 10e-9), (110, 1, 10e-9)])
+        self.assertEqual(tables["ttl/ttl0/oe"].tolist(), [(120, 0, 20e-9)])
+        self.assertEqual(tables["ttl/ttl0/input"].tolist(), [(130, 1)])
+        numpy.testing.assert_allclose(
+            tables["ttl_clkgen/clkgen"]["frequency"], [1e9])
+        self.assertEqual(tables["spi/spi/write"][["timestamp", "address",
+                                                  "data"]].tolist(),
+                         [(100, 0, 0xab)])
+        self.assertEqual(tables["spi/spi/read"].tolist(),
+                         [(110, 0, 0xcd, 15)])
+        dds = tables["dds/dds0"]
+        self.assertEqual(dds[["timestamp", "frequency"]].tolist(),
+                         [(4, 2 + 2**16)])
+        self.assertTrue(numpy.isnan(dds["phase"][0]))
+        self.assertEqual(tables["log"].tolist(), [(200, b"chan", b"hello")])
+        self.assertEqual(tables["exceptions"].tolist(),
+                         [(5, 2, ExceptionType.o_underflow.value)])
+
+    def test_tables(self):
+        tables, ref_period = decoded_dump_to_tables(self.devices, self.dump())
+        self.assertEqual(ref_period, 1e-9)
+        self.check(tables)
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "dump.npz")
+            decoded_dump_to_file(filename, self.devices, self.dump())
+            with numpy.load(filename) as f:
+                self.assertEqual(f["ref_period"], 1e-9)
+                self.check(f)
+
+            filename = os.path.join(tmpdir, "dump.h5")
+            decoded_dump_to_file(filename, self.devices, self.dump())
+            with h5py.File(filename, "r") as f:
+                self.assertEqual(f["ref_period"][()], 1e-9)
+                self.check({name: f[name][()] for name in [
+                    "ttl/ttl0/output", "ttl/ttl0/oe", "ttl/ttl0/input",
+                    "ttl_clkgen/clkgen", "spi/spi/write", "spi/spi/read",
+                    "dds/dds0", "log", "exceptions"]})
+
+
+class AnalyzerFilterCase(unittest.TestCase):
+    def test_filter(self):
+        dump = decode_dump(encode_dump(random_messages(1000)))
+        expected = [m for m in dump.messages
+                    if isinstance(m, StoppedMessage)
+                    or (m.channel in {1, 3}
+                        and 2**38 <= get_message_time(m) < 2**39)]
+        self.assertEqual(dump.filter({1, 3}, 2**38, 2**39).messages,
+                         expected)
+        self.assertEqual(dump.filter().messages, dump.messages)
+        self.assertEqual(dump.filter([]).messages, dump.messages[-1:])
+
+    def test_device_channels(self):
+        devices = AnalyzerExportCase.devices
+        self.assertEqual(get_device_channels(devices, "ttl0"), {0})
+        self.assertEqual(get_device_channels(devices, "dds0"), {3})
+        with self.assertRaises(ValueError):
+            get_device_channels(devices, "core")
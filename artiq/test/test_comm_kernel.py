@@ -0,0 +1,151 @@
+import socket
+import struct
+import unittest
+
+import numpy
+
+from artiq.coredevice.comm_kernel import CommKernel, RPCReturnValueError
+
+
+def encode_rpc_value(tag, value):
+    # Mirrors the encoding of session.c:send_rpc_value for the tags used
+    # below.
+    if tag == "b":
+        return b"b" + struct.pack("B", value)
+    elif tag == "i":
+        return b"i" + struct.pack(">l", value)
+    elif tag == "I":
+        return b"I" + struct.pack(">q", value)
+    elif tag == "f":
+        return b"f" + struct.pack(">d", value)
+    elif tag == "s":
+        data = value.encode()
+        return b"s" + struct.pack(">l", len(data)) + data
+    elif tag[0] in "la":
+        return (tag[0].encode() + struct.pack(">l", len(value)) +
+                b"".join(encode_rpc_value(tag[1:], elt) for elt in value))
+    else:
+        raise ValueError("unsupported tag")
+
+
+class RPCValueCase(unittest.TestCase):
+    def setUp(self):
+        self.comm = CommKernel(None)
+        self.comm.socket, self.device = socket.socketpair()
+
+    def tearDown(self):
+        self.comm.close()
+        self.device.close()
+
+    def receive(self, data):
+        self.device.sendall(data)
+        return self.comm._receive_rpc_value(None)
+
+    def test_scalars(self):
+        self.assertIs(self.receive(encode_rpc_value("b", 1)), True)
+        value = self.receive(encode_rpc_value("i", -3))
+        self.assertEqual(value, -3)
+        self.assertIsInstance(value, numpy.int32)
+        value = self.receive(encode_rpc_value("I", 2**40))
+        self.assertEqual(value, 2**40)
+        self.assertIsInstance(value, numpy.int64)
+
+    def test_lists(self):
+        for tag, elts, elt_type in [
+                ("b", [True, False, True], bool),
+                ("i", [1, -2, 2**31 - 1], numpy.int32),
+                ("I", [1, -2, 2**40], numpy.int64),
+                ("f", [1.5, -2.0, 1e100], float)]:
+            value = self.receive(encode_rpc_value("l" + tag, elts))
+            self.assertIsInstance(value, list)
+            self.assertEqual(value, elts)
+            for elt in value:
+                self.assertIs(type(elt), elt_type)
+
+    def test_arrays(self):
+        for tag, dtype in [("b", numpy.bool_), ("i", numpy.int32),
+                           ("I", numpy.int64), ("f", numpy.float64)]:
+            elts = numpy.arange(10000).astype(dtype)
+            value = self.receive(encode_rpc_value("a" + tag, elts.tolist()))
+            self.assertEqual(value.dtype, dtype)
+            numpy.testing.assert_array_equal(value, elts)
+
+    def test_empty(self):
+        self.assertEqual(self.receive(encode_rpc_value("li", [])), [])
+        self.assertEqual(len(self.receive(encode_rpc_value("ai", []))), 0)
+
+    def test_nested(self):
+        value = [["a", "b"], [], ["c"]]
+        self.assertEqual(self.receive(encode_rpc_value("lls", value)), value)
+        value = [[1, 2], [3]]
+        self.assertEqual(self.receive(encode_rpc_value("lli", value)), value)
+
+    def test_inconsistent_tags(self):
+        data = encode_rpc_value("li", [1, 2])
+        data = data[:-5] + b"I" + data[-4:]
+        with self.assertRaises(IOError):
+            self.receive(data)
+
+
+class RPCReturnValueCase(unittest.TestCase):
+    def setUp(self):
+        self.comm = CommKernel(None)
+        self.comm.socket, self.device = socket.socketpair()
+
+    def tearDown(self):
+        self.comm.close()
+        self.device.close()
+
+    def send(self, tags, value):
+        self.comm._send_rpc_value(bytearray(tags), value, value, None)
+        self.comm.flush()
+        self.device.setblocking(False)
+        data = b""
+        try:
+            while True:
+                chunk = self.device.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        except BlockingIOError:
+            pass
+        return data
+
+    def test_lists(self):
+        for tag, elts in [
+                ("b", [True, False, True]),
+                ("i", [1, -2, 2**31 - 2, numpy.int32(7), True]),
+                ("I", [1, -2, 2**40, numpy.int32(7), numpy.int64(-2**40)]),
+                ("f", [1.5, -2.0, 1e100, numpy.float64(3.0)])]:
+            # The host does not send the element tags.
+            expected = b"".join(encode_rpc_value(tag, elt)[1:]
+                                for elt in elts)
+            self.assertEqual(self.send(b"l" + tag.encode(), elts),
+                             struct.pack(">l", len(elts)) + expected)
+
+    def test_large_list(self):
+        elts = list(range(10**4))
+        data = self.send(b"li", elts)
+        self.assertEqual(data[:4], struct.pack(">l", len(elts)))
+        numpy.testing.assert_array_equal(
+            numpy.frombuffer(data[4:], ">i4"), elts)
+
+    def test_nested(self):
+        self.assertEqual(self.send(b"lli", [[1], []]),
+                         struct.pack(">llll", 2, 1, 1, 0))
+
+    def test_type_mismatch(self):
+        for tags, value in [(b"li", [1, 2.0]), (b"li", [1, 2**31]),
+                            (b"lI", [1, 2**70]), (b"lf", [1.0, 2]),
+                            (b"lb", [True, 1])]:
+            with self.assertRaises(RPCReturnValueError):
+                self.send(tags, value)
+
+    def test_buffered(self):
+        self.comm._write_int32(1)
+        self.comm._write_int32(2)
+        self.device.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            self.device.recv(8)
+        self.comm.flush()
+        self.assertEqual(self.device.recv(8), struct.pack(">ll", 1, 2))
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from artiq.master.databases import DatasetDB, _write_datasets
+from artiq.protocols import pyon
+
+
+class DatasetDBJournalCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.persist_file = os.path.join(self.tmpdir, "dataset_db.pyon")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def open(self, persist_file=None, **kwargs):
+        if persist_file is None:
+            persist_file = self.persist_file
+        db = DatasetDB(persist_file, journal=True, **kwargs)
+        self.addCleanup(db._journal.close)
+        return db
+
+    def reopen(self, db, **kwargs):
+        db._journal.close()
+        return self.open(db.persist_file, **kwargs)
+
+    def modify(self, db):
+        db.set("a", 1, persist=True)
+        db.set("b", [1, 2], persist=True)
+        db.set("tmp", 3, persist=False)
+        db.update({"action": "append", "path": ["b", 1], "x": 3})
+        db.update({"action": "setitem", "path": ["b", 1], "key": 0,
+                   "value": 4})
+        db.set("c", 5, persist=True)
+        db.delete("c")
+        db.set("a", 6, persist=False)
+        db.set("tmp", 7, persist=True)
+
+    def check(self, db):
+        self.assertEqual(db.data.read, {"b": (True, [4, 2, 3]),
+                                        "tmp": (True, 7)})
+
+    def test_replay(self):
+        db = self.open()
+        self.modify(db)
+        self.assertFalse(os.path.exists(self.persist_file))
+        self.check(self.reopen(db))
+
+    def test_compact(self):
+        db = self.open()
+        db.set("a", 1, persist=True)
+        db.save()
+        self.modify(db)
+        db.save()
+        size = db._journal.size
+        db = self.reopen(db)
+        self.check(db)
+        self.assertEqual(db._journal.size, size)
+
+    def test_truncated(self):
+        db = self.open()
+        self.modify(db)
+        journal = db._journal.filename
+        db._journal.close()
+        with open(journal, "ab") as f:
+            f.write(b"\x00\x00\x00\x00\x00\x00\x01\x00garbage")
+        db = self.open()
+        self.check(db)
+        db.set("d", 8, persist=True)
+        db = self.reopen(db)
+        self.assertEqual(db.get("d"), 8)
+
+    def test_stale_journal(self):
+        db = self.open()
+        db.set("a", 1, persist=True)
+        db.save()
+        journal = db._journal.filename
+        db.set("a", 2, persist=True)
+        db._journal.close()
+        stale = journal + ".old"
+        shutil.copy(journal, stale)
+        db = self.open()
+        db.save()
+        db._journal.close()
+        # The journal applies to the previous contents of the dataset file.
+        shutil.copy(stale, journal)
+        db = self.open()
+        db.set("b", 3, persist=True)
+        db = self.reopen(db)
+        self.assertEqual(db.data.read, {"a": (True, 2), "b": (True, 3)})
+
+    def test_crash_after_snapshot(self):
+        db = self.open()
+        db.set("a", 1, persist=True)
+        data = db._take_snapshot()
+        # modified while the snapshot is being written
+        db.set("b", 2, persist=True)
+        tmpname, digest = _write_datasets(db.persist_file, data)
+        # crash after the dataset file is replaced, before its journal
+        db._journal.commit = lambda: None
+        db._commit_snapshot(tmpname, digest, 0)
+        db = self.reopen(db)
+        self.assertEqual(db.data.read, {"a": (True, 1), "b": (True, 2)})
+        self.assertFalse(os.path.exists(db._journal.pending_filename))
+
+    def test_crash_before_snapshot(self):
+        db = self.open()
+        db.set("a", 1, persist=True)
+        db.save()
+        db.set("b", 2, persist=True)
+        # crash before the dataset file is replaced
+        db._journal.prepare("0"*40)
+        db = self.reopen(db)
+        self.assertEqual(db.data.read, {"a": (True, 1), "b": (True, 2)})
+        self.assertFalse(os.path.exists(db._journal.pending_filename))
+
+    def test_hdf5(self):
+        db = self.open(os.path.join(self.tmpdir, "dataset_db.h5"))
+        array = numpy.arange(12, dtype=numpy.float64).reshape(3, 4)
+        db.set("array", array, persist=True)
+        db.set("path/array", numpy.arange(3), persist=True)
+        db.set("text", "hello", persist=True)
+        db.set("list", [1, "a"], persist=True)
+        db.save()
+        db.set("scalar", 1.5, persist=True)
+        db = self.reopen(db)
+        numpy.testing.assert_array_equal(db.get("array"), array)
+        numpy.testing.assert_array_equal(db.get("path/array"),
+                                         numpy.arange(3))
+        self.assertEqual(db.get("text"), "hello")
+        self.assertEqual(db.get("list"), [1, "a"])
+        self.assertEqual(db.get("scalar"), 1.5)
+
+
+class DatasetDBSnapshotCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.persist_file = os.path.join(self.tmpdir, "dataset_db.pyon")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.tmpdir)
+
+    def snapshot_while_modifying(self, db):
+        async def do():
+            task = asyncio.ensure_future(db.save_async())
+            await asyncio.sleep(0)
+            db.update({"action": "append", "path": ["a", 1], "x": 3})
+            db.update({"action": "setitem", "path": ["b", 1], "key": 0,
+                       "value": 4})
+            db.set("c", 5, persist=True)
+            await task
+        self.loop.run_until_complete(do())
+
+    def test_copy_on_write(self):
+        db = DatasetDB(self.persist_file)
+        a = [1, 2]
+        db.set("a", a, persist=True)
+        db.set("b", [0], persist=True)
+        self.snapshot_while_modifying(db)
+        self.assertEqual(pyon.load_file(self.persist_file),
+                         {"a": [1, 2], "b": [0]})
+        self.assertEqual(a, [1, 2])
+        self.assertEqual(db.data.read, {"a": (True, [1, 2, 3]),
+                                        "b": (True, [4]),
+                                        "c": (True, 5)})
+
+        stats = db.get_snapshot_stats()
+        self.assertEqual(stats["count"], 1)
+        self.assertEqual(stats["last_size"],
+                         os.path.getsize(self.persist_file))
+        self.assertGreaterEqual(stats["max_duration"],
+                                stats["last_duration"])
+
+    def test_journal(self):
+        db = DatasetDB(self.persist_file, journal=True)
+        db.set("a", [1, 2], persist=True)
+        db.set("b", [0], persist=True)
+        self.snapshot_while_modifying(db)
+        db._journal.close()
+        db = DatasetDB(self.persist_file, journal=True)
+        self.addCleanup(db._journal.close)
+        self.assertEqual(db.data.read, {"a": (True, [1, 2, 3]),
+                                        "b": (True, [4]),
+                                        "c": (True, 5)})
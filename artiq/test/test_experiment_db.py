@@ -0,0 +1,135 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from artiq.master.experiments import ExperimentDB, FilesystemBackend
+from artiq.master.worker import Worker
+from artiq.protocols import pyon
+
+
+experiment_template = """
+from artiq.experiment import *
+
+
+class {class_name}(EnvExperiment):
+    \"\"\"{name}\"\"\"
+    def build(self):
+        pass
+
+    def run(self):
+        pass
+"""
+
+
+class ExperimentDBCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.tmpdir = tempfile.mkdtemp()
+        self.repo = os.path.join(self.tmpdir, "repository")
+        os.mkdir(self.repo)
+        self.cache_file = os.path.join(self.tmpdir, "repository_cache.pyon")
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, filename, class_name, name):
+        path = os.path.join(self.repo, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(experiment_template.format(class_name=class_name,
+                                               name=name))
+
+    def open(self, cache=True, **kwargs):
+        db = ExperimentDB(FilesystemBackend(self.repo), dict(),
+                          cache_file=self.cache_file if cache else None,
+                          **kwargs)
+        self.addCleanup(db.close)
+        return db
+
+    def scan(self, db):
+        # Returns the files examined by a worker.
+        with mock.patch.object(Worker, "examine", autospec=True,
+                               side_effect=Worker.examine) as examine:
+            self.loop.run_until_complete(db.scan_repository())
+        return sorted(os.path.relpath(call[0][2], self.repo)
+                      for call in examine.call_args_list)
+
+    def test_cache(self):
+        self.write("a.py", "A", "Experiment A")
+        self.write("b.py", "B", "Experiment B")
+        db = self.open()
+        self.assertEqual(self.scan(db), ["a.py", "b.py"])
+        self.assertEqual(set(db.explist.read),
+                         {"Experiment A", "Experiment B"})
+
+        # unchanged files are not examined again
+        self.assertEqual(self.scan(db), [])
+        self.assertEqual(set(db.explist.read),
+                         {"Experiment A", "Experiment B"})
+
+        # the description of a removed file is dropped
+        os.unlink(os.path.join(self.repo, "b.py"))
+        self.assertEqual(self.scan(db), [])
+        self.assertEqual(set(db.explist.read), {"Experiment A"})
+        self.assertEqual(len(db._scan_cache), 1)
+
+    def test_cache_file(self):
+        self.write("a.py", "A", "Experiment A")
+        self.write("b.py", "B", "Experiment B")
+        db = self.open()
+        self.scan(db)
+        explist = db.explist.read
+        db.close()
+
+        # the experiment list is available before scanning
+        db = self.open()
+        self.assertEqual(db.explist.read, explist)
+        self.write("b.py", "B", "Experiment B2")
+        self.assertEqual(self.scan(db), ["b.py"])
+        self.assertEqual(set(db.explist.read),
+                         {"Experiment A", "Experiment B2"})
+
+    def test_cache_file_version(self):
+        self.write("a.py", "A", "Experiment A")
+        db = self.open()
+        self.scan(db)
+        db.close()
+
+        cache = pyon.load_file(self.cache_file)
+        cache["artiq_version"] = "0.0"
+        pyon.store_file(self.cache_file, cache)
+        db = self.open()
+        self.assertEqual(db.explist.read, dict())
+        self.assertEqual(self.scan(db), ["a.py"])
+
+    def test_parallel_scan(self):
+        for i in range(6):
+            self.write("dup{}.py".format(i), "Dup{}".format(i), "Duplicate")
+            self.write(os.path.join("sub", "exp{}.py".format(i)),
+                       "Exp", "Experiment {}".format(i))
+        self.write(os.path.join("sub", "dup.py"), "Dup", "Duplicate")
+        with open(os.path.join(self.repo, "broken.py"), "w") as f:
+            f.write("raise ValueError\n")
+
+        explists = []
+        for scan_workers in 1, 4:
+            db = self.open(cache=False, scan_workers=scan_workers)
+            with self.assertLogs("artiq.master.experiments", "WARNING"):
+                examined = self.scan(db)
+            self.assertEqual(len(examined), 14)
+            explists.append(db.explist.read)
+        self.assertEqual(explists[0], explists[1])
+
+        explist = explists[0]
+        self.assertEqual(len(explist), 13)
+        # duplicates are renamed in file name order
+        self.assertEqual(explist["Duplicate"]["file"], "dup0.py")
+        self.assertEqual(explist["Duplicate5"]["file"], "dup5.py")
+        self.assertEqual(explist["Duplicate5"]["class_name"], "Dup5")
+        self.assertEqual(explist["sub/Duplicate"]["file"],
+                         os.path.join("sub", "dup.py"))
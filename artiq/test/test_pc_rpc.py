@@ -30,12 +30,12 @@ class RPCCase(unittest.TestCase):
                     proc.kill()
                     raise
 
-    def _blocking_echo(self, target):
+    def _blocking_echo(self, target, binary=True):
         for attempt in range(100):
             time.sleep(.2)
             try:
                 remote = pc_rpc.Client(test_address, test_port,
-                                       target)
+                                       target, binary=binary)
             except ConnectionRefusedError:
                 pass
             else:
@@ -57,12 +57,16 @@ class RPCCase(unittest.TestCase):
     def test_blocking_echo_autotarget(self):
         self._run_server_and_test(self._blocking_echo, pc_rpc.AutoTarget)
 
-    async def _asyncio_echo(self, target):
+    def test_blocking_echo_text(self):
+        self._run_server_and_test(self._blocking_echo, "test", False)
+
+    async def _asyncio_echo(self, target, binary=True):
         remote = pc_rpc.AsyncioClient()
         for attempt in range(100):
             await asyncio.sleep(.2)
             try:
-                await remote.connect_rpc(test_address, test_port, target)
+                await remote.connect_rpc(test_address, test_port, target,
+                                         binary)
             except ConnectionRefusedError:
                 pass
             else:
@@ -78,11 +82,11 @@ class RPCCase(unittest.TestCase):
         finally:
             remote.close_rpc()
 
-    def _loop_asyncio_echo(self, target):
+    def _loop_asyncio_echo(self, target, binary=True):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(self._asyncio_echo(target))
+            loop.run_until_complete(self._asyncio_echo(target, binary))
         finally:
             loop.close()
 
@@ -92,6 +96,9 @@ class RPCCase(unittest.TestCase):
     def test_asyncio_echo_autotarget(self):
         self._run_server_and_test(self._loop_asyncio_echo, pc_rpc.AutoTarget)
 
+    def test_asyncio_echo_text(self):
+        self._run_server_and_test(self._loop_asyncio_echo, "test", False)
+
 
 class FireAndForgetCase(unittest.TestCase):
     def _set_ok(self):
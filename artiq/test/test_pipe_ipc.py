@@ -3,7 +3,9 @@ import sys
 import asyncio
 import os
 
-from artiq.protocols import pipe_ipc
+import numpy as np
+
+from artiq.protocols import pipe_ipc, pyon
 
 
 class IPCCase(unittest.TestCase):
@@ -38,6 +40,53 @@ class IPCCase(unittest.TestCase):
         self.loop.run_until_complete(self._coro_test(True))
 
 
+class SharedMemoryArraysCase(unittest.TestCase):
+    def setUp(self):
+        self.shm = pipe_ipc.SharedMemoryArrays(threshold=1024)
+        if not self.shm.available:
+            self.skipTest("shared memory not available")
+
+    def tearDown(self):
+        self.shm.cleanup()
+
+    def test_transfer(self):
+        obj = {"small": np.arange(4), "large": np.arange(10000.)[::2]}
+        frame = pyon.encode_binary_frame(obj, self.shm.put)
+        self.assertLess(len(frame), 1024)
+        self.assertEqual(len(self.shm._sent), 1)
+        result = pyon.decode_binary(frame[pyon.binary_frame_header.size:],
+                                    self.shm.get)
+        for k in obj:
+            np.testing.assert_equal(result[k], obj[k])
+        result["large"][0] = 42
+        name, = self.shm._sent
+        self.assertFalse(os.path.exists(os.path.join(pipe_ipc._shm_dir,
+                                                     name)))
+
+    def test_cleanup(self):
+        name = self.shm.put(np.zeros(1000))
+        path = os.path.join(pipe_ipc._shm_dir, name)
+        self.assertTrue(os.path.exists(path))
+        self.shm.cleanup()
+        self.assertFalse(os.path.exists(path))
+
+    def test_acknowledge(self):
+        name = self.shm.put(np.zeros(1000))
+        self.shm.get(name)
+        self.shm.acknowledge()
+        self.assertEqual(self.shm._sent, set())
+        # a segment of the same name created by someone else survives
+        path = os.path.join(pipe_ipc._shm_dir, name)
+        open(path, "wb").close()
+        self.addCleanup(os.unlink, path)
+        self.shm.cleanup()
+        self.assertTrue(os.path.exists(path))
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            self.shm.get("../artiq-1-x")
+
+
 def run_child_blocking():
     child_comm = pipe_ipc.ChildComm(sys.argv[2])
     while True:
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from artiq.master.worker_db import (RIDCounter, append_rid_index,
+                                    rid_index_filename)
+
+
+class RIDCounterCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.results_dir = os.path.join(self.tmpdir, "results")
+        self.cache_filename = os.path.join(self.tmpdir, "last_rid.pyon")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_result(self, day, hour, rid, index=True):
+        day_dir = os.path.join(self.results_dir, day)
+        hour_dir = os.path.join(day_dir, hour)
+        os.makedirs(hour_dir, exist_ok=True)
+        open(os.path.join(hour_dir, "{:09}-Exp.h5".format(rid)), "w").close()
+        if index:
+            append_rid_index(day_dir, rid)
+
+    def next_rid(self, **kwargs):
+        if os.path.exists(self.cache_filename):
+            os.unlink(self.cache_filename)
+        return RIDCounter(self.cache_filename, self.results_dir,
+                          **kwargs).get()
+
+    def test_empty(self):
+        self.assertEqual(self.next_rid(), 0)
+        os.makedirs(self.results_dir)
+        self.assertEqual(self.next_rid(), 0)
+
+    def test_index(self):
+        # RIDs are not ordered by day: runs can be scheduled long after
+        # they were submitted.
+        self.write_result("2017-01-01", "10", 12)
+        self.write_result("2017-01-01", "11", 10)
+        self.write_result("2017-01-02", "09", 11)
+        self.assertEqual(self.next_rid(), 13)
+
+        # Files not in the index are not looked at, unless verifying.
+        self.write_result("2017-01-02", "10", 20, index=False)
+        self.assertEqual(self.next_rid(), 13)
+        self.assertEqual(self.next_rid(verify_index=True), 21)
+        # The index has been fixed.
+        self.assertEqual(self.next_rid(), 21)
+
+    def test_unindexed(self):
+        self.write_result("2017-01-01", "10", 5, index=False)
+        self.write_result("2017-01-02", "10", 3, index=False)
+        self.write_result("2017-01-03", "10", 4)
+        self.write_result("2017-01-03", "10", 2)
+        self.assertEqual(self.next_rid(), 6)
+        for day, rid in ("2017-01-01", 5), ("2017-01-02", 3):
+            path = os.path.join(self.results_dir, day, rid_index_filename)
+            with open(path) as f:
+                self.assertEqual(f.read(), "{}\n".format(rid))
+
+    def test_truncated_index(self):
+        self.write_result("2017-01-01", "10", 7)
+        with open(os.path.join(self.results_dir, "2017-01-01",
+                               rid_index_filename), "a") as f:
+            f.write("\x00\x00")
+        self.assertEqual(self.next_rid(), 8)
@@ -3,10 +3,12 @@ import logging
 import asyncio
 import sys
 import os
+import random
 from time import time, sleep
 
 from artiq.experiment import *
-from artiq.master.scheduler import Scheduler
+from artiq.master.scheduler import Scheduler, RunPool, RunStatus
+from artiq.protocols.sync_struct import Notifier
 
 
 class EmptyExperiment(EnvExperiment):
@@ -72,6 +74,11 @@ class _RIDCounter:
         self._next_rid += 1
         return rid
 
+    def get_many(self, count):
+        rids = range(self._next_rid, self._next_rid + count)
+        self._next_rid += count
+        return rids
+
 
 class SchedulerCase(unittest.TestCase):
     def setUp(self):
@@ -81,9 +88,9 @@ class SchedulerCase(unittest.TestCase):
             self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-    def test_steps(self):
+    def _test_steps(self, worker_pool_size):
         loop = self.loop
-        scheduler = Scheduler(_RIDCounter(0), dict(), None)
+        scheduler = Scheduler(_RIDCounter(0), dict(), None, worker_pool_size)
         expid = _get_expid("EmptyExperiment")
 
         expect = _get_basic_steps(1, expid)
@@ -117,6 +124,12 @@ class SchedulerCase(unittest.TestCase):
         scheduler.notifier.publish = None
         loop.run_until_complete(scheduler.stop())
 
+    def test_steps(self):
+        self._test_steps(0)
+
+    def test_steps_worker_pool(self):
+        self._test_steps(2)
+
     def test_pause(self):
         loop = self.loop
 
@@ -219,5 +232,91 @@ class SchedulerCase(unittest.TestCase):
         loop.run_until_complete(done.wait())
         loop.run_until_complete(scheduler.stop())
 
+    def test_run_selection(self):
+        rng = random.Random(0)
+        pool = RunPool(_RIDCounter(0), dict(), None, Notifier(dict()), None)
+        now = time()
+        statuses = [RunStatus.pending, RunStatus.prepare_done,
+                    RunStatus.running, RunStatus.run_done]
+        for i in range(2000):
+            due_date = rng.choice([None, now - rng.random(),
+                                   now + rng.random()])
+            rid = pool.submit(_get_expid("EmptyExperiment"),
+                              rng.randrange(4), due_date, False, "main")
+            run = pool.runs[rid]
+            status = rng.choice(statuses)
+            if status != RunStatus.pending:
+                run.status = status
+            if i % 7 == 0:
+                rid = rng.choice(list(pool.runs))
+                pool.runs[rid].status = RunStatus.deleting
+                self.loop.run_until_complete(pool.delete(rid))
+
+            if i % 10 == 0:
+                now += 0.1
+                for status in (RunStatus.pending, RunStatus.prepare_done,
+                               RunStatus.run_done):
+                    candidates = [r for r in pool.runs.values()
+                                  if r.status == status]
+                    if status == RunStatus.pending:
+                        top = pool.top_pending_run(now)
+                        key = lambda r: r.priority_key(now)
+                    else:
+                        top = pool.top_run(status)
+                        key = lambda r: r.priority_key()
+                    if candidates:
+                        self.assertIs(top, max(candidates, key=key))
+                    else:
+                        self.assertIsNone(top)
+
+    def test_submit_many(self):
+        notifier = Notifier(dict())
+        mods = []
+        notifier.publish = mods.append
+        pool = RunPool(_RIDCounter(3), dict(), None, notifier, None)
+        expids = [_get_expid("EmptyExperiment") for _ in range(100)]
+        rids = pool.submit_many(expids, 1, None, False, "main")
+        self.assertEqual(rids, list(range(3, 103)))
+        self.assertEqual(len(mods), 1)
+        self.assertEqual(mods[0]["action"], "update")
+        self.assertEqual(set(mods[0]["x"]), set(rids))
+        self.assertEqual(notifier.read[3]["status"], "pending")
+        self.assertEqual(notifier.read[3]["priority"], 1)
+        self.assertIs(pool.top_pending_run(time()), pool.runs[3])
+
+    def test_submit_many_failure(self):
+        class RepoBackend:
+            def __init__(self):
+                self.refs = {"good": 0}
+
+            def request_rev(self, rev):
+                self.refs[rev] += 1
+                return "", ""
+
+            def release_rev(self, rev):
+                self.refs[rev] -= 1
+
+        class ExperimentDB:
+            cur_rev = "good"
+            repo_backend = RepoBackend()
+
+        notifier = Notifier(dict())
+        mods = []
+        notifier.publish = mods.append
+        pool = RunPool(_RIDCounter(3), dict(), None, notifier,
+                       ExperimentDB())
+        good = dict(_get_expid("EmptyExperiment"), repo_rev=None)
+        bad = dict(_get_expid("EmptyExperiment"), repo_rev="bad")
+        with self.assertRaises(KeyError):
+            pool.submit_many([good, bad], 0, None, False, "main")
+        self.assertEqual(pool.runs, dict())
+        self.assertEqual(mods, [])
+        self.assertIsNone(pool.top_pending_run(time()))
+        self.assertEqual(ExperimentDB.repo_backend.refs, {"good": 0})
+
+        rids = pool.submit_many([good], 0, None, False, "main")
+        self.assertEqual(rids, [3])
+        self.assertEqual(ExperimentDB.repo_backend.refs, {"good": 1})
+
     def tearDown(self):
         self.loop.close()
@@ -38,6 +38,62 @@ class PYON(unittest.TestCase):
                     np.testing.assert_equal(result[k], orig[k])
 
 
+class BinaryPYON(unittest.TestCase):
+    def test_encdec(self):
+        self.assertEqual(pyon.decode_binary(pyon.encode_binary(
+            _pyon_test_object)), _pyon_test_object)
+
+    def test_encdec_scalars(self):
+        for x in [None, True, False, 0, -1, 2**63 - 1, -2**63, 2**100,
+                  -3**50, 1.5, float("inf"), 1-2j, "", "ab\n\u00e9",
+                  b"\x00\xff", (), (1, ), [], {}, set()]:
+            with self.subTest(x=x):
+                y = pyon.decode_binary(pyon.encode_binary(x))
+                self.assertEqual(y, x)
+                self.assertIs(type(y), type(x))
+
+    def test_encdec_array(self):
+        orig = [np.arange(12.).reshape(3, 4), np.arange(12)[::3],
+                np.zeros((2, 0)), np.array(5), np.array([1+2j], ">c16"),
+                np.array([True, False])]
+        result = pyon.decode_binary(pyon.encode_binary(orig))
+        for a, b in zip(orig, result):
+            with self.subTest(a=a):
+                self.assertEqual(a.dtype, b.dtype)
+                np.testing.assert_equal(a, b)
+
+    def test_array_in_marshallable_container(self):
+        # marshal would silently turn these into bytes
+        x = {"a": [np.float64(1.5), np.arange(3)], "b": (np.int32(4), )}
+        y = pyon.decode_binary(pyon.encode_binary(x))
+        self.assertIs(type(y["a"][0]), np.float64)
+        self.assertIs(type(y["a"][1]), np.ndarray)
+        self.assertIs(type(y["b"][0]), np.int32)
+
+    def test_writable_buffer(self):
+        data = bytearray(pyon.encode_binary(np.zeros(4)))
+        a = pyon.decode_binary(data)
+        a[1] = 3
+        self.assertEqual(pyon.decode_binary(data)[1], 3)
+        # read-only buffers are copied so that the result is writable
+        a = pyon.decode_binary(bytes(data))
+        self.assertTrue(a.flags.writeable)
+
+    def test_frame(self):
+        frame = pyon.encode_binary_frame([1, "x"])
+        n, = pyon.binary_frame_header.unpack_from(frame)
+        self.assertEqual(n, len(frame) - pyon.binary_frame_header.size)
+        self.assertEqual(
+            pyon.decode_binary(frame[pyon.binary_frame_header.size:]),
+            [1, "x"])
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            pyon.encode_binary([object()])
+        with self.assertRaises(TypeError):
+            pyon.encode_binary(np.array([None]))
+
+
 _json_test_object = {
     "a": "b",
     "x": [1, 2, {}],
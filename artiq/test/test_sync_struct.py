@@ -21,12 +21,19 @@ def write_test_data(test_dict):
     test_dict["list"][:] = [34, 31]
     test_dict["list"].append(42)
     test_dict["list"].insert(1, 1)
+    test_dict["queue"] = []
+    test_dict["queue"].append(1)
+    test_dict["queue"].insert(0, 2)
+    test_dict["queue"].append(3)
+    test_dict["queue"].pop(1)
     test_dict[100] = 0
     test_dict[100] = 1
     test_dict[101] = 1
     test_dict.pop(101)
     test_dict[102] = 1
     del test_dict[102]
+    test_dict.update({103: 1, "nested": {"a": [1]}})
+    test_dict["nested"].update({"b": 2})
     test_dict["array"] = np.zeros(1)
     test_dict["array"][0] = 10
     test_dict["finished"] = True
@@ -35,6 +42,7 @@ def write_test_data(test_dict):
 class SyncStructCase(unittest.TestCase):
     def init_test_dict(self, init):
         self.received_dict = init
+        self.init_received.set()
         return init
 
     def notify(self, mod):
@@ -46,16 +54,21 @@ class SyncStructCase(unittest.TestCase):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-    async def _do_test_recv(self):
+    async def _do_test_recv(self, binary, prefixes=None, **publisher_kwargs):
         self.receiving_done = asyncio.Event()
+        self.init_received = asyncio.Event()
 
         test_dict = sync_struct.Notifier(dict())
-        publisher = sync_struct.Publisher({"test": test_dict})
+        publisher = sync_struct.Publisher({"test": test_dict},
+                                          **publisher_kwargs)
         await publisher.start(test_address, test_port)
 
+        mods = []
         subscriber = sync_struct.Subscriber("test", self.init_test_dict,
-                                            self.notify)
+                                            [mods.append, self.notify],
+                                            binary=binary, prefixes=prefixes)
         await subscriber.connect(test_address, test_port)
+        await self.init_received.wait()
 
         write_test_data(test_dict)
         await self.receiving_done.wait()
@@ -63,10 +76,89 @@ class SyncStructCase(unittest.TestCase):
         await subscriber.close()
         await publisher.stop()
 
-        self.assertEqual(self.received_dict, test_dict.read)
+        expected = test_dict.read
+        if prefixes is not None:
+            expected = sync_struct.filter_struct(expected, prefixes)
+        self.assertEqual(self.received_dict, expected)
+        return mods
 
     def test_recv(self):
-        self.loop.run_until_complete(self._do_test_recv())
+        self.loop.run_until_complete(self._do_test_recv(False))
+
+    def test_recv_binary(self):
+        self.loop.run_until_complete(self._do_test_recv(True))
+
+    def test_recv_coalesced(self):
+        for binary in False, True:
+            mods = self.loop.run_until_complete(self._do_test_recv(
+                binary, coalesce_windows={"test": 0.05}))
+            # test_dict[100] = 0 is collapsed into test_dict[100] = 1
+            setitems = [mod for mod in mods if mod["action"] == "setitem"
+                        and mod["path"] == [] and mod["key"] == 100]
+            self.assertEqual(len(setitems), 1)
+
+    def test_recv_overflow(self):
+        for binary in False, True:
+            mods = self.loop.run_until_complete(self._do_test_recv(
+                binary, max_queue_size=2))
+            self.assertGreater(
+                len([mod for mod in mods if mod["action"] == "init"]), 1)
+
+    def test_recv_filtered(self):
+        prefixes = [["list"], [5, 2], ["nested", "b"], [103], ["finished"]]
+        for binary in False, True:
+            mods = self.loop.run_until_complete(self._do_test_recv(
+                binary, prefixes))
+            self.assertEqual(set(self.received_dict),
+                             {"list", 5, "nested", 103, "finished"})
+            self.assertEqual(set(self.received_dict[5]), {2})
+            self.assertEqual(self.received_dict["nested"], {"b": 2})
+            for mod in mods:
+                if mod["action"] != "init":
+                    self.assertEqual(sync_struct.filter_mod(mod, prefixes),
+                                     mod)
+            self.assertNotIn({"action": "setitem", "path": [], "key": "0",
+                              "value": 0}, mods)
+
+    async def _do_test_reconnect(self):
+        test_dict = sync_struct.Notifier(dict())
+        for i in range(10000):
+            test_dict[i] = [i, str(i)]
+        publisher = sync_struct.Publisher({"test": test_dict})
+        await publisher.start(test_address, test_port)
+
+        # Modify the structure while it is being encoded for new
+        # subscribers.
+        async def mutate():
+            for i in range(200):
+                test_dict[i % 10][0] = test_dict.read[i % 10][0] + 1
+                test_dict["x" + str(i)] = i
+                await asyncio.sleep(0)
+        mutate_task = asyncio.ensure_future(mutate())
+
+        received = []
+        subscribers = []
+        for _ in range(4):
+            subscriber = sync_struct.Subscriber(
+                "test", lambda init: received.append(init) or init)
+            await subscriber.connect(test_address, test_port)
+            subscribers.append(subscriber)
+        await mutate_task
+        test_dict["finished"] = True
+        while (len(received) < len(subscribers)
+                or not all("finished" in r for r in received)):
+            await asyncio.sleep(0.01)
+
+        for subscriber in subscribers:
+            await subscriber.close()
+        await publisher.stop()
+
+        for r in received:
+            self.assertEqual(r, test_dict.read)
+
+    def test_reconnect(self):
+        self.loop.run_until_complete(
+            asyncio.wait_for(self._do_test_reconnect(), 20))
 
     def tearDown(self):
         self.loop.close()
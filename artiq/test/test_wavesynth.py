@@ -2,6 +2,8 @@
 
 import unittest
 
+import numpy as np
+
 from artiq.wavesynth import compute_samples
 
 
@@ -119,6 +121,27 @@ class TestSynthesizer(unittest.TestCase):
     def test_run(self):
         x, y = self.drive()
 
+    def test_vectorized(self):
+        x, y = self.drive()
+        self.dev = compute_samples.Synthesizer(1, self.program,
+                                               vectorized=True)
+        xv, yv = self.drive()
+        self.assertEqual(len(yv), len(y))
+        np.testing.assert_allclose(yv, y, rtol=1e-9, atol=1e-9)
+
+    def test_vectorized_spline(self):
+        # Without phase wrapping, the vectorized model performs the same
+        # additions as the iterative one.
+        c = [1.0, 0.3, -0.01, 0.0007]
+        iterative = compute_samples.Spline()
+        iterative.set_coefficients(c)
+        vectorized = compute_samples.Spline()
+        vectorized.set_coefficients(c)
+        y = [iterative.next() for _ in range(1000)]
+        self.assertEqual(vectorized.next_block(600).tolist() +
+                         vectorized.next_block(400).tolist(), y)
+        self.assertEqual(vectorized.c, iterative.c)
+
     @unittest.skip("manual/visual test")
     def test_plot(self):
         from matplotlib import pyplot as plt
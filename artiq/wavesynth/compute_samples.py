@@ -4,9 +4,29 @@
 from copy import copy
 from math import cos, pi
 
+import numpy as np
+
 from artiq.wavesynth.coefficients import discrete_compensate
 
 
+def _accumulate(c, n, wrap=False):
+    # Runs the accumulator chain c for n steps at once: returns the n values
+    # taken by c[0] and updates c. Each accumulator is the running sum of the
+    # next one, so it is computed with a cumulative sum performing the same
+    # additions in the same order as the iterative model. With wrap, the
+    # accumulators are taken modulo 1 after each cumulative sum instead of
+    # after each addition, which only differs by rounding.
+    if n == 0:
+        return np.zeros(0)
+    values = np.full(n + 1, c[-1])
+    for i in range(len(c) - 2, -1, -1):
+        values = np.cumsum(np.concatenate(([c[i]], values[:-1])))
+        if wrap:
+            values %= 1.0
+        c[i] = float(values[-1])
+    return values[:-1]
+
+
 class Spline:
     def __init__(self):
         self.c = [0.0]
@@ -23,6 +43,9 @@ class Spline:
             self.c[i] += self.c[i + 1]
         return r
 
+    def next_block(self, n):
+        return _accumulate(self.c, n)
+
 
 class SplinePhase:
     def __init__(self):
@@ -47,6 +70,9 @@ class SplinePhase:
             self.c[i] %= 1.0
         return r + self.c0
 
+    def next_block(self, n):
+        return _accumulate(self.c, n, wrap=True) + self.c0
+
 
 class DDS:
     def __init__(self):
@@ -56,6 +82,10 @@ class DDS:
     def next(self):
         return self.amplitude.next()*cos(2*pi*self.phase.next())
 
+    def next_block(self, n):
+        return (self.amplitude.next_block(n)
+                * np.cos(2*pi*self.phase.next_block(n)))
+
 
 class Channel:
     def __init__(self):
@@ -70,6 +100,14 @@ class Channel:
             self.v = v
         return self.v
 
+    def next_block(self, n):
+        v = self.bias.next_block(n) + self.dds.next_block(n)
+        if self.silence:
+            return np.full(n, self.v)
+        if n:
+            self.v = float(v[-1])
+        return v
+
     def set_silence(self, s):
         self.silence = s
 
@@ -79,9 +117,12 @@ class TriggerError(Exception):
 
 
 class Synthesizer:
-    def __init__(self, nchannels, program):
+    def __init__(self, nchannels, program, vectorized=False):
         self.channels = [Channel() for _ in range(nchannels)]
         self.program = program
+        # compute the samples of each line at once with Numpy instead of
+        # one sample at a time
+        self.vectorized = vectorized
         # line_iter is None: "wait for segment selection" state
         # otherwise: iterator on the current position in the frame
         self.line_iter = None
@@ -121,8 +162,11 @@ class Synthesizer:
                 raise NotImplementedError
 
             for channel, rc in zip(self.channels, r):
-                for i in range(line["duration"]):
-                    rc.append(channel.next())
+                if self.vectorized:
+                    rc.extend(channel.next_block(line["duration"]).tolist())
+                else:
+                    for i in range(line["duration"]):
+                        rc.append(channel.next())
 
             try:
                 self.line = line = next(self.line_iter)